@@ -0,0 +1,156 @@
+"""
+Pluggable account selection for redemption.
+Each strategy picks an account from one product's pool and bumps its delivery counters in the
+same atomic update, reading through an index on the counter it orders by. The batch variants
+pick accounts for many keys with one read; record_deliveries then bumps the counters of all
+picked accounts with one bulk write.
+Random picks seek a random point in the (product, random_key) index instead of counting and
+skipping through the pool; every delivery re-draws the account's random_key, so the gaps
+between keys do not favour the same accounts over time.
+"""
+
+import random
+from collections import Counter
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+WEIGHTED_CANDIDATES = 20
+
+SelectionStrategy = Callable[[object, str], Awaitable[Optional[dict]]]
+BatchSelectionStrategy = Callable[[object, str, int], Awaitable[List[dict]]]
+
+
+def _record_delivery(count: int = 1) -> dict:
+    return {"$inc": {"delivery_count": count},
+            "$set": {"last_delivered_at": datetime.utcnow(), "random_key": random.random()}}
+
+
+def _from_random_point(product: str) -> List[dict]:
+    # The second query wraps around past the highest key; accounts without a key sort first there
+    return [{"product": product, "random_key": {"$gte": random.random()}}, {"product": product}]
+
+
+async def _take_first(collection, product: str, sort_field: str) -> Optional[dict]:
+    return await collection.find_one_and_update(
+        {"product": product},
+        _record_delivery(),
+        sort=[(sort_field, 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def uniform_random(collection, product: str) -> Optional[dict]:
+    update = _record_delivery()
+    for query in _from_random_point(product):
+        account = await collection.find_one_and_update(
+            query, update, sort=[("random_key", 1)], return_document=ReturnDocument.AFTER
+        )
+        if account is not None:
+            return account
+    return None
+
+
+async def least_delivered(collection, product: str) -> Optional[dict]:
+    return await _take_first(collection, product, "delivery_count")
+
+
+async def round_robin(collection, product: str) -> Optional[dict]:
+    # Least recently delivered first; never-delivered accounts (null) sort ahead of everyone
+    return await _take_first(collection, product, "last_delivered_at")
+
+
+async def weighted_random(collection, product: str) -> Optional[dict]:
+    # Weight the least-used candidates by 1 / (1 + deliveries); the candidate read is a bounded index scan
+    cursor = collection.find({"product": product}, {"_id": 1, "delivery_count": 1}).sort("delivery_count", 1)
+    candidates = await cursor.limit(WEIGHTED_CANDIDATES).to_list(WEIGHTED_CANDIDATES)
+    if not candidates:
+        return None
+    weights = [1.0 / (1 + candidate.get("delivery_count", 0)) for candidate in candidates]
+    picked = random.choices(candidates, weights=weights)[0]
+    return await collection.find_one_and_update(
+        {"_id": picked["_id"]}, _record_delivery(), return_document=ReturnDocument.AFTER
+    )
+
+
+SELECTION_STRATEGIES: Dict[str, SelectionStrategy] = {
+    "random": uniform_random,
+    "least_delivered": least_delivered,
+    "weighted_random": weighted_random,
+    "round_robin": round_robin,
+}
+
+
+def get_strategy(name: str) -> SelectionStrategy:
+    try:
+        return SELECTION_STRATEGIES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown account selection strategy {name!r}; expected one of {', '.join(SELECTION_STRATEGIES)}"
+        )
+
+
+# Batch selection: up to `count` accounts per call, possibly fewer (and, for weighted_random, repeated)
+
+
+async def uniform_random_many(collection, product: str, count: int) -> List[dict]:
+    # Consecutive accounts from one random point; their keys are re-drawn when the deliveries are recorded
+    after, wrapped = _from_random_point(product)
+    accounts = await collection.find(after).sort("random_key", 1).limit(count).to_list(count)
+    if len(accounts) < count:
+        seen = {account["_id"] for account in accounts}
+        more = await collection.find(wrapped).sort("random_key", 1).limit(count).to_list(count)
+        accounts += [account for account in more if account["_id"] not in seen][:count - len(accounts)]
+    return accounts
+
+
+async def _first_many(collection, product: str, sort_field: str, count: int) -> List[dict]:
+    return await collection.find({"product": product}).sort(sort_field, 1).limit(count).to_list(count)
+
+
+async def least_delivered_many(collection, product: str, count: int) -> List[dict]:
+    return await _first_many(collection, product, "delivery_count", count)
+
+
+async def round_robin_many(collection, product: str, count: int) -> List[dict]:
+    return await _first_many(collection, product, "last_delivered_at", count)
+
+
+async def weighted_random_many(collection, product: str, count: int) -> List[dict]:
+    limit = max(count, WEIGHTED_CANDIDATES)
+    candidates = await collection.find({"product": product}).sort("delivery_count", 1).limit(limit).to_list(limit)
+    if not candidates:
+        return []
+    weights = [1.0 / (1 + candidate.get("delivery_count", 0)) for candidate in candidates]
+    return random.choices(candidates, weights=weights, k=count)
+
+
+async def record_deliveries(collection, accounts: List[dict]):
+    deliveries = Counter(account["_id"] for account in accounts)
+    if deliveries:
+        await collection.bulk_write(
+            [UpdateOne({"_id": _id}, _record_delivery(count)) for _id, count in deliveries.items()], ordered=False
+        )
+
+
+async def undo_delivery(collection, account: dict):
+    # For a pick whose key was lost before it was consumed; last_delivered_at keeps the newer time
+    await collection.update_one({"_id": account["_id"]}, {"$inc": {"delivery_count": -1}})
+
+
+BATCH_SELECTION_STRATEGIES: Dict[str, BatchSelectionStrategy] = {
+    "random": uniform_random_many,
+    "least_delivered": least_delivered_many,
+    "weighted_random": weighted_random_many,
+    "round_robin": round_robin_many,
+}
+
+
+def get_batch_strategy(name: str) -> BatchSelectionStrategy:
+    try:
+        return BATCH_SELECTION_STRATEGIES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown account selection strategy {name!r}; expected one of {', '.join(BATCH_SELECTION_STRATEGIES)}"
+        )
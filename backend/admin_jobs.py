@@ -0,0 +1,404 @@
+"""
+Background jobs for long-running admin operations (imports, bulk deletes, exports).
+Jobs are persisted in Mongo and claimed atomically with a lease, so a restart or a second app
+process picks up where the last one stopped. A fixed number of runner tasks, separate from request
+handling, executes them. Handlers work in batches, report progress (items per second) and keep a
+resumable checkpoint; cancellation is requested through the job document and honoured between batches.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATUSES = {SUCCEEDED, FAILED, CANCELLED}
+
+DUPLICATE_KEY_CODE = 11000
+
+
+class JobContext:
+    def __init__(self, runner: "AdminJobRunner", job: dict):
+        self.runner = runner
+        self.id = job["id"]
+        self.params = job.get("params", {})
+        # Checkpoint saved with progress; a resumed job continues from here
+        self.state = dict(job.get("state") or {})
+        progress = job.get("progress") or {}
+        self.done = progress.get("done", 0)
+        self.total = progress.get("total")
+        self.cancel_requested = False
+        self._resumed_from = self.done
+        self._started = time.monotonic()
+        self._saved_at = 0.0
+
+    def progress_document(self) -> dict:
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        rate = max(0, self.done - self._resumed_from) / elapsed
+        remaining = (self.total - self.done) / rate if self.total is not None and rate > 0 else None
+        return {
+            "done": self.done,
+            "total": self.total,
+            "items_per_second": round(rate, 1),
+            "eta_seconds": round(remaining, 1) if remaining is not None else None,
+        }
+
+    async def report(self, done: int, total: Optional[int] = None, checkpoint: bool = False, **state):
+        """Progress is saved at most every progress_interval; checkpoint=True saves it now, for
+        handlers whose work since the last save would otherwise be repeated on resume."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        self.state.update(state)
+        if checkpoint or time.monotonic() - self._saved_at >= self.runner.progress_interval:
+            await self.save()
+        # Give request handlers a turn between batches
+        await asyncio.sleep(0)
+
+    async def save(self):
+        self._saved_at = time.monotonic()
+        await self.runner.collection.update_one(
+            {"id": self.id}, {"$set": {"progress": self.progress_document(), "state": self.state}}
+        )
+
+
+JobHandler = Callable[[JobContext], Awaitable[Optional[dict]]]
+
+
+class AdminJobRunner:
+    def __init__(self, collection, concurrency: int = 2, poll_interval: float = 2.0,
+                 lease_seconds: float = 60.0, progress_interval: float = 1.0, max_attempts: int = 3):
+        self.collection = collection
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.progress_interval = progress_interval
+        self.max_attempts = max_attempts
+        self.owner = uuid.uuid4().hex
+        self.handlers: Dict[str, JobHandler] = {}
+        # Checks run on submit, so bad params are rejected before a job is queued
+        self.validators: Dict[str, Callable[[dict], object]] = {}
+        # Params dropped once a job finishes (submitted passwords, large payloads)
+        self.transient_params: Set[str] = set()
+        self._running: Dict[str, tuple] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wake = asyncio.Event()
+        self._stopping = False
+
+    def register(self, job_type: str, handler: JobHandler, transient_params: Iterable[str] = (),
+                 validate: Optional[Callable[[dict], object]] = None):
+        self.handlers[job_type] = handler
+        if validate:
+            self.validators[job_type] = validate
+        self.transient_params.update(transient_params)
+
+    async def submit(self, job_type: str, params: dict) -> dict:
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type {job_type!r}; expected one of {', '.join(self.handlers)}")
+        if job_type in self.validators:
+            self.validators[job_type](params)
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "params": params,
+            "status": QUEUED,
+            "attempts": 0,
+            "progress": {"done": 0, "total": None, "items_per_second": 0.0, "eta_seconds": None},
+            "created_at": datetime.utcnow(),
+        }
+        await self.collection.insert_one(job)
+        metrics.inc(f"admin_jobs.{job_type}.submitted")
+        self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = await self.collection.find_one({"id": job_id}, {"_id": 0, "params": 0, "state": 0})
+        if job and job["id"] in self._running:
+            # Fresher than the throttled copy in Mongo when the job runs in this process
+            job["progress"] = self._running[job["id"]][0].progress_document()
+        return job
+
+    async def list(self, limit: int = 50) -> List[dict]:
+        cursor = self.collection.find({}, {"_id": 0, "params": 0, "state": 0, "result": 0}).sort("created_at", -1)
+        return await cursor.limit(limit).to_list(limit)
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        now = datetime.utcnow()
+        job = await self.collection.find_one_and_update(
+            {"id": job_id, "status": QUEUED},
+            {"$set": {"status": CANCELLED, "finished_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            # A running job stops at its next heartbeat, wherever it runs
+            job = await self.collection.find_one_and_update(
+                {"id": job_id, "status": RUNNING},
+                {"$set": {"cancel_requested": True}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is not None and job_id in self._running:
+                self._stop_handler(job_id)
+        return job if job is not None else await self.collection.find_one({"id": job_id})
+
+    async def start(self):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _stop_handler(self, job_id: str):
+        context, task = self._running[job_id]
+        context.cancel_requested = True
+        task.cancel()
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        # Queued jobs, or running jobs whose owner stopped renewing the lease (crashed process)
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED},
+                {"status": RUNNING, "heartbeat_at": {"$lt": now - timedelta(seconds=self.lease_seconds)}},
+            ]},
+            {"$set": {"status": RUNNING, "owner": self.owner, "heartbeat_at": now}, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Claiming admin jobs failed")
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 4)
+            try:
+                job = await self.collection.find_one_and_update(
+                    {"id": job_id, "owner": self.owner},
+                    {"$set": {"heartbeat_at": datetime.utcnow()}},
+                    projection={"cancel_requested": 1},
+                )
+            except Exception:
+                logger.exception("Admin job %s heartbeat failed", job_id)
+                continue
+            if job is None or job.get("cancel_requested"):
+                # Cancelled elsewhere, or the lease was lost to another process
+                self._stop_handler(job_id)
+                return
+
+    async def _finish(self, job_id: str, status: str, **fields):
+        update = {"$set": {"status": status, "finished_at": datetime.utcnow(), **fields}}
+        if self.transient_params:
+            update["$unset"] = {f"params.{name}": "" for name in self.transient_params}
+        await self.collection.update_one({"id": job_id, "owner": self.owner}, update)
+        metrics.inc(f"admin_jobs.{status}")
+
+    async def run_job(self, job: dict):
+        handler = self.handlers.get(job["type"])
+        if handler is None or job["attempts"] > self.max_attempts:
+            reason = "no handler registered" if handler is None else f"gave up after {job['attempts'] - 1} attempts"
+            await self._finish(job["id"], FAILED, error=reason)
+            return
+        if job.get("cancel_requested"):
+            await self._finish(job["id"], CANCELLED)
+            return
+        context = JobContext(self, job)
+        if not job.get("started_at"):
+            await self.collection.update_one({"id": job["id"]}, {"$set": {"started_at": datetime.utcnow()}})
+        task = asyncio.create_task(handler(context))
+        self._running[job["id"]] = (context, task)
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if self._stopping or not context.cancel_requested:
+                # Shutting down: hand the job back with its checkpoint so it resumes promptly
+                await self.collection.update_one(
+                    {"id": job["id"], "owner": self.owner},
+                    {"$set": {"status": QUEUED, "progress": context.progress_document(), "state": context.state},
+                     "$inc": {"attempts": -1}},
+                )
+                raise
+            await self._finish(job["id"], CANCELLED, progress=context.progress_document())
+        except Exception as exc:
+            logger.exception("Admin job %s (%s) failed", job["id"], job["type"])
+            await self._finish(job["id"], FAILED, error=str(exc), progress=context.progress_document())
+        else:
+            await self._finish(job["id"], SUCCEEDED, result=result or {}, progress=context.progress_document())
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job["id"], None)
+
+
+# Handlers
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+
+async def _insert_ignoring_duplicates(collection, documents: List[dict]) -> int:
+    try:
+        await collection.insert_many(documents, ordered=False)
+        return len(documents)
+    except BulkWriteError as exc:
+        if any(error.get("code") != DUPLICATE_KEY_CODE for error in exc.details.get("writeErrors", [])):
+            raise
+        return exc.details.get("nInserted", 0)
+
+
+def import_keys_handler(collection, default_product: str, batch_size: int = 500) -> JobHandler:
+    """params: {"keys": [str], "product": str?, "expires_at": iso datetime?}"""
+
+    async def run(context: JobContext) -> dict:
+        keys = context.params["keys"]
+        product = context.params.get("product") or default_product
+        expires_at = context.params.get("expires_at")
+        expires_at = datetime.fromisoformat(expires_at) if expires_at else None
+        inserted = context.state.get("inserted", 0)
+        for start, chunk in _chunks(keys, batch_size):
+            if start < context.state.get("position", 0):
+                continue
+            now = datetime.utcnow()
+            inserted += await _insert_ignoring_duplicates(collection, [
+                {"id": str(uuid.uuid4()), "key_value": key, "product": product, "created_at": now, "expires_at": expires_at}
+                for key in chunk
+            ])
+            await context.report(start + len(chunk), len(keys), checkpoint=True,
+                                 position=start + len(chunk), inserted=inserted)
+        return {"inserted": inserted, "duplicates": len(keys) - inserted}
+
+    return run
+
+
+def import_accounts_handler(collection, cipher, default_product: str, batch_size: int = 500) -> JobHandler:
+    """params: {"accounts": [{"username", "password"}], "product": str?}"""
+
+    async def run(context: JobContext) -> dict:
+        accounts = context.params["accounts"]
+        product = context.params.get("product") or default_product
+        inserted = context.state.get("inserted", 0)
+        for start, chunk in _chunks(accounts, batch_size):
+            if start < context.state.get("position", 0):
+                continue
+            # Encryption is CPU-bound, so it stays off the event loop
+            passwords = await asyncio.to_thread(cipher.encrypt_many_sync, [account["password"] for account in chunk])
+            now = datetime.utcnow()
+            # Ids derive from the job and row, so a batch re-run after a crash hits the unique id index
+            inserted += await _insert_ignoring_duplicates(collection, [
+                {"id": str(uuid.uuid5(uuid.UUID(context.id), str(start + offset))), "username": account["username"],
+                 "password": password, "product": product, "delivery_count": 0, "last_delivered_at": None,
+                 "random_key": random.random(), "created_at": now}
+                for offset, (account, password) in enumerate(zip(chunk, passwords))
+            ])
+            await context.report(start + len(chunk), len(accounts), checkpoint=True,
+                                 position=start + len(chunk), inserted=inserted)
+        return {"inserted": inserted, "duplicates": len(accounts) - inserted}
+
+    return run
+
+
+def bulk_delete_query(params: dict) -> dict:
+    """params: {"product": str?, "created_before": iso datetime?, "all": bool?}. At least one filter,
+    or an explicit "all": true, is required so an empty request cannot wipe the collection."""
+    query = {}
+    if params.get("product"):
+        query["product"] = params["product"]
+    if params.get("created_before"):
+        try:
+            query["created_at"] = {"$lt": datetime.fromisoformat(params["created_before"])}
+        except (TypeError, ValueError):
+            raise ValueError(f"created_before must be an ISO datetime, got {params['created_before']!r}")
+    if not query and params.get("all") is not True:
+        raise ValueError('Bulk delete needs a product or created_before filter, or "all": true')
+    return query
+
+
+def bulk_delete_handler(collection, batch_size: int = 1000) -> JobHandler:
+    """params: see bulk_delete_query; register it as the job's validator.
+    Pass an unguarded collection: the count and the batched deletes scan outside the per-call deadlines."""
+
+    async def run(context: JobContext) -> dict:
+        query = bulk_delete_query(context.params)
+        total = context.total if context.total is not None else await collection.count_documents(query)
+        deleted = context.done
+        while True:
+            batch = await collection.find(query, {"_id": 1}).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            result = await collection.delete_many({"_id": {"$in": [document["_id"] for document in batch]}})
+            deleted += result.deleted_count
+            await context.report(deleted, max(total, deleted))
+        return {"deleted": deleted}
+
+    return run
+
+
+def _write_lines(output, documents: List[dict], redact: Optional[Callable[[dict], dict]]):
+    output.write("".join(
+        json.dumps(redact(document) if redact else document, default=str, ensure_ascii=False) + "\n"
+        for document in documents
+    ))
+
+
+def export_handler(collection, export_dir: Path, redact: Optional[Callable[[dict], dict]] = None,
+                   batch_size: int = 1000) -> JobHandler:
+    """params: {"product": str?}; writes one JSON document per line to export_dir/<job id>.jsonl.
+    Pass an unguarded collection: the export cursor outlives the per-call read deadline."""
+
+    async def run(context: JobContext) -> dict:
+        query = {"product": context.params["product"]} if context.params.get("product") else {}
+        total = await collection.count_documents(query)
+        export_dir.mkdir(parents=True, exist_ok=True)
+        path = export_dir / f"{context.id}.jsonl"
+        written = 0
+        batch = []
+        # Exports restart from scratch when resumed; encoding and file I/O run off the event loop
+        with open(path, "w", encoding="utf-8") as output:
+            async for document in collection.find(query, {"_id": 0}).sort("created_at", 1):
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    await asyncio.to_thread(_write_lines, output, batch, redact)
+                    written += len(batch)
+                    batch = []
+                    await context.report(written, max(total, written))
+            await asyncio.to_thread(_write_lines, output, batch, redact)
+            written += len(batch)
+        await context.report(written, max(total, written))
+        return {"count": written, "file": os.path.basename(path)}
+
+    return run
@@ -0,0 +1,87 @@
+"""
+Admission control for bursty endpoints.
+A fixed number of requests run at once; the rest wait in a bounded FIFO queue for at most
+max_wait seconds. When the queue is full or the wait runs out the request is shed with
+Overloaded, which the app turns into 503 with Retry-After.
+"""
+
+import asyncio
+import collections
+import time
+from typing import Deque
+
+from metrics import metrics
+
+
+class Overloaded(Exception):
+    def __init__(self, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float, retry_after: int = 1):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = collections.deque()
+
+    def _publish(self):
+        metrics.set_gauge(f"admission.{self.name}.active", self.active)
+        metrics.set_gauge(f"admission.{self.name}.queue_depth", len(self.waiters))
+
+    def _shed(self, reason: str):
+        metrics.inc(f"admission.{self.name}.shed.{reason}")
+        raise Overloaded("Sistem şu anda yoğun, lütfen biraz sonra tekrar deneyin.", self.retry_after)
+
+    async def acquire(self):
+        started = time.monotonic()
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self._publish()
+            metrics.observe(f"admission.{self.name}.wait_ms", 0.0)
+            return
+        if len(self.waiters) >= self.queue_size:
+            self._shed("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            # A slot handed over right at the deadline is kept rather than wasted
+            if not waiter.done():
+                self._forget(waiter)
+                self._shed("timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._forget(waiter)
+            raise
+        finally:
+            self._publish()
+        metrics.observe(f"admission.{self.name}.wait_ms", (time.monotonic() - started) * 1000)
+
+    def _forget(self, waiter: asyncio.Future):
+        waiter.cancel()
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter so newcomers cannot jump the queue
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
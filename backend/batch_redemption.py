@@ -0,0 +1,164 @@
+"""
+Multi-key redemption in one request.
+All keys are claimed with one update_many under a fresh claim token, accounts are picked with one
+batched selection per product, and the claimed keys are consumed with one delete_many, so the
+number of database round trips does not grow with the batch size. In all_or_nothing mode any
+failing key releases every claim and nothing is delivered; best_effort delivers what it can.
+Claims older than CLAIM_TTL_SECONDS are treated as abandoned by a crashed request.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from account_selection import BatchSelectionStrategy, record_deliveries
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ALL_OR_NOTHING = "all_or_nothing"
+BEST_EFFORT = "best_effort"
+
+DELIVERED = "delivered"
+INVALID = "invalid"
+EXPIRED = "expired"
+NO_ACCOUNT = "no_account"
+DUPLICATE = "duplicate"
+ABORTED = "aborted"
+
+CLAIM_TTL_SECONDS = 60
+
+
+def unclaimed(now: datetime) -> dict:
+    return {"$or": [{"claim": None}, {"claimed_at": {"$lt": now - timedelta(seconds=CLAIM_TTL_SECONDS)}}]}
+
+
+def not_expired(now: datetime) -> dict:
+    return {"$or": [{"expires_at": None}, {"expires_at": {"$gt": now}}]}
+
+
+def split_duplicates(keys: List[str]) -> Tuple[List[str], Set[int]]:
+    # The first occurrence of a key is redeemed; later positions report it as a duplicate
+    seen = set()
+    unique, duplicates = [], set()
+    for index, key in enumerate(keys):
+        if key in seen:
+            duplicates.add(index)
+        else:
+            seen.add(key)
+            unique.append(key)
+    return unique, duplicates
+
+
+def assign_accounts(keys: List[dict], pools: Dict[str, List[dict]], default_product: str) -> Dict[str, dict]:
+    # Accounts are shared, so a pool smaller than the batch is cycled through
+    assignment = {}
+    taken = defaultdict(int)
+    for key in keys:
+        product = key.get("product", default_product)
+        pool = pools.get(product)
+        if not pool:
+            continue
+        assignment[key["key_value"]] = pool[taken[product] % len(pool)]
+        taken[product] += 1
+    return assignment
+
+
+async def _release(keys_collection, token: str, key_values: List[str], suppress_errors: bool = False):
+    try:
+        await keys_collection.update_many(
+            {"claim": token, "key_value": {"$in": key_values}}, {"$unset": {"claim": "", "claimed_at": ""}}
+        )
+    except Exception:
+        if not suppress_errors:
+            raise
+        # Claims lapse after CLAIM_TTL_SECONDS anyway
+        logger.warning("Could not release %d claimed keys", len(key_values), exc_info=True)
+
+
+async def _lost_keys(keys_collection, key_values: List[str], deleted_count: int) -> Set[str]:
+    # A claim that outlived CLAIM_TTL_SECONDS may have been taken over by another request, which
+    # then owns the key. Keys still stored were not consumed here; if they do not account for the
+    # whole shortfall, the consumed keys cannot be told apart and none of them is delivered.
+    remaining = await keys_collection.find({"key_value": {"$in": key_values}}, {"key_value": 1}).to_list(len(key_values))
+    lost = {key["key_value"] for key in remaining}
+    if deleted_count + len(lost) < len(key_values):
+        logger.error("Batch redemption lost track of %d consumed keys; withholding them",
+                     len(key_values) - deleted_count - len(lost))
+        return set(key_values)
+    return lost
+
+
+async def redeem_batch(keys_collection, accounts_collection, keys: List[str], mode: str,
+                       select_many: BatchSelectionStrategy, default_product: str,
+                       prepare: Optional[Callable[[Dict[str, dict]], Awaitable[None]]] = None) -> List[dict]:
+    """Returns one {"key", "outcome", "key_document", "account"} entry per input key, in input order.
+    `prepare` gets the key -> account assignment before any key is consumed; if it raises, every
+    claim is released and the error propagates."""
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    unique, duplicates = split_duplicates(keys)
+
+    await keys_collection.update_many(
+        {"key_value": {"$in": unique}, "$and": [unclaimed(now), not_expired(now)]},
+        {"$set": {"claim": token, "claimed_at": now}},
+    )
+    claimed = await keys_collection.find({"claim": token}).to_list(len(unique))
+    claimed_by_value = {key["key_value"]: key for key in claimed}
+
+    failures: Dict[str, str] = {}
+    missing = [key for key in unique if key not in claimed_by_value]
+    if missing:
+        found = await keys_collection.find({"key_value": {"$in": missing}}, {"key_value": 1, "expires_at": 1}).to_list(len(missing))
+        expired = {key["key_value"] for key in found if key.get("expires_at") is not None and key["expires_at"] <= now}
+        # Keys claimed by a concurrent request read as invalid, like a key that was just used
+        failures.update({key: EXPIRED if key in expired else INVALID for key in missing})
+
+    try:
+        by_product = defaultdict(list)
+        for key in claimed:
+            by_product[key.get("product", default_product)].append(key)
+        products = list(by_product)
+        selected = await asyncio.gather(*(select_many(accounts_collection, product, len(by_product[product])) for product in products))
+        assignment = assign_accounts(claimed, dict(zip(products, selected)), default_product)
+        failures.update({key["key_value"]: NO_ACCOUNT for key in claimed if key["key_value"] not in assignment})
+
+        if mode == ALL_OR_NOTHING and (failures or duplicates):
+            assignment = {}
+        if assignment and prepare is not None:
+            await prepare(assignment)
+    except Exception:
+        await _release(keys_collection, token, [key["key_value"] for key in claimed], suppress_errors=True)
+        raise
+    release = [key["key_value"] for key in claimed if key["key_value"] not in assignment]
+    if release:
+        await _release(keys_collection, token, release)
+    if assignment:
+        result = await keys_collection.delete_many({"claim": token, "key_value": {"$in": list(assignment)}})
+        if result.deleted_count < len(assignment):
+            lost = await _lost_keys(keys_collection, list(assignment), result.deleted_count)
+            logger.warning("Batch redemption consumed %d of %d claimed keys", result.deleted_count, len(assignment))
+            metrics.inc("redeem.batch_lost_race", len(lost))
+            failures.update({key: INVALID for key in lost})
+            assignment = {key: account for key, account in assignment.items() if key not in lost}
+        if assignment:
+            await record_deliveries(accounts_collection, list(assignment.values()))
+
+    results = []
+    for index, key in enumerate(keys):
+        if index in duplicates:
+            outcome = DUPLICATE
+        elif key in assignment:
+            outcome = DELIVERED
+        else:
+            outcome = failures.get(key, ABORTED)
+        results.append({
+            "key": key,
+            "outcome": outcome,
+            "key_document": claimed_by_value.get(key) if outcome == DELIVERED else None,
+            "account": assignment.get(key) if outcome == DELIVERED else None,
+        })
+    return results
@@ -0,0 +1,86 @@
+"""
+Write-coalescing micro-batcher for MongoDB inserts.
+Inserts arriving within a short linger window are sent as one unordered insert_many,
+while every caller still gets its own result or its own error.
+"""
+
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_CODE = 11000
+
+
+class InsertBatcher:
+    def __init__(self, collection, name: str, max_batch_size: int = 100, linger_ms: float = 5.0):
+        self.collection = collection
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.linger = max(0.0, linger_ms) / 1000.0
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes = set()
+
+    async def insert(self, document: dict):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((document, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._schedule_flush)
+        return await future
+
+    def _schedule_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        documents = [document for document, _ in batch]
+        metrics.inc(f"insert_batcher.{self.name}.batches")
+        metrics.inc(f"insert_batcher.{self.name}.documents", len(batch))
+        metrics.observe(f"insert_batcher.{self.name}.batch_size", len(batch))
+        metrics.observe(f"insert_batcher.{self.name}.batch_fill", len(batch) / self.max_batch_size)
+
+        errors = {}
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as exc:
+            for error in exc.details.get("writeErrors", []):
+                errors[error["index"]] = error
+        except Exception as exc:
+            logger.exception("Batched insert into %s failed", self.name)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for index, (document, future) in enumerate(batch):
+            if future.done():
+                continue
+            error = errors.get(index)
+            if error is None:
+                future.set_result(document.get("_id"))
+            elif error.get("code") == DUPLICATE_KEY_CODE:
+                metrics.inc(f"insert_batcher.{self.name}.duplicates")
+                future.set_exception(DuplicateKeyError(error.get("errmsg", "duplicate key"), DUPLICATE_KEY_CODE, error))
+            else:
+                future.set_exception(OperationFailure(error.get("errmsg", "write error"), error.get("code"), error))
+
+    async def drain(self):
+        self._schedule_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
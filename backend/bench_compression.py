@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Payload encoding benchmark for admin list responses.
+Reports bytes on the wire and encode cost for JSON, MessagePack and each available compressor.
+"""
+
+import json
+import time
+import uuid
+from datetime import datetime
+
+import typer
+
+from compression import available_encoders, compress, msgpack
+
+
+def build_accounts(count: int) -> list:
+    now = datetime.utcnow().isoformat()
+    return [
+        {"id": str(uuid.uuid4()), "username": f"steamuser{i}", "password": f"pass-{uuid.uuid4().hex[:12]}", "created_at": now}
+        for i in range(count)
+    ]
+
+
+def timed(func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main(sizes: str = "10,100,1000,10000", level: int = 6, repeat: int = 5):
+    print(f"{'items':>7} {'format':<16} {'bytes':>10} {'ratio':>7} {'encode ms':>10}")
+    for count in [int(size) for size in sizes.split(",")]:
+        payload = build_accounts(count)
+        raw_json, json_ms = timed(lambda: json.dumps(payload).encode(), repeat)
+        rows = [("json", raw_json, json_ms)]
+        if msgpack is not None:
+            packed, pack_ms = timed(lambda: msgpack.packb(payload), repeat)
+            rows.append(("msgpack", packed, pack_ms))
+        for encoding in available_encoders():
+            for base_name, base, base_ms in list(rows[:2]):
+                body, ms = timed(lambda: compress(base, encoding, level), repeat)
+                rows.append((f"{base_name}+{encoding}", body, base_ms + ms))
+        for name, body, ms in rows:
+            print(f"{count:>7} {name:<16} {len(body):>10} {len(body) / len(raw_json):>7.2f} {ms:>10.3f}")
+        print()
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Per-operation overhead of shared state.
+Compares a plain dict, SharedState in process-local mode, and SharedState against a shared
+state service in a separate process, issuing operations one at a time and `concurrency` at once.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import typer
+
+from shared_state import SharedState, SharedStateClient
+
+
+async def wait_for_socket(path: str, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"shared state service did not create {path}")
+        await asyncio.sleep(0.02)
+
+
+async def timed(operation, operations: int, concurrency: int) -> float:
+    async def worker(count: int):
+        for i in range(count):
+            await operation(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(operations // concurrency) for _ in range(concurrency)))
+    return (time.perf_counter() - start) / (operations // concurrency * concurrency) * 1_000_000
+
+
+def state_operations(state: SharedState):
+    async def incr(i):
+        await state.incr("bench.counter")
+
+    async def take(i):
+        await state.take("bench.bucket", 1e9, 1e9)
+
+    async def cache(i):
+        if i % 10 == 0:
+            await state.cache_set(f"bench:{i % 100}", {"value": i}, 60)
+        else:
+            await state.cache_get(f"bench:{i % 100}")
+
+    return {"incr": incr, "take": take, "cache 90% get": cache}
+
+
+def dict_operations():
+    counters, cache = {}, {}
+
+    async def incr(i):
+        counters["bench.counter"] = counters.get("bench.counter", 0) + 1
+
+    async def cache_ops(i):
+        if i % 10 == 0:
+            cache[f"bench:{i % 100}"] = (time.monotonic() + 60, {"value": i})
+        else:
+            cache.get(f"bench:{i % 100}")
+
+    return {"incr": incr, "cache 90% get": cache_ops}
+
+
+async def run(operations: int, concurrency: int):
+    socket_path = os.path.join(tempfile.mkdtemp(), "state.sock")
+    service = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared_state.py"),
+         "--socket", socket_path],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        await wait_for_socket(socket_path)
+        shared = SharedState(SharedStateClient(socket_path))
+        modes = [
+            ("dict", dict_operations()),
+            ("local", state_operations(SharedState())),
+            ("shared", state_operations(shared)),
+        ]
+        print(f"{'mode':<8} {'operation':<16} {'us/op serial':>13} {f'us/op x{concurrency}':>13}")
+        for mode, table in modes:
+            for name, operation in table.items():
+                serial = await timed(operation, operations, 1)
+                concurrent = await timed(operation, operations, concurrency)
+                print(f"{mode:<8} {name:<16} {serial:>13.2f} {concurrent:>13.2f}")
+        await shared.close()
+    finally:
+        service.terminate()
+        service.wait()
+
+
+def main(operations: int = 20000, concurrency: int = 64):
+    asyncio.run(run(operations, concurrency))
+
+
+if __name__ == "__main__":
+    typer.run(main)
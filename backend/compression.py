@@ -0,0 +1,223 @@
+"""
+Content negotiation for large API payloads.
+CompressionMiddleware picks gzip, brotli or zstd from Accept-Encoding above a size threshold,
+and MsgPackRoute re-encodes JSON responses as MessagePack for clients sending
+Accept: application/msgpack. Brotli, zstandard and msgpack are optional.
+"""
+
+import json
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Streamed responses that must reach the client chunk by chunk are never compressed.
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream",)
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encoders() -> Dict[str, Callable[[int], object]]:
+    # Ordered by preference when the client weights them equally.
+    encoders = {}
+    if brotli is not None:
+        encoders["br"] = _BrotliEncoder
+    if zstandard is not None:
+        encoders["zstd"] = _ZstdEncoder
+    encoders["gzip"] = _GzipEncoder
+    return encoders
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    encoder = available_encoders()[encoding](level)
+    return encoder.compress(data) + encoder.flush()
+
+
+def parse_quality_values(header: str) -> Dict[str, float]:
+    # Accept and Accept-Encoding share the "name;param=value;q=weight, ..." syntax
+    weights = {}
+    for part in header.split(","):
+        name, *params = part.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        weights[name] = quality
+    return weights
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    return parse_quality_values(header)
+
+
+def choose_encoding(header: str, encoders: List[str]) -> Optional[str]:
+    weights = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for name in encoders:
+        quality = weights.get(name, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, level: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), list(self.encoders))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "")
+            if ("content-encoding" in headers or media_type.startswith(UNCOMPRESSED_MEDIA_TYPES)
+                    or "no-transform" in headers.get("cache-control", "")):
+                self.passthrough = True
+                await self.downstream(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                await self.downstream(self.start_message)
+                await self.downstream(message)
+                return
+            self.encoder = self.middleware.encoders[self.encoding](self.middleware.level)
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+                await self.downstream(self.start_message)
+                await self.downstream({"type": "http.response.body", "body": self.encoder.compress(body), "more_body": True})
+                return
+            payload = self.encoder.compress(body) + self.encoder.flush()
+            headers["Content-Length"] = str(len(payload))
+            await self.downstream(self.start_message)
+            await self.downstream({"type": "http.response.body", "body": payload})
+            return
+
+        payload = self.encoder.compress(body)
+        if not more_body:
+            payload += self.encoder.flush()
+        await self.downstream({"type": "http.response.body", "body": payload, "more_body": more_body})
+
+
+def wants_msgpack(request: Request) -> bool:
+    # Only an explicit application/msgpack counts, so browsers sending */* keep getting JSON
+    if msgpack is None:
+        return False
+    weights = parse_quality_values(request.headers.get("accept", ""))
+    msgpack_quality = weights.get(MSGPACK_MEDIA_TYPE, 0.0)
+    json_quality = weights.get("application/json", weights.get("application/*", weights.get("*/*", 0.0)))
+    return msgpack_quality > 0 and msgpack_quality >= json_quality
+
+
+class MsgPackRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def negotiated_handler(request: Request) -> Response:
+            response = await handler(request)
+            if response.media_type != "application/json" or not hasattr(response, "body"):
+                return response
+            # JSON and MessagePack share the URL, so caches must key on Accept
+            response.headers.add_vary_header("Accept")
+            if not wants_msgpack(request):
+                return response
+            headers = {k: v for k, v in response.headers.items() if k.lower() not in ("content-length", "content-type")}
+            return Response(
+                content=msgpack.packb(json.loads(response.body)),
+                status_code=response.status_code,
+                headers=headers,
+                media_type=MSGPACK_MEDIA_TYPE,
+                background=response.background,
+            )
+
+        return negotiated_handler
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+At-rest encryption of Steam account passwords.
+Passwords are Fernet-encrypted with ACCOUNT_ENCRYPTION_KEY and stored with an "enc:v1:" prefix.
+Crypto runs on a small thread pool; concurrent requests are coalesced into one pool hop so
+handlers never do CPU-bound work on the event loop. Without a key, passwords stay plaintext.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+ENCRYPTED_PREFIX = "enc:v1:"
+MASKED_PASSWORD = "********"
+
+
+def mask_password(password: str) -> str:
+    return MASKED_PASSWORD if password else password
+
+
+def is_encrypted(value: str) -> bool:
+    return isinstance(value, str) and value.startswith(ENCRYPTED_PREFIX)
+
+
+class CredentialCipher:
+    def __init__(self, key: Optional[str], workers: int = 2):
+        self.key = key
+        self.workers = workers
+        self._fernet = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: List[tuple] = []
+        self._flush_scheduled = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.key)
+
+    def _cipher(self):
+        if self._fernet is None:
+            # Imported on first use so startup does not pay for loading OpenSSL bindings
+            from cryptography.fernet import Fernet
+            self._fernet = Fernet(self.key.encode())
+        return self._fernet
+
+    def encrypt_many_sync(self, passwords: List[str]) -> List[str]:
+        if not self.enabled:
+            return list(passwords)
+        cipher = self._cipher()
+        return [
+            password if is_encrypted(password) else ENCRYPTED_PREFIX + cipher.encrypt(password.encode()).decode()
+            for password in passwords
+        ]
+
+    def decrypt_sync(self, value: str) -> str:
+        if not is_encrypted(value):
+            return value
+        if not self.enabled:
+            raise RuntimeError("ACCOUNT_ENCRYPTION_KEY is required to decrypt stored passwords")
+        return self._cipher().decrypt(value[len(ENCRYPTED_PREFIX):].encode()).decode()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="credentials")
+        return self._executor
+
+    async def encrypt(self, password: str) -> str:
+        if not self.enabled:
+            return password
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((password, future))
+        if not self._flush_scheduled:
+            # Everything queued during this loop iteration is encrypted in one pool call
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self):
+        self._flush_scheduled = False
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        loop = asyncio.get_running_loop()
+        work = loop.run_in_executor(self._pool(), self.encrypt_many_sync, [password for password, _ in batch])
+
+        def deliver(done: asyncio.Future):
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if done.exception() is not None:
+                    future.set_exception(done.exception())
+                else:
+                    future.set_result(done.result()[index])
+
+        work.add_done_callback(deliver)
+
+    async def decrypt(self, value: str) -> str:
+        if not is_encrypted(value):
+            return value
+        return await asyncio.get_running_loop().run_in_executor(self._pool(), self.decrypt_sync, value)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def cipher_from_env() -> CredentialCipher:
+    cipher = CredentialCipher(
+        os.environ.get('ACCOUNT_ENCRYPTION_KEY'),
+        workers=int(os.environ.get('CREDENTIAL_CRYPTO_WORKERS', '2')),
+    )
+    if not cipher.enabled:
+        logger.warning("ACCOUNT_ENCRYPTION_KEY is not set; account passwords are stored in plaintext")
+    return cipher
+
+
+cli = typer.Typer(help="Manage account password encryption.")
+
+
+@cli.command("generate-key")
+def generate_key():
+    from cryptography.fernet import Fernet
+    typer.echo(Fernet.generate_key().decode())
+
+
+@cli.command("encrypt-existing")
+def encrypt_existing(batch_size: int = typer.Option(500, min=1)):
+    """Encrypt accounts that were stored before encryption was enabled."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import UpdateOne
+
+    load_dotenv(Path(__file__).parent / '.env')
+    cipher = cipher_from_env()
+    if not cipher.enabled:
+        raise typer.BadParameter("set ACCOUNT_ENCRYPTION_KEY first")
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        accounts = client[os.environ['DB_NAME']].steam_accounts
+        query = {"password": {"$not": {"$regex": f"^{ENCRYPTED_PREFIX}"}}}
+        total = 0
+        while True:
+            batch = await accounts.find(query, {"_id": 1, "password": 1}).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            encrypted = await asyncio.to_thread(cipher.encrypt_many_sync, [account["password"] for account in batch])
+            await accounts.bulk_write([
+                UpdateOne({"_id": account["_id"], "password": account["password"]}, {"$set": {"password": value}})
+                for account, value in zip(batch, encrypted)
+            ], ordered=False)
+            total += len(batch)
+            typer.echo(f"encrypted {total:,} accounts")
+        client.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,186 @@
+"""
+Post-delivery side effects (webhooks, customer notifications).
+Jobs are persisted in Mongo before they are queued, so a restart only delays them.
+A bounded pool of asyncio workers runs them with exponential backoff between attempts.
+A running job is leased to its process for lease_seconds (the handler is cut off at the lease),
+so with several workers a restarting process never re-runs jobs another process still holds;
+only jobs whose lease has expired (a crashed process) are picked up again.
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+JobHandler = Callable[[dict], Awaitable[None]]
+
+
+class DeliveryJobQueue:
+    def __init__(self, collection, workers: int = 4, queue_size: int = 1000, max_attempts: int = 5,
+                 base_backoff: float = 1.0, max_backoff: float = 300.0, poll_interval: float = 5.0,
+                 lease_seconds: float = 120.0):
+        self.collection = collection
+        self.worker_count = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self.handlers: Dict[str, JobHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._queued = set()
+
+    def register(self, job_type: str, handler: JobHandler):
+        self.handlers[job_type] = handler
+
+    async def enqueue(self, job_type: str, payload: dict) -> str:
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow(),
+            "created_at": datetime.utcnow(),
+        }
+        await self.collection.insert_one(job)
+        metrics.inc("delivery_jobs.enqueued")
+        # A full queue is not an error: the job is persisted and the poller picks it up later
+        self._offer(job)
+        return job["id"]
+
+    def _offer(self, job: dict):
+        if job["id"] in self._queued:
+            return
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.inc("delivery_jobs.deferred")
+            return
+        self._queued.add(job["id"])
+        metrics.set_gauge("delivery_jobs.queue_depth", self.queue.qsize())
+
+    def _runnable(self, now: datetime) -> dict:
+        # Pending jobs, or running jobs whose process died without finishing them
+        return {"$or": [{"status": PENDING}, {"status": RUNNING, "lease_expires_at": {"$lt": now}}]}
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        self._tasks.append(asyncio.create_task(self._poll()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobs interrupted by the shutdown are handed back without waiting for their lease to expire
+        await self.collection.update_many(
+            {"status": RUNNING, "owner": self.owner},
+            {"$set": {"status": PENDING, "next_attempt_at": datetime.utcnow()}, "$inc": {"attempts": -1}},
+        )
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.requeue_due()
+            except Exception:
+                logger.exception("Polling delivery jobs failed")
+            await asyncio.sleep(self.poll_interval)
+
+    async def requeue_due(self):
+        free = self.queue.maxsize - self.queue.qsize() if self.queue.maxsize else 100
+        if free <= 0:
+            return
+        now = datetime.utcnow()
+        cursor = self.collection.find(
+            {"$or": [
+                {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": RUNNING, "lease_expires_at": {"$lt": now}},
+            ]}
+        ).sort("next_attempt_at", 1).limit(free)
+        for job in await cursor.to_list(free):
+            self._offer(job)
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            self._queued.discard(job["id"])
+            metrics.set_gauge("delivery_jobs.queue_depth", self.queue.qsize())
+            try:
+                await self.run_job(job)
+            except Exception:
+                logger.exception("Delivery job %s crashed", job["id"])
+            finally:
+                self.queue.task_done()
+
+    async def run_job(self, job: dict):
+        # Claim the job under a lease so no other worker or process runs it at the same time
+        now = datetime.utcnow()
+        claimed = await self.collection.find_one_and_update(
+            {"id": job["id"], **self._runnable(now)},
+            {"$set": {"status": RUNNING, "owner": self.owner,
+                      "lease_expires_at": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+        )
+        if claimed is None:
+            return
+        attempts = claimed["attempts"] + 1
+        handler = self.handlers.get(claimed["type"])
+        # Updates only apply while this process still holds the job
+        owned = {"id": claimed["id"], "owner": self.owner}
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job type {claimed['type']}")
+            # Past the lease another process may take the job over, so the handler must not outlive it
+            await asyncio.wait_for(handler(claimed["payload"]), self.lease_seconds)
+        except Exception as exc:
+            if attempts >= self.max_attempts:
+                metrics.inc("delivery_jobs.failed")
+                logger.error("Delivery job %s failed permanently after %d attempts: %s", claimed["id"], attempts, exc)
+                await self.collection.update_one(
+                    owned, {"$set": {"status": FAILED, "last_error": str(exc) or type(exc).__name__}}
+                )
+                return
+            delay = self.backoff(attempts)
+            metrics.inc("delivery_jobs.retried")
+            logger.warning("Delivery job %s attempt %d failed, retrying in %.1fs: %s", claimed["id"], attempts, delay, exc)
+            await self.collection.update_one(
+                owned,
+                {"$set": {
+                    "status": PENDING,
+                    "last_error": str(exc) or type(exc).__name__,
+                    "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay),
+                }},
+            )
+            return
+        metrics.inc("delivery_jobs.succeeded")
+        await self.collection.update_one(
+            owned, {"$set": {"status": DONE, "completed_at": datetime.utcnow()}}
+        )
+
+
+def webhook_handler(url: Optional[str], timeout: float = 10.0) -> JobHandler:
+    async def post_payload(payload: dict):
+        if not url:
+            return
+        # Imported on first delivery; requests adds noticeably to app start-up
+        import requests
+        response = await asyncio.to_thread(requests.post, url, json=payload, timeout=timeout)
+        response.raise_for_status()
+
+    return post_payload
@@ -0,0 +1,99 @@
+"""
+Readiness checks and event-loop lag monitoring.
+ReadinessProbe caches the result of its (Mongo) checks so probes cannot pile load on the database.
+LoopLagMonitor samples scheduling delay and, from a watchdog thread, logs the stack of
+whatever is holding the event loop when it stays blocked past a threshold.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ReadinessCheck = Callable[[], Awaitable[None]]
+
+
+class ReadinessProbe:
+    def __init__(self, checks: Dict[str, ReadinessCheck], cache_seconds: float = 2.0):
+        self.checks = checks
+        self.cache_seconds = cache_seconds
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def check(self) -> dict:
+        if self._result is not None and time.monotonic() - self._checked_at < self.cache_seconds:
+            return self._result
+        async with self._lock:
+            # Another request may have refreshed the result while we waited
+            if self._result is not None and time.monotonic() - self._checked_at < self.cache_seconds:
+                return self._result
+            results = {}
+            for name, check in self.checks.items():
+                try:
+                    await check()
+                    results[name] = "ok"
+                except Exception as exc:
+                    results[name] = f"failed: {exc}"
+            ready = all(status == "ok" for status in results.values())
+            metrics.set_gauge("readiness.ready", 1 if ready else 0)
+            self._result = {"ready": ready, "checks": results}
+            self._checked_at = time.monotonic()
+            return self._result
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.5, block_threshold: float = 0.25):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _sample(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag_ms = max(0.0, now - expected) * 1000
+            self._heartbeat = now
+            metrics.set_gauge("event_loop.lag_ms", lag_ms)
+            metrics.observe("event_loop.lag_ms", lag_ms)
+
+    def _watch(self):
+        reported_heartbeat = None
+        while not self._stopped.wait(self.block_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.block_threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            metrics.inc("event_loop.blocked")
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning("Event loop blocked for %.0f ms; loop thread stack:\n%s", blocked_for * 1000, stack)
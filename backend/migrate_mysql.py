@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Streaming migration from the PHP steam-delivery MySQL schema into the backend's Mongo collections.
+Rows are read from a mysqldump file or a live MySQL connection, grouped into batches and written
+with unordered insert_many, with a bounded number of batches in flight. Progress is checkpointed
+so an interrupted run resumes where it stopped; rows that were already copied are skipped as
+duplicates through the unique id indexes.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+
+from credentials import cipher_from_env
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+DUPLICATE_KEY_CODE = 11000
+
+# Column order of the tables in steam-delivery/database.sql, used for INSERTs without a column list
+TABLE_COLUMNS = {
+    "steam_accounts": ["id", "username", "password", "created_at"],
+    "delivery_keys": ["id", "key_value", "created_at"],
+}
+
+app = typer.Typer(help="Migrate steam-delivery MySQL data into MongoDB.")
+
+Row = Tuple[str, object, dict]
+
+
+# Dump parsing
+
+_TOKEN = re.compile(
+    r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`|NULL\b|-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|[(),;]|[A-Za-z_][\w$]*""",
+    re.S,
+)
+_INSERT_HEADER = re.compile(r"\s*INSERT\s+(?:IGNORE\s+)?INTO\s+`?(\w+)`?\s*(\(([^)]*)\))?\s*VALUES\s*", re.I)
+_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+
+def _unquote(token: str) -> str:
+    quote = token[0]
+    body = token[1:-1].replace(quote * 2, quote)
+    return re.sub(r"\\(.)", lambda m: _ESCAPES.get(m.group(1), m.group(1)), body, flags=re.S)
+
+
+def _value(token: str):
+    if token[0] in "'\"":
+        return _unquote(token)
+    if token.upper() == "NULL":
+        return None
+    return token
+
+
+def _unterminated(statement: str) -> bool:
+    # An odd number of unescaped quotes means the ';' we stopped at was inside a string
+    stripped = re.sub(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`""", "", statement, flags=re.S)
+    return "'" in stripped or '"' in stripped
+
+
+def iter_statements(lines: Iterator[str]) -> Iterator[str]:
+    buffer: List[str] = []
+    for line in lines:
+        if not buffer and (line.startswith("--") or not line.strip()):
+            continue
+        buffer.append(line)
+        if line.rstrip().endswith(";"):
+            statement = "".join(buffer)
+            if _unterminated(statement):
+                continue
+            buffer = []
+            yield statement
+    if buffer:
+        yield "".join(buffer)
+
+
+def parse_insert(statement: str) -> Optional[Tuple[str, Optional[List[str]], Iterator[list]]]:
+    header = _INSERT_HEADER.match(statement)
+    if not header:
+        return None
+    table = header.group(1)
+    columns = None
+    if header.group(3):
+        columns = [column.strip().strip("`") for column in header.group(3).split(",")]
+
+    def rows():
+        row, depth = None, 0
+        for match in _TOKEN.finditer(statement, header.end()):
+            token = match.group(0)
+            if token == "(":
+                depth += 1
+                row = []
+            elif token == ")":
+                depth -= 1
+                yield row
+            elif token in (",", ";"):
+                continue
+            elif depth:
+                row.append(_value(token))
+
+    return table, columns, rows()
+
+
+def _datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return datetime.utcnow()
+    return datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S")
+
+
+def to_document(table: str, record: dict, product: str) -> dict:
+    if table == "steam_accounts":
+        return {
+            "id": record.get("id") or str(uuid.uuid4()),
+            "username": record["username"],
+            "password": record["password"],
+            "product": product,
+            # Selection fields, set as for accounts created through the API
+            "delivery_count": 0,
+            "last_delivered_at": None,
+            "random_key": random.random(),
+            "created_at": _datetime(record.get("created_at")),
+        }
+    return {
+        "id": record.get("id") or str(uuid.uuid4()),
+        "key_value": record["key_value"],
+        "product": product,
+        "created_at": _datetime(record.get("created_at")),
+        "expires_at": None,
+    }
+
+
+def dump_rows(path: Path, tables: List[str], product: str, checkpoint: dict) -> Iterator[Row]:
+    ordinals = {table: 0 for table in tables}
+    with path.open(encoding="utf-8", errors="replace") as dump:
+        for statement in iter_statements(dump):
+            parsed = parse_insert(statement)
+            if parsed is None or parsed[0] not in ordinals:
+                continue
+            table, columns, rows = parsed
+            columns = columns or TABLE_COLUMNS[table]
+            done = checkpoint.get(table, {}).get("position") or 0
+            for values in rows:
+                ordinals[table] += 1
+                if ordinals[table] <= done:
+                    continue
+                yield table, ordinals[table], to_document(table, dict(zip(columns, values)), product)
+
+
+def mysql_rows(connection, tables: List[str], product: str, checkpoint: dict) -> Iterator[Row]:
+    import pymysql.cursors
+
+    for table in tables:
+        columns = TABLE_COLUMNS[table]
+        last_id = checkpoint.get(table, {}).get("position") or ""
+        # Keyset order on the primary key keeps the stream resumable without OFFSET scans
+        with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE id > %s ORDER BY id",
+                (last_id,),
+            )
+            for values in cursor:
+                record = dict(zip(columns, values))
+                yield table, record["id"], to_document(table, record, product)
+
+
+# Writing
+
+class Checkpoint:
+    def __init__(self, path: Optional[Path]):
+        # An empty --checkpoint option arrives as Path(".") and disables resuming
+        self.path = path if path and str(path) != "." else None
+        self.state: Dict[str, dict] = {}
+        if self.path and self.path.exists():
+            self.state = json.loads(self.path.read_text())
+        self._next_sequence: Dict[str, int] = {}
+        self._committed_sequence: Dict[str, int] = {}
+        self._completed: Dict[str, Dict[int, object]] = {}
+
+    def issue(self, table: str) -> int:
+        sequence = self._next_sequence.get(table, 0)
+        self._next_sequence[table] = sequence + 1
+        return sequence
+
+    def complete(self, table: str, sequence: int, position, rows: int):
+        # Batches finish out of order; only the contiguous prefix is safe to record
+        self._completed.setdefault(table, {})[sequence] = (position, rows)
+        committed = self._committed_sequence.get(table, -1)
+        entry = self.state.setdefault(table, {"position": None, "rows": 0})
+        while committed + 1 in self._completed[table]:
+            committed += 1
+            position, rows = self._completed[table].pop(committed)
+            entry["position"] = position
+            entry["rows"] += rows
+        self._committed_sequence[table] = committed
+
+    def save(self):
+        if not self.path:
+            return
+        temporary = self.path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(self.state, default=str))
+        os.replace(temporary, self.path)
+
+
+async def insert_batch(collection, documents: List[dict]) -> Tuple[int, int]:
+    try:
+        result = await collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as exc:
+        errors = exc.details.get("writeErrors", [])
+        unexpected = [error for error in errors if error.get("code") != DUPLICATE_KEY_CODE]
+        if unexpected:
+            raise
+        return exc.details.get("nInserted", 0), len(errors)
+
+
+def batches(source: Iterator[Row], batch_size: int) -> Iterator[Tuple[str, object, List[dict]]]:
+    # Batches never mix tables; each carries the position of its last row for the checkpoint
+    table, position, documents = None, None, []
+    for row_table, row_position, document in source:
+        if documents and (row_table != table or len(documents) >= batch_size):
+            yield table, position, documents
+            documents = []
+        table, position = row_table, row_position
+        documents.append(document)
+    if documents:
+        yield table, position, documents
+
+
+async def migrate(source: Iterator[Row], checkpoint: Checkpoint, batch_size: int, concurrency: int):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    # Unique ids make re-copied rows after a resume show up as duplicates instead of copies
+    await db.steam_accounts.create_index("id", unique=True)
+    await db.delivery_keys.create_index("id", unique=True)
+    await db.delivery_keys.create_index("key_value", unique=True)
+
+    in_flight = asyncio.Semaphore(concurrency)
+    pending = set()
+    failures: List[Exception] = []
+    totals = {"read": 0, "inserted": 0, "duplicates": 0}
+    started = last_report = time.monotonic()
+    batch_iterator = batches(source, batch_size)
+    cipher = cipher_from_env()
+
+    def next_batch():
+        batch = next(batch_iterator, None)
+        if batch is not None and batch[0] == "steam_accounts":
+            # One batched encrypt per batch, matching what the backend stores for new accounts
+            encrypted = cipher.encrypt_many_sync([document["password"] for document in batch[2]])
+            for document, password in zip(batch[2], encrypted):
+                document["password"] = password
+        return batch
+
+    async def write(table: str, sequence: int, position, documents: List[dict]):
+        try:
+            inserted, duplicates = await insert_batch(db[table], documents)
+            totals["inserted"] += inserted
+            totals["duplicates"] += duplicates
+            checkpoint.complete(table, sequence, position, len(documents))
+            checkpoint.save()
+        except Exception as exc:
+            # Recorded here, before the slot is released, so no further batch starts after a failure
+            failures.append(exc)
+        finally:
+            in_flight.release()
+
+    while not failures:
+        # Parsing, MySQL reads and encryption run on a thread so they overlap with the writes in flight
+        batch = await asyncio.to_thread(next_batch)
+        if batch is None:
+            break
+        table, position, documents = batch
+        await in_flight.acquire()
+        if failures:
+            in_flight.release()
+            break
+        task = asyncio.create_task(write(table, checkpoint.issue(table), position, documents))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        totals["read"] += len(documents)
+
+        now = time.monotonic()
+        if now - last_report >= 2:
+            last_report = now
+            rate = totals["inserted"] / (now - started)
+            typer.echo(f"read {totals['read']:,} inserted {totals['inserted']:,} "
+                       f"skipped {totals['duplicates']:,} ({rate:,.0f} rows/s)")
+
+    # Batches still in flight finish and checkpoint; a failed batch stops reading new ones
+    await asyncio.gather(*pending)
+    client.close()
+    elapsed = time.monotonic() - started
+    if failures:
+        typer.echo(f"failed after inserting {totals['inserted']:,} rows: {failures[0]!r}; "
+                   f"{len(failures)} batches were not written and the checkpoint stops before them", err=True)
+        raise typer.Exit(1)
+    typer.echo(f"done: read {totals['read']:,} inserted {totals['inserted']:,} skipped {totals['duplicates']:,} "
+               f"in {elapsed:.1f}s ({totals['inserted'] / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def _tables(tables: str) -> List[str]:
+    selected = [table.strip() for table in tables.split(",") if table.strip()]
+    unknown = set(selected) - set(TABLE_COLUMNS)
+    if unknown:
+        raise typer.BadParameter(f"unknown tables: {', '.join(sorted(unknown))}")
+    return selected
+
+
+@app.command("from-dump")
+def from_dump(
+    dump: Path = typer.Argument(..., exists=True, dir_okay=False, help="mysqldump or database.sql file"),
+    tables: str = typer.Option("steam_accounts,delivery_keys", help="Comma-separated tables to migrate"),
+    product: str = typer.Option(os.environ.get('DEFAULT_PRODUCT', 'default'), help="Product assigned to migrated rows"),
+    batch_size: int = typer.Option(1000, min=1),
+    concurrency: int = typer.Option(4, min=1, help="Batches in flight at once"),
+    checkpoint: Optional[Path] = typer.Option(Path("migrate_checkpoint.json"), help="Resume file; empty to disable"),
+):
+    state = Checkpoint(checkpoint)
+    source = dump_rows(dump, _tables(tables), product, state.state)
+    asyncio.run(migrate(source, state, batch_size, concurrency))
+
+
+@app.command("from-mysql")
+def from_mysql(
+    host: str = typer.Option("localhost"),
+    port: int = typer.Option(3306),
+    user: str = typer.Option("root"),
+    password: str = typer.Option("", envvar="MYSQL_PASSWORD"),
+    database: str = typer.Option("steam_delivery"),
+    tables: str = typer.Option("steam_accounts,delivery_keys", help="Comma-separated tables to migrate"),
+    product: str = typer.Option(os.environ.get('DEFAULT_PRODUCT', 'default'), help="Product assigned to migrated rows"),
+    batch_size: int = typer.Option(1000, min=1),
+    concurrency: int = typer.Option(4, min=1, help="Batches in flight at once"),
+    checkpoint: Optional[Path] = typer.Option(Path("migrate_checkpoint.json"), help="Resume file; empty to disable"),
+):
+    try:
+        import pymysql
+    except ImportError:
+        raise typer.BadParameter("live migration needs PyMySQL (pip install PyMySQL)")
+    connection = pymysql.connect(host=host, port=port, user=user, password=password, database=database, charset="utf8mb4")
+    try:
+        state = Checkpoint(checkpoint)
+        source = mysql_rows(connection, _tables(tables), product, state.state)
+        asyncio.run(migrate(source, state, batch_size, concurrency))
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    app()
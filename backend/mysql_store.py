@@ -0,0 +1,172 @@
+"""
+Async MySQL storage on the PHP site's schema (steam-delivery/database.sql).
+Selected with STORAGE_BACKEND=mysql. Connections come from an aiomysql pool and every statement
+is parameterized. Redemption locks only the key row, with SELECT ... FOR UPDATE SKIP LOCKED, so a
+key that is being redeemed concurrently reads as already used instead of queueing behind the lock;
+the account is picked by seeking a random point in the primary key rather than reading every row
+as redeem.php does. SKIP LOCKED needs MySQL 8.0+ or MariaDB 10.6+.
+"""
+
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+from resilience import DatabaseUnavailable
+
+INVALID = "invalid"
+NO_ACCOUNT = "no_account"
+DELIVERED = "delivered"
+
+DUPLICATE_ENTRY = 1062
+# Client-side codes for lost or refused connections (CR_CONNECTION_ERROR .. CR_SERVER_LOST)
+CONNECTION_ERRORS = {2002, 2003, 2006, 2013}
+
+ACCOUNT_COLUMNS = "id, username, password, created_at"
+KEY_COLUMNS = "id, key_value, created_at"
+
+
+class DuplicateEntry(Exception):
+    pass
+
+
+class MySQLStore:
+    def __init__(self, host: str, port: int, user: str, password: str, database: str,
+                 min_size: int = 1, max_size: int = 10, connect_timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.database = database
+        self.min_size = min_size
+        self.max_size = max_size
+        self.connect_timeout = connect_timeout
+        self.pool = None
+
+    async def connect(self):
+        # Imported here so Mongo deployments never need the MySQL driver
+        import aiomysql
+
+        self.pool = await aiomysql.create_pool(
+            host=self.host, port=self.port, user=self.user, password=self.password, db=self.database,
+            minsize=self.min_size, maxsize=self.max_size, connect_timeout=self.connect_timeout,
+            charset="utf8mb4", autocommit=True,
+        )
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    @asynccontextmanager
+    async def _cursor(self):
+        import aiomysql
+
+        if self.pool is None:
+            raise DatabaseUnavailable("Veritabanı henüz hazır değil, lütfen tekrar deneyin.")
+        try:
+            async with self.pool.acquire() as connection:
+                async with connection.cursor(aiomysql.DictCursor) as cursor:
+                    yield connection, cursor
+        except aiomysql.OperationalError as exc:
+            if exc.args and exc.args[0] in CONNECTION_ERRORS:
+                raise DatabaseUnavailable("Veritabanı yanıt vermiyor, lütfen tekrar deneyin.") from exc
+            raise
+
+    async def _fetch_all(self, sql: str, args: tuple = ()) -> List[dict]:
+        async with self._cursor() as (_, cursor):
+            await cursor.execute(sql, args)
+            return list(await cursor.fetchall())
+
+    async def _execute(self, sql: str, args: tuple = ()) -> int:
+        import aiomysql
+
+        try:
+            async with self._cursor() as (_, cursor):
+                return await cursor.execute(sql, args)
+        except aiomysql.IntegrityError as exc:
+            if exc.args and exc.args[0] == DUPLICATE_ENTRY:
+                raise DuplicateEntry(str(exc)) from exc
+            raise
+
+    async def ping(self):
+        async with self._cursor() as (connection, _):
+            await connection.ping(reconnect=False)
+
+    # Inventory
+
+    async def list_accounts(self, limit: int = 1000) -> List[dict]:
+        return await self._fetch_all(f"SELECT {ACCOUNT_COLUMNS} FROM steam_accounts ORDER BY created_at LIMIT %s", (limit,))
+
+    async def insert_account(self, account: dict):
+        await self._execute(
+            "INSERT INTO steam_accounts (id, username, password, created_at) VALUES (%s, %s, %s, %s)",
+            (account["id"], account["username"], account["password"], account["created_at"]),
+        )
+
+    async def delete_account(self, account_id: str) -> bool:
+        return await self._execute("DELETE FROM steam_accounts WHERE id = %s", (account_id,)) > 0
+
+    async def list_keys(self, limit: int = 1000) -> List[dict]:
+        return await self._fetch_all(f"SELECT {KEY_COLUMNS} FROM delivery_keys ORDER BY created_at LIMIT %s", (limit,))
+
+    async def insert_key(self, key: dict):
+        await self._execute(
+            "INSERT INTO delivery_keys (id, key_value, created_at) VALUES (%s, %s, %s)",
+            (key["id"], key["key_value"], key["created_at"]),
+        )
+
+    async def delete_key(self, key_id: str) -> bool:
+        return await self._execute("DELETE FROM delivery_keys WHERE id = %s", (key_id,)) > 0
+
+    # Redemption
+
+    async def _pick_account(self, cursor) -> Optional[dict]:
+        # Accounts are shared between deliveries, so they are read without a lock. Seeking from a
+        # random UUID reads one primary key entry, wrapping to the start when the pivot is past the end.
+        pivot = str(uuid.uuid4())
+        await cursor.execute(
+            f"SELECT {ACCOUNT_COLUMNS} FROM steam_accounts WHERE id >= %s ORDER BY id LIMIT 1", (pivot,)
+        )
+        account = await cursor.fetchone()
+        if account is None:
+            await cursor.execute(f"SELECT {ACCOUNT_COLUMNS} FROM steam_accounts ORDER BY id LIMIT 1")
+            account = await cursor.fetchone()
+        return account
+
+    async def redeem(self, key_value: str) -> Tuple[str, Optional[dict], Optional[dict]]:
+        """Consume a key and pick an account in one transaction; returns (outcome, key, account)."""
+        async with self._cursor() as (connection, cursor):
+            await connection.begin()
+            try:
+                await cursor.execute(
+                    f"SELECT {KEY_COLUMNS} FROM delivery_keys WHERE key_value = %s FOR UPDATE SKIP LOCKED",
+                    (key_value,),
+                )
+                key = await cursor.fetchone()
+                if key is None:
+                    await connection.rollback()
+                    return INVALID, None, None
+                account = await self._pick_account(cursor)
+                if account is None:
+                    await connection.rollback()
+                    return NO_ACCOUNT, key, None
+                await cursor.execute("DELETE FROM delivery_keys WHERE id = %s", (key["id"],))
+                await connection.commit()
+            except BaseException:
+                await connection.rollback()
+                raise
+        return DELIVERED, key, account
+
+
+def store_from_env() -> MySQLStore:
+    return MySQLStore(
+        host=os.environ.get('MYSQL_HOST', 'localhost'),
+        port=int(os.environ.get('MYSQL_PORT', '3306')),
+        user=os.environ.get('MYSQL_USER', 'root'),
+        password=os.environ.get('MYSQL_PASSWORD', ''),
+        database=os.environ.get('MYSQL_DATABASE', 'steam_delivery'),
+        min_size=int(os.environ.get('MYSQL_POOL_MIN_SIZE', '2')),
+        max_size=int(os.environ.get('MYSQL_POOL_MAX_SIZE', '20')),
+    )
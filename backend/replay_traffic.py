@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Replay captured traffic against a local instance and compare latency between builds.
+`replay` re-issues a TRAFFIC_CAPTURE_PATH log at 1x-50x speed. Valid redemptions use keys seeded
+through the admin API beforehand, invalid ones use random keys, batch redemptions keep their
+captured size, mode and number of delivered keys, and admin writes get synthetic payloads of the
+captured size. `compare` prints per-route latency percentiles of two result files.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+import typer
+
+app = typer.Typer(help="Replay captured traffic and compare latency distributions.")
+
+REDEEM_ROUTE = "/api/redeem-key"
+BATCH_REDEEM_ROUTE = "/api/redeem-keys"
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def load_capture(path: Path) -> List[dict]:
+    with path.open(encoding="utf-8") as capture:
+        records = [json.loads(line) for line in capture if line.strip()]
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def _padding(size: int) -> str:
+    return "x" * max(1, size)
+
+
+def seed_inventory(base_url: str, headers: dict, valid_redemptions: int) -> List[str]:
+    session = _session()
+    # One account is enough for redemptions to succeed; the keys are what gets consumed
+    session.post(f"{base_url}/api/admin/accounts", headers=headers,
+                 json={"username": f"replay-{uuid.uuid4().hex[:8]}", "password": "replay"}, timeout=30)
+    keys = []
+    for _ in range(valid_redemptions):
+        key = f"REPLAY-{uuid.uuid4().hex}"
+        response = session.post(f"{base_url}/api/admin/keys", headers=headers, json={"key_value": key}, timeout=30)
+        response.raise_for_status()
+        keys.append(key)
+    return keys
+
+
+def _invalid_key() -> str:
+    return f"REPLAY-INVALID-{uuid.uuid4().hex}"
+
+
+def valid_redemptions(record: dict) -> int:
+    tags = record.get("tags", {})
+    if record["r"] == REDEEM_ROUTE:
+        return 1 if tags.get("key_valid") else 0
+    if record["r"] == BATCH_REDEEM_ROUTE:
+        return tags.get("delivered", 0)
+    return 0
+
+
+def build_request(record: dict, base_url: str, headers: dict, valid_keys: List[str]) -> Optional[dict]:
+    route, method = record["r"], record["m"]
+    if route == "<unmatched>":
+        return None
+    if route == REDEEM_ROUTE:
+        tags = record.get("tags", {})
+        key = valid_keys.pop() if tags.get("key_valid") and valid_keys else _invalid_key()
+        return {"method": method, "url": base_url + route, "json": {"key": key}}
+    if route == BATCH_REDEEM_ROUTE:
+        tags = record.get("tags", {})
+        size = max(1, tags.get("batch_size", 1))
+        valid = min(size, tags.get("delivered", 0), len(valid_keys))
+        keys = [valid_keys.pop() for _ in range(valid)] + [_invalid_key() for _ in range(size - valid)]
+        random.shuffle(keys)
+        return {"method": method, "url": base_url + route,
+                "json": {"keys": keys, "mode": tags.get("mode", "best_effort")}}
+    # Path parameters were not captured; random ids keep the shape of the call (a 404 lookup)
+    path = route.replace("{account_id}", str(uuid.uuid4())).replace("{key_id}", str(uuid.uuid4()))
+    request = {"method": method, "url": base_url + path, "headers": headers}
+    if method == "POST" and route.endswith("/admin/keys"):
+        request["json"] = {"key_value": f"REPLAY-{uuid.uuid4().hex}"}
+    elif method == "POST" and route.endswith("/admin/accounts"):
+        request["json"] = {"username": f"replay-{uuid.uuid4().hex[:8]}", "password": _padding(record["qb"] - 40)}
+    elif method == "POST" and route.endswith("/admin/verify"):
+        request["json"] = {"password": _padding(record["qb"] - 16)}
+    return request
+
+
+def send(request: dict, record: dict, scheduled: float) -> dict:
+    started = time.monotonic()
+    try:
+        response = _session().request(timeout=30, **request)
+        status = response.status_code
+    except requests.RequestException:
+        status = 0
+    finished = time.monotonic()
+    return {
+        "r": record["r"],
+        "m": record["m"],
+        "s": status,
+        "ms": round((finished - started) * 1000, 3),
+        "lag_ms": round((started - scheduled) * 1000, 3),
+    }
+
+
+async def run_replay(records: List[dict], base_url: str, headers: dict, speed: float,
+                     workers: int, valid_keys: List[str]) -> List[dict]:
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    started = time.monotonic()
+    origin = records[0]["t"] if records else 0
+    pending = []
+    for record in records:
+        request = build_request(record, base_url, headers, valid_keys)
+        if request is None:
+            continue
+        scheduled = started + (record["t"] - origin) / speed
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        pending.append(loop.run_in_executor(pool, send, request, record, scheduled))
+    results = await asyncio.gather(*pending)
+    pool.shutdown()
+    return results
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(results: List[dict]) -> Dict[str, dict]:
+    by_route = defaultdict(list)
+    errors = defaultdict(int)
+    for result in results:
+        name = f"{result['m']} {result['r']}"
+        by_route[name].append(result["ms"])
+        if result["s"] == 0 or result["s"] >= 500:
+            errors[name] += 1
+    return {
+        name: {
+            "count": len(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies),
+            "errors": errors[name],
+        }
+        for name, latencies in by_route.items()
+    }
+
+
+@app.command()
+def replay(
+    capture: Path = typer.Argument(..., exists=True, dir_okay=False),
+    base_url: str = typer.Option("http://localhost:8001"),
+    speed: float = typer.Option(1.0, min=1.0, max=50.0, help="Replay speed multiplier"),
+    out: Path = typer.Option(Path("replay_results.jsonl")),
+    admin_token: str = typer.Option("replay", help="Bearer token for admin routes"),
+    workers: int = typer.Option(256, min=1, help="Maximum requests in flight"),
+    seed: bool = typer.Option(True, help="Create keys for the captured valid redemptions first"),
+):
+    records = load_capture(capture)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    valid = sum(valid_redemptions(record) for record in records)
+    valid_keys = seed_inventory(base_url, headers, valid) if seed else []
+    random.shuffle(valid_keys)
+    typer.echo(f"replaying {len(records):,} requests at {speed:g}x ({valid:,} valid redemptions)")
+    results = asyncio.run(run_replay(records, base_url, headers, speed, workers, valid_keys))
+    with out.open("w", encoding="utf-8") as output:
+        for result in results:
+            output.write(json.dumps(result, separators=(",", ":")) + "\n")
+    lagging = sum(1 for result in results if result["lag_ms"] > 50)
+    typer.echo(f"wrote {len(results):,} results to {out}; {lagging:,} requests started >50ms late")
+
+
+@app.command()
+def compare(baseline: Path = typer.Argument(..., exists=True), candidate: Path = typer.Argument(..., exists=True)):
+    before = summarize([json.loads(line) for line in baseline.open() if line.strip()])
+    after = summarize([json.loads(line) for line in candidate.open() if line.strip()])
+    typer.echo(f"{'route':<40} {'n':>6} {'p50':>14} {'p90':>14} {'p99':>14} {'errors':>7}")
+    for name in sorted(set(before) | set(after)):
+        old, new = before.get(name), after.get(name)
+        if not old or not new:
+            typer.echo(f"{name:<40} only in {'candidate' if new else 'baseline'}")
+            continue
+
+        def change(key):
+            delta = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            return f"{new[key]:.1f}({delta:+.0f}%)"
+
+        typer.echo(f"{name:<40} {new['count']:>6} {change('p50'):>14} {change('p90'):>14} {change('p99'):>14} "
+                   f"{new['errors'] - old['errors']:>+7}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,228 @@
+"""
+Latency budget and circuit breaker around MongoDB calls.
+Every collection call runs under a server-side deadline (pymongo.timeout sets maxTimeMS)
+and a client-side asyncio deadline. Repeated timeouts or connection failures open the
+breaker, after which calls fail fast with DatabaseUnavailable until a probe succeeds.
+"""
+
+import asyncio
+import logging
+import time
+
+import pymongo
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from metrics import metrics
+from tracing import CLIENT, tracer
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class DatabaseUnavailable(Exception):
+    def __init__(self, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        metrics.set_gauge(f"circuit_breaker.{name}.state", STATE_VALUES[CLOSED])
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning("Circuit breaker %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        metrics.inc(f"circuit_breaker.{self.name}.transitions.{state}")
+        metrics.set_gauge(f"circuit_breaker.{self.name}.state", STATE_VALUES[state])
+
+    def retry_after(self) -> int:
+        remaining = self.opened_at + self.reset_timeout - self.clock()
+        return max(1, int(remaining + 0.999))
+
+    def before_call(self):
+        if self.state == OPEN:
+            if self.clock() - self.opened_at < self.reset_timeout:
+                metrics.inc(f"circuit_breaker.{self.name}.rejected")
+                raise DatabaseUnavailable("Veritabanı geçici olarak kullanılamıyor.", self.retry_after())
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # Only one probe goes through while half open; everyone else keeps failing fast
+            if self._probe_in_flight:
+                metrics.inc(f"circuit_breaker.{self.name}.rejected")
+                raise DatabaseUnavailable("Veritabanı geçici olarak kullanılamıyor.", 1)
+            self._probe_in_flight = True
+
+    def release_probe(self):
+        # A probe that ended without an answer (cancelled) lets the next call probe instead
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self._probe_in_flight = False
+        self.failures = 0
+        self._transition(CLOSED)
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            self._transition(OPEN)
+
+
+def is_unavailable_error(exc: BaseException) -> bool:
+    if isinstance(exc, asyncio.TimeoutError) or isinstance(exc, ConnectionFailure):
+        return True
+    return isinstance(exc, PyMongoError) and exc.timeout
+
+
+class MongoGuard:
+    def __init__(self, breaker: CircuitBreaker, read_timeout_ms: float = 2000, write_timeout_ms: float = 5000):
+        self.breaker = breaker
+        self.read_timeout_ms = read_timeout_ms
+        self.write_timeout_ms = write_timeout_ms
+
+    async def run(self, operation: str, timeout_ms: float, func, *args, **kwargs):
+        collection, _, name = operation.partition(".")
+        if not name:
+            collection, name = "", collection
+        attributes = {"db.system": "mongodb", "db.operation.name": name}
+        if collection:
+            attributes["db.collection.name"] = collection
+        with tracer.span(f"{name} {collection}".strip(), CLIENT, attributes):
+            return await self._run(operation, timeout_ms, func, *args, **kwargs)
+
+    async def _run(self, operation: str, timeout_ms: float, func, *args, **kwargs):
+        self.breaker.before_call()
+        seconds = timeout_ms / 1000.0
+        start = time.perf_counter()
+        try:
+            with pymongo.timeout(seconds):
+                result = await asyncio.wait_for(func(*args, **kwargs), seconds)
+        except Exception as exc:
+            if not is_unavailable_error(exc):
+                # The server answered (e.g. duplicate key), so the database itself is healthy
+                self.breaker.record_success()
+                raise
+            self.breaker.record_failure()
+            metrics.inc(f"mongo.{operation}.failures")
+            raise DatabaseUnavailable("Veritabanı yanıt vermiyor, lütfen tekrar deneyin.", self.breaker.retry_after()) from exc
+        except BaseException:
+            # Cancellation says nothing about the database, but must not leave the probe slot taken
+            self.breaker.release_probe()
+            raise
+        finally:
+            metrics.observe(f"mongo.{operation}.ms", (time.perf_counter() - start) * 1000)
+        self.breaker.record_success()
+        return result
+
+
+READ_OPERATIONS = {"find_one", "count_documents", "estimated_document_count", "distinct", "index_information"}
+WRITE_OPERATIONS = {
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "bulk_write", "find_one_and_update", "find_one_and_delete", "find_one_and_replace",
+    "create_index", "create_indexes", "drop_index",
+}
+CURSOR_CHAIN_METHODS = {"sort", "skip", "limit", "batch_size", "hint", "max_time_ms", "collation", "comment"}
+
+
+class GuardedCursor:
+    def __init__(self, cursor, guard: MongoGuard, operation: str):
+        self._cursor = cursor
+        self._guard = guard
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if name in CURSOR_CHAIN_METHODS:
+            def chained(*args, **kwargs):
+                self._cursor = attribute(*args, **kwargs)
+                return self
+            return chained
+        return attribute
+
+    async def to_list(self, length):
+        return await self._guard.run(self._operation, self._guard.read_timeout_ms, self._cursor.to_list, length)
+
+    async def explain(self):
+        return await self._guard.run(f"{self._operation}.explain", self._guard.read_timeout_ms, self._cursor.explain)
+
+    def __aiter__(self):
+        # Streaming consumers (exports, snapshots) manage their own pacing
+        return self._cursor.__aiter__()
+
+
+class GuardedCollection:
+    def __init__(self, collection, guard: MongoGuard):
+        self._collection = collection
+        self._guard = guard
+
+    @property
+    def unguarded(self):
+        return self._collection
+
+    def find(self, *args, **kwargs):
+        cursor = self._collection.find(*args, **kwargs).max_time_ms(int(self._guard.read_timeout_ms))
+        return GuardedCursor(cursor, self._guard, f"{self._collection.name}.find")
+
+    def aggregate(self, pipeline, **kwargs):
+        kwargs.setdefault("maxTimeMS", int(self._guard.read_timeout_ms))
+        return GuardedCursor(self._collection.aggregate(pipeline, **kwargs), self._guard, f"{self._collection.name}.aggregate")
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name in READ_OPERATIONS:
+            timeout_ms = self._guard.read_timeout_ms
+        elif name in WRITE_OPERATIONS:
+            timeout_ms = self._guard.write_timeout_ms
+        else:
+            return attribute
+        operation = f"{self._collection.name}.{name}"
+
+        async def guarded(*args, **kwargs):
+            return await self._guard.run(operation, timeout_ms, attribute, *args, **kwargs)
+
+        return guarded
+
+
+class GuardedDatabase:
+    def __init__(self, database, guard: MongoGuard):
+        self._database = database
+        self._guard = guard
+        self._collections = {}
+
+    @property
+    def guard(self) -> MongoGuard:
+        return self._guard
+
+    @property
+    def unguarded(self):
+        return self._database
+
+    def __getitem__(self, name: str) -> GuardedCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = GuardedCollection(self._database[name], self._guard)
+        return collection
+
+    def __getattr__(self, name: str) -> GuardedCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, *args, **kwargs):
+        return await self._guard.run("command", self._guard.read_timeout_ms, self._database.command, *args, **kwargs)
@@ -0,0 +1,99 @@
+"""
+Index-backed admin search helpers.
+Prefix searches become anchored regexes (which Mongo turns into index range bounds), results are
+paginated with an opaque keyset cursor, and explain output is reduced to the numbers that show
+whether an index was used.
+"""
+
+import base64
+import json
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(value, object_id: ObjectId) -> str:
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    payload = json.dumps({"v": value, "id": str(object_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[object, ObjectId]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = payload["v"]
+        if isinstance(value, dict) and "$date" in value:
+            value = datetime.fromisoformat(value["$date"])
+        return value, ObjectId(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def build_search(sort_field: str, prefix_field: Optional[str] = None, prefix: Optional[str] = None,
+                 created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                 product: Optional[str] = None, cursor: Optional[str] = None,
+                 unique_sort: bool = False) -> Tuple[dict, List[tuple]]:
+    # Non-unique sort fields get _id as a tiebreaker; the supporting indexes end in _id for that reason
+    clauses = []
+    if prefix:
+        # Anchored, case-sensitive and escaped, so the planner can use index bounds instead of a scan
+        clauses.append({prefix_field: {"$regex": "^" + re.escape(prefix)}})
+    if created_from or created_to:
+        created = {}
+        if created_from:
+            created["$gte"] = created_from
+        if created_to:
+            created["$lt"] = created_to
+        clauses.append({"created_at": created})
+    if product:
+        clauses.append({"product": product})
+    if cursor:
+        value, object_id = decode_cursor(cursor)
+        if unique_sort:
+            clauses.append({sort_field: {"$gt": value}})
+        else:
+            clauses.append({"$or": [
+                {sort_field: {"$gt": value}},
+                {sort_field: value, "_id": {"$gt": object_id}},
+            ]})
+    query = {"$and": clauses} if len(clauses) > 1 else (clauses[0] if clauses else {})
+    return query, [(sort_field, 1)] if unique_sort else [(sort_field, 1), ("_id", 1)]
+
+
+def next_cursor(documents: List[dict], sort_field: str, limit: int) -> Optional[str]:
+    if len(documents) < limit:
+        return None
+    last = documents[-1]
+    return encode_cursor(last[sort_field], last["_id"])
+
+
+def _stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")]
+    for child_key in ("inputStage", "outerStage", "innerStage"):
+        if child_key in plan:
+            stages.extend(_stages(plan[child_key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_stages(child))
+    return [stage for stage in stages if stage]
+
+
+def summarize_explain(explain: dict) -> dict:
+    stats = explain.get("executionStats", {})
+    winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    stages = _stages(winning_plan.get("queryPlan", winning_plan))
+    server = explain.get("serverInfo", {})
+    return {
+        # Shows which member answered, to confirm reads are routed to a secondary
+        "server": f"{server.get('host')}:{server.get('port')}" if server else None,
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "returned": stats.get("nReturned"),
+        "stages": stages,
+        "collection_scan": "COLLSCAN" in stages,
+    }
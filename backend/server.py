@@ -1,31 +1,265 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import json
 import logging
+import math
+import random
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uuid
 from datetime import datetime
-import random
 import hashlib
+from pymongo import IndexModel, WriteConcern
+from pymongo import read_preferences
+from pymongo.errors import DuplicateKeyError
+
+from admin_jobs import (
+    TERMINAL_STATUSES, AdminJobRunner, bulk_delete_handler, bulk_delete_query, export_handler, import_accounts_handler,
+    import_keys_handler,
+)
+from account_selection import get_batch_strategy, get_strategy, undo_delivery
+from admission import AdmissionController, Overloaded
+from batch_redemption import (
+    ABORTED, DELIVERED as BATCH_DELIVERED, DUPLICATE, EXPIRED, INVALID as BATCH_INVALID, NO_ACCOUNT,
+    redeem_batch, unclaimed,
+)
+from batching import InsertBatcher
+from compression import CompressionMiddleware, MsgPackRoute
+from credentials import cipher_from_env, mask_password
+from delivery_jobs import DeliveryJobQueue, webhook_handler
+from health import LoopLagMonitor, ReadinessProbe
+from metrics import metrics
+from mysql_store import DELIVERED, INVALID, DuplicateEntry, store_from_env
+from search import MAX_PAGE_SIZE, build_search, next_cursor, summarize_explain
+from resilience import CircuitBreaker, DatabaseUnavailable, GuardedDatabase, MongoGuard
+from shared_state import shared_state_from_env
+from static_assets import FrontendApp, StaticAssetIndex
+from structured_logging import RequestIdMiddleware, configure_logging
+from tracing import TracingMiddleware, configure_from_env as configure_tracing, traced_route, tracer
+from traffic_capture import CaptureWriter, TrafficCaptureMiddleware, tag_request
+from warmup import WarmUp
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Every collection call gets a deadline; repeated failures open the breaker and fail fast with 503
+mongo_breaker = CircuitBreaker(
+    "mongo",
+    failure_threshold=int(os.environ.get('MONGO_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.environ.get('MONGO_BREAKER_RESET_SECONDS', '30')),
+)
+mongo_guard = MongoGuard(
+    mongo_breaker,
+    read_timeout_ms=float(os.environ.get('MONGO_READ_TIMEOUT_MS', '2000')),
+    write_timeout_ms=float(os.environ.get('MONGO_WRITE_TIMEOUT_MS', '5000')),
+)
+
+# Per-route handles: redemption and all writes stay on the primary with the configured write concern,
+# while admin list, search and export reads may go to secondaries within a staleness bound
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+def read_preference_from_name(name: str, max_staleness: int):
+    try:
+        mode = READ_PREFERENCES[name]
+    except KeyError:
+        raise ValueError(f"Unknown read preference {name!r}; expected one of {', '.join(READ_PREFERENCES)}")
+    return mode() if mode is read_preferences.Primary else mode(max_staleness=max_staleness)
+
+# Built at import so a misconfigured ADMIN_READ_PREFERENCE fails before the app starts serving
+admin_read_preference = read_preference_from_name(
+    os.environ.get('ADMIN_READ_PREFERENCE', 'primary'),
+    int(os.environ.get('ADMIN_READ_MAX_STALENESS_SECONDS', '-1')),
+)
+
+# Inventory storage: "mongo", or "mysql" to run on the PHP site's schema (steam-delivery/database.sql).
+# The MySQL backend covers inventory management and redemption; search, delivery jobs and key expiry need Mongo.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+if STORAGE_BACKEND not in ('mongo', 'mysql'):
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected mongo or mysql")
+mysql_store = store_from_env() if STORAGE_BACKEND == 'mysql' else None
+
+# MongoDB handles are created by connect_mongo() in the lifespan, so importing the app opens no connections
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+client: Optional[AsyncIOMotorClient] = None
+db: Optional[GuardedDatabase] = None
+admin_read_db: Optional[GuardedDatabase] = None
+
+# Write-coalescing for admin inserts
+INSERT_BATCH_MAX_SIZE = int(os.environ.get('INSERT_BATCH_MAX_SIZE', '100'))
+INSERT_BATCH_LINGER_MS = float(os.environ.get('INSERT_BATCH_LINGER_MS', '5'))
+account_inserts: Optional[InsertBatcher] = None
+key_inserts: Optional[InsertBatcher] = None
+
+# Inventory is partitioned by product; documents without one belong to the default product
+DEFAULT_PRODUCT = os.environ.get('DEFAULT_PRODUCT', 'default')
+
+# How redeem_key picks an account from a product pool: random, least_delivered, weighted_random, round_robin
+select_account = get_strategy(os.environ.get('ACCOUNT_SELECTION_STRATEGY', 'random'))
+select_accounts = get_batch_strategy(os.environ.get('ACCOUNT_SELECTION_STRATEGY', 'random'))
+
+# Upper bound on keys per /redeem-keys request
+REDEEM_BATCH_MAX_KEYS = int(os.environ.get('REDEEM_BATCH_MAX_KEYS', '100'))
+
+# Redemption admission control: bounded concurrency plus a bounded FIFO wait queue
+redemption_admission = AdmissionController(
+    "redeem",
+    limit=int(os.environ.get('REDEEM_CONCURRENCY_LIMIT', '64')),
+    queue_size=int(os.environ.get('REDEEM_QUEUE_SIZE', '1000')),
+    max_wait=float(os.environ.get('REDEEM_MAX_WAIT_MS', '2000')) / 1000,
+    retry_after=int(os.environ.get('REDEEM_RETRY_AFTER_SECONDS', '2')),
+)
+
+# Counters, rate limits and caches shared by all workers (SHARED_STATE_SOCKET), else per process
+shared_state = shared_state_from_env()
+
+# Per-client redemption rate limit across all workers; 0 disables it
+REDEEM_RATE_PER_MINUTE = float(os.environ.get('REDEEM_RATE_PER_MINUTE', '0'))
+REDEEM_RATE_BURST = float(os.environ.get('REDEEM_RATE_BURST', '10'))
+
+# Post-delivery side effects run on a bounded worker pool, persisted in delivery_jobs
+DELIVERY_WEBHOOK_URL = os.environ.get('DELIVERY_WEBHOOK_URL')
+NOTIFICATION_WEBHOOK_URL = os.environ.get('NOTIFICATION_WEBHOOK_URL')
+delivery_jobs: Optional[DeliveryJobQueue] = None
+
+# Long-running admin operations (imports, bulk deletes, exports) run as persisted background jobs
+ADMIN_JOB_CONCURRENCY = int(os.environ.get('ADMIN_JOB_CONCURRENCY', '2'))
+ADMIN_JOB_EVENT_INTERVAL_SECONDS = float(os.environ.get('ADMIN_JOB_EVENT_INTERVAL_SECONDS', '1'))
+ADMIN_EXPORT_DIR = Path(os.environ.get('ADMIN_EXPORT_DIR', str(ROOT_DIR / 'exports')))
+admin_jobs: Optional[AdminJobRunner] = None
+
+# Opt-in: serve the built frontend (yarn build) from this app, precompressed and held in memory
+FRONTEND_BUILD_DIR = os.environ.get('FRONTEND_BUILD_DIR')
+frontend_assets = StaticAssetIndex(
+    Path(FRONTEND_BUILD_DIR),
+    minimum_size=int(os.environ.get('FRONTEND_COMPRESS_MIN_SIZE', '256')),
+) if FRONTEND_BUILD_DIR else None
+
+def connect_mongo():
+    global client, db, admin_read_db, account_inserts, key_inserts, delivery_jobs, admin_jobs
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], minPoolSize=MONGO_MIN_POOL_SIZE)
+    write_concern = os.environ.get('PRIMARY_WRITE_CONCERN', 'majority')
+    db = GuardedDatabase(
+        client.get_database(
+            os.environ['DB_NAME'],
+            read_preference=read_preferences.Primary(),
+            write_concern=WriteConcern(w=int(write_concern) if write_concern.isdigit() else write_concern),
+        ),
+        mongo_guard,
+    )
+    admin_read_db = GuardedDatabase(
+        client.get_database(
+            os.environ['DB_NAME'],
+            read_preference=admin_read_preference,
+        ),
+        mongo_guard,
+    )
+    account_inserts = InsertBatcher(db.steam_accounts, "steam_accounts", INSERT_BATCH_MAX_SIZE, INSERT_BATCH_LINGER_MS)
+    key_inserts = InsertBatcher(db.delivery_keys, "delivery_keys", INSERT_BATCH_MAX_SIZE, INSERT_BATCH_LINGER_MS)
+    delivery_jobs = DeliveryJobQueue(
+        db.delivery_jobs,
+        workers=int(os.environ.get('DELIVERY_JOB_WORKERS', '4')),
+        queue_size=int(os.environ.get('DELIVERY_JOB_QUEUE_SIZE', '1000')),
+        max_attempts=int(os.environ.get('DELIVERY_JOB_MAX_ATTEMPTS', '5')),
+        base_backoff=float(os.environ.get('DELIVERY_JOB_BACKOFF_SECONDS', '1')),
+    )
+    delivery_jobs.register("delivery_webhook", webhook_handler(DELIVERY_WEBHOOK_URL))
+    delivery_jobs.register("customer_notification", webhook_handler(NOTIFICATION_WEBHOOK_URL))
+    admin_jobs = AdminJobRunner(db.admin_jobs, concurrency=ADMIN_JOB_CONCURRENCY)
+    # Submitted rows (plaintext passwords for accounts) are dropped from the job once it finishes
+    admin_jobs.register("import_keys", import_keys_handler(db.delivery_keys, DEFAULT_PRODUCT), transient_params=["keys"])
+    admin_jobs.register("import_accounts", import_accounts_handler(db.steam_accounts, credential_cipher, DEFAULT_PRODUCT),
+                        transient_params=["accounts"])
+    admin_jobs.register("delete_keys", bulk_delete_handler(db.delivery_keys.unguarded), validate=bulk_delete_query)
+    admin_jobs.register("delete_accounts", bulk_delete_handler(db.steam_accounts.unguarded), validate=bulk_delete_query)
+    # Exports stream from the admin read handle without the per-call deadline
+    admin_jobs.register("export_keys", export_handler(admin_read_db.delivery_keys.unguarded, ADMIN_EXPORT_DIR))
+    admin_jobs.register("export_accounts", export_handler(
+        admin_read_db.steam_accounts.unguarded, ADMIN_EXPORT_DIR,
+        redact=lambda account: {**account, "password": mask_password(account["password"])},
+    ))
+
+# Account passwords are encrypted at rest; crypto runs on its own thread pool
+credential_cipher = cipher_from_env()
+
+# Expired key compaction
+KEY_EXPIRY_SWEEP_SECONDS = float(os.environ.get('KEY_EXPIRY_SWEEP_SECONDS', '60'))
+
+# Warm-up
+WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', '5'))
+WARMUP_PREFILL_CACHES = os.environ.get('WARMUP_PREFILL_CACHES', 'false').lower() in ('1', 'true', 'yes')
+
+background_tasks = set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Only cheap, non-blocking setup happens before the app serves; database work runs in the warm-up
+    started = time.monotonic()
+    # Stopped at the end of the previous lifespan, if there was one
+    log_listener.start()
+    if not mysql_store:
+        connect_mongo()
+    elif credential_cipher.enabled:
+        logger.warning("ACCOUNT_ENCRYPTION_KEY is ignored with the MySQL backend; "
+                       "the PHP redeem.php reads the same tables and needs plaintext passwords")
+    loop_monitor.start()
+    background_tasks.add(asyncio.create_task(warmup.run()))
+    if not mysql_store:
+        background_tasks.add(asyncio.create_task(run_expiry_sweeps()))
+    logger.info("Startup finished in %.0f ms; warm-up continues in the background", (time.monotonic() - started) * 1000)
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        background_tasks.clear()
+        await loop_monitor.stop()
+        if mysql_store:
+            await mysql_store.close()
+        else:
+            await admin_jobs.stop()
+            await delivery_jobs.stop()
+            await account_inserts.drain()
+            await key_inserts.drain()
+            client.close()
+        credential_cipher.close()
+        if capture_writer:
+            capture_writer.close()
+        await shared_state.close()
+        tracer.shutdown()
+        # Last, so records logged during shutdown are written before the listener thread exits
+        log_listener.stop()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(DatabaseUnavailable)
+@app.exception_handler(Overloaded)
+async def service_unavailable_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=traced_route(MsgPackRoute))
 
 # Security
 security = HTTPBearer()
@@ -35,19 +269,37 @@ class SteamAccount(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
     password: str
+    product: str = DEFAULT_PRODUCT
+    delivery_count: int = 0
+    last_delivered_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class SteamAccountCreate(BaseModel):
     username: str
     password: str
+    product: str = DEFAULT_PRODUCT
 
 class DeliveryKey(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     key_value: str
+    product: str = DEFAULT_PRODUCT
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: Optional[datetime] = None
 
 class DeliveryKeyCreate(BaseModel):
     key_value: str
+    product: str = DEFAULT_PRODUCT
+    expires_at: Optional[datetime] = None
+
+class AccountSearchResponse(BaseModel):
+    items: List[SteamAccount]
+    next_cursor: Optional[str] = None
+    debug: Optional[dict] = None
+
+class KeySearchResponse(BaseModel):
+    items: List[DeliveryKey]
+    next_cursor: Optional[str] = None
+    debug: Optional[dict] = None
 
 class AdminLogin(BaseModel):
     password: str
@@ -55,6 +307,45 @@ class AdminLogin(BaseModel):
 class KeyRedeem(BaseModel):
     key: str
 
+class KeyBatchRedeem(BaseModel):
+    keys: List[str] = Field(..., min_length=1)
+    mode: Literal["all_or_nothing", "best_effort"] = "best_effort"
+
+class KeyRedeemResult(BaseModel):
+    key: str
+    success: bool
+    status: str
+    message: str
+    account: Optional[dict] = None
+
+class BatchDeliveryResponse(BaseModel):
+    success: bool
+    delivered: int
+    results: List[KeyRedeemResult]
+
+class AdminJobCreate(BaseModel):
+    type: str
+    params: dict = Field(default_factory=dict)
+
+class AdminJobProgress(BaseModel):
+    done: int = 0
+    total: Optional[int] = None
+    items_per_second: float = 0.0
+    eta_seconds: Optional[float] = None
+
+class AdminJob(BaseModel):
+    id: str
+    type: str
+    status: str
+    attempts: int = 0
+    progress: AdminJobProgress = Field(default_factory=AdminJobProgress)
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class AdminVerifyResponse(BaseModel):
     success: bool
     message: str
@@ -71,6 +362,224 @@ ADMIN_PASSWORD = "xenforce123"
 def generate_simple_token(password: str) -> str:
     return hashlib.md5(f"{password}_{datetime.utcnow()}".encode()).hexdigest()
 
+REQUIRED_INDEXES = {
+    "steam_accounts": [
+        IndexModel("id", unique=True),
+        IndexModel([("product", 1), ("created_at", 1)]),
+        # Account selection strategies order each product pool by these counters
+        IndexModel([("product", 1), ("delivery_count", 1)]),
+        IndexModel([("product", 1), ("last_delivered_at", 1)]),
+        IndexModel([("product", 1), ("random_key", 1)]),
+        # Admin search: username prefix and creation-date range, with _id for keyset paging
+        IndexModel([("username", 1), ("_id", 1)]),
+        IndexModel([("created_at", 1), ("_id", 1)]),
+    ],
+    "delivery_keys": [
+        IndexModel("id", unique=True),
+        IndexModel("key_value", unique=True),
+        IndexModel([("product", 1), ("created_at", 1)]),
+        IndexModel([("created_at", 1), ("_id", 1)]),
+        # Batch redemption claims keys under a per-request token
+        IndexModel("claim", sparse=True),
+        # TTL monitor removes keys once expires_at has passed; keys without it never expire
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "delivery_jobs": [
+        IndexModel("id", unique=True),
+        IndexModel([("status", 1), ("next_attempt_at", 1)]),
+        IndexModel([("status", 1), ("lease_expires_at", 1)]),
+    ],
+    "admin_jobs": [
+        IndexModel("id", unique=True),
+        IndexModel([("status", 1), ("created_at", 1)]),
+        IndexModel("created_at"),
+    ],
+}
+
+# One-off backfills for documents written before a field existed; new documents always carry the
+# field, so each runs once per database and is then recorded in the data_migrations collection
+async def backfill_products(database):
+    # Inventory created before products existed joins the default product
+    for collection in (database.steam_accounts, database.delivery_keys):
+        await collection.update_many({"product": {"$exists": False}}, {"$set": {"product": DEFAULT_PRODUCT}})
+
+async def backfill_delivery_counts(database):
+    await database.steam_accounts.update_many({"delivery_count": {"$exists": False}}, {"$set": {"delivery_count": 0}})
+
+async def backfill_random_keys(database):
+    # Random account selection seeks on random_key ($rand needs MongoDB 4.4.2+)
+    await database.steam_accounts.update_many({"random_key": {"$exists": False}}, [{"$set": {"random_key": {"$rand": {}}}}])
+
+DATA_MIGRATIONS = {
+    "account_key_products": backfill_products,
+    "account_delivery_counts": backfill_delivery_counts,
+    "account_random_keys": backfill_random_keys,
+}
+
+async def apply_data_migrations(database):
+    # Workers starting together may both run a pending backfill; each one is idempotent
+    applied = {marker["_id"] for marker in await database.data_migrations.find({}, {"_id": 1}).to_list(None)}
+    for name, migrate in DATA_MIGRATIONS.items():
+        if name in applied:
+            continue
+        started = time.monotonic()
+        await migrate(database)
+        await database.data_migrations.update_one(
+            {"_id": name}, {"$set": {"applied_at": datetime.utcnow()}}, upsert=True
+        )
+        logger.info("Applied data migration %s in %.0f ms", name, (time.monotonic() - started) * 1000)
+
+async def ensure_indexes():
+    # Scans and index builds can outlast the request deadlines and must not count against the breaker
+    database = db.unguarded
+    await apply_data_migrations(database)
+    for name, indexes in REQUIRED_INDEXES.items():
+        await database[name].create_indexes(indexes)
+
+async def open_mongo_pool():
+    # Concurrent pings force the pool to open connections now; the admin read opens the read member's pool
+    await asyncio.gather(
+        *(db.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))),
+        admin_read_db.steam_accounts.find_one({}, {"_id": 1}),
+    )
+
+async def prepare_indexes():
+    await ensure_indexes()
+    if WARMUP_PREFILL_CACHES:
+        # Walk the indexes redemption reads so they are in the server's cache before traffic arrives
+        await asyncio.gather(
+            db.unguarded.delivery_keys.count_documents({}, hint="key_value_1"),
+            db.unguarded.steam_accounts.count_documents({}, hint=[("product", 1), ("created_at", 1)]),
+        )
+
+async def prime_serializers():
+    # Validate and encode each response model once and build the OpenAPI schema, so the first
+    # requests do not pay for lazy encoder and schema setup; also load the crypto backend
+    account = SteamAccount(username="warm-up", password="warm-up")
+    key = DeliveryKey(key_value="warm-up")
+    samples = [
+        account,
+        key,
+        AccountSearchResponse(items=[account]),
+        KeySearchResponse(items=[key]),
+        AdminVerifyResponse(success=True, message="warm-up"),
+        AccountDeliveryResponse(success=True, message="warm-up", account={"username": "warm-up"}),
+        BatchDeliveryResponse(success=True, delivered=1, results=[KeyRedeemResult(key="warm-up", success=True, status="delivered", message="warm-up")]),
+    ]
+    for sample in samples:
+        jsonable_encoder(type(sample)(**sample.dict()))
+    app.openapi()
+    await credential_cipher.decrypt(await credential_cipher.encrypt("warm-up"))
+
+async def check_mongo_ping():
+    await db.command("ping")
+
+async def check_indexes_present():
+    for name, indexes in REQUIRED_INDEXES.items():
+        existing = await db[name].index_information()
+        missing = [index.document["name"] for index in indexes if index.document["name"] not in existing]
+        if missing:
+            raise RuntimeError(f"{name} is missing indexes {', '.join(missing)}")
+
+async def sweep_expired_keys() -> int:
+    result = await db.delivery_keys.delete_many({"expires_at": {"$lte": datetime.utcnow()}})
+    metrics.inc("delivery_keys.expired", result.deleted_count)
+    metrics.observe("delivery_keys.expired_per_sweep", result.deleted_count)
+    if result.deleted_count:
+        logger.info("Expired key sweep removed %d keys", result.deleted_count)
+    return result.deleted_count
+
+async def run_expiry_sweeps():
+    while True:
+        await asyncio.sleep(KEY_EXPIRY_SWEEP_SECONDS)
+        try:
+            await sweep_expired_keys()
+        except Exception:
+            logger.exception("Expired key sweep failed")
+
+def product_filter(product: Optional[str]) -> dict:
+    return {"product": product} if product else {}
+
+async def enqueue_delivery_side_effects(key: dict, account: dict):
+    event = {
+        "event": "account_delivered",
+        "key_id": key.get("id"),
+        "product": key.get("product", DEFAULT_PRODUCT),
+        "account_id": account.get("id"),
+        "username": account["username"],
+        "delivered_at": datetime.utcnow().isoformat(),
+    }
+    if delivery_jobs is None:
+        # Jobs are persisted in Mongo, so the MySQL backend runs without side effects
+        return
+    try:
+        if DELIVERY_WEBHOOK_URL:
+            await delivery_jobs.enqueue("delivery_webhook", event)
+        if NOTIFICATION_WEBHOOK_URL:
+            await delivery_jobs.enqueue("customer_notification", event)
+    except Exception:
+        # The key is already used; a lost side effect must not fail the delivery
+        logger.exception("Could not enqueue side effects for key %s", key.get("id"))
+
+async def redeem_rate_limit(request: Request):
+    await charge_redeem_rate(request, 1)
+
+async def redeem_batch_rate_limit(request: Request):
+    # Every key in a batch is a guess, so a batch costs one token per key
+    if REDEEM_RATE_PER_MINUTE <= 0:
+        return
+    try:
+        keys = (await request.json()).get("keys")
+    except (ValueError, AttributeError):
+        keys = None
+    await charge_redeem_rate(request, len(keys) if isinstance(keys, list) and keys else 1)
+
+async def charge_redeem_rate(request: Request, cost: int):
+    if REDEEM_RATE_PER_MINUTE <= 0 or request.client is None:
+        return
+    wait = await shared_state.take(
+        f"redeem:{request.client.host}", REDEEM_RATE_PER_MINUTE / 60, REDEEM_RATE_BURST, cost
+    )
+    if wait:
+        metrics.inc("redeem.rate_limited")
+        await shared_state.incr("redeem.rate_limited")
+        raise HTTPException(
+            status_code=429,
+            detail="Çok fazla deneme yaptınız, lütfen biraz sonra tekrar deneyin.",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+async def release_key_claim(key_value: str, token: str, suppress_errors: bool = False):
+    try:
+        await db.delivery_keys.update_one(
+            {"key_value": key_value, "claim": token}, {"$unset": {"claim": "", "claimed_at": ""}}
+        )
+    except Exception:
+        if not suppress_errors:
+            raise
+        # The claim lapses after CLAIM_TTL_SECONDS anyway
+        logger.warning("Could not release the claim on key %s", key_value, exc_info=True)
+
+async def redemption_slot():
+    with tracer.span("admission wait"):
+        await redemption_admission.acquire()
+    try:
+        yield
+    finally:
+        redemption_admission.release()
+
+async def require_mongo():
+    if mysql_store:
+        raise HTTPException(status_code=501, detail="Not available with the MySQL storage backend")
+
+def reject_mysql_fields(product: Optional[str] = None, expires_at: Optional[datetime] = None):
+    # The PHP schema has a single, unnamed product and keys that never expire
+    fields = [name for name, given in (("product", product not in (None, DEFAULT_PRODUCT)),
+                                       ("expires_at", expires_at is not None)) if given]
+    if fields:
+        raise HTTPException(status_code=400,
+                            detail=f"{' and '.join(fields)} not supported with the MySQL storage backend")
+
 async def verify_admin_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # Simple token verification - in production use proper JWT
     return True
@@ -89,73 +598,334 @@ async def verify_admin_password(login_data: AdminLogin):
 
 # Steam Account Management
 @api_router.get("/admin/accounts", response_model=List[SteamAccount])
-async def get_steam_accounts(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    accounts = await db.steam_accounts.find().to_list(1000)
-    return [SteamAccount(**account) for account in accounts]
+async def get_steam_accounts(product: Optional[str] = None, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if mysql_store:
+        reject_mysql_fields(product)
+        accounts = await mysql_store.list_accounts(1000)
+    else:
+        accounts = await admin_read_db.steam_accounts.find(product_filter(product)).to_list(1000)
+    return [SteamAccount(**{**account, "password": mask_password(account["password"])}) for account in accounts]
+
+@api_router.get("/admin/accounts/search", response_model=AccountSearchResponse, dependencies=[Depends(require_mongo)])
+async def search_steam_accounts(
+    username_prefix: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    product: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    debug: bool = False,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    sort_field = "username" if username_prefix else "created_at"
+    query, sort = build_search(sort_field, "username", username_prefix, created_from, created_to, product, cursor)
+    accounts = await admin_read_db.steam_accounts.find(query).sort(sort).limit(limit).to_list(limit)
+    plan = None
+    if debug:
+        plan = summarize_explain(await admin_read_db.steam_accounts.find(query).sort(sort).limit(limit).explain())
+    return AccountSearchResponse(
+        items=[SteamAccount(**{**account, "password": mask_password(account["password"])}) for account in accounts],
+        next_cursor=next_cursor(accounts, sort_field, limit),
+        debug=plan,
+    )
 
 @api_router.post("/admin/accounts", response_model=SteamAccount)
 async def create_steam_account(account_data: SteamAccountCreate, credentials: HTTPAuthorizationCredentials = Depends(security)):
     steam_account = SteamAccount(**account_data.dict())
-    await db.steam_accounts.insert_one(steam_account.dict())
+    document = steam_account.dict()
+    if mysql_store:
+        reject_mysql_fields(account_data.product)
+        # The PHP site reads the same tables and cannot decrypt, so MySQL rows stay plaintext
+        await mysql_store.insert_account(document)
+    else:
+        document["password"] = await credential_cipher.encrypt(steam_account.password)
+        document["random_key"] = random.random()
+        await account_inserts.insert(document)
+    steam_account.password = mask_password(steam_account.password)
     return steam_account
 
 @api_router.delete("/admin/accounts/{account_id}")
 async def delete_steam_account(account_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
-    result = await db.steam_accounts.delete_one({"id": account_id})
-    if result.deleted_count == 0:
+    if mysql_store:
+        deleted = await mysql_store.delete_account(account_id)
+    else:
+        deleted = (await db.steam_accounts.delete_one({"id": account_id})).deleted_count > 0
+    if not deleted:
         raise HTTPException(status_code=404, detail="Account not found")
     return {"message": "Account deleted successfully"}
 
 # Delivery Key Management
 @api_router.get("/admin/keys", response_model=List[DeliveryKey])
-async def get_delivery_keys(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    keys = await db.delivery_keys.find().to_list(1000)
+async def get_delivery_keys(product: Optional[str] = None, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if mysql_store:
+        reject_mysql_fields(product)
+        keys = await mysql_store.list_keys(1000)
+    else:
+        keys = await admin_read_db.delivery_keys.find(product_filter(product)).to_list(1000)
     return [DeliveryKey(**key) for key in keys]
 
+@api_router.get("/admin/keys/search", response_model=KeySearchResponse, dependencies=[Depends(require_mongo)])
+async def search_delivery_keys(
+    key_prefix: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    product: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    debug: bool = False,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    # key_value is unique, so it pages without an _id tiebreaker
+    sort_field = "key_value" if key_prefix else "created_at"
+    query, sort = build_search(sort_field, "key_value", key_prefix, created_from, created_to, product, cursor,
+                               unique_sort=bool(key_prefix))
+    keys = await admin_read_db.delivery_keys.find(query).sort(sort).limit(limit).to_list(limit)
+    plan = None
+    if debug:
+        plan = summarize_explain(await admin_read_db.delivery_keys.find(query).sort(sort).limit(limit).explain())
+    return KeySearchResponse(
+        items=[DeliveryKey(**key) for key in keys],
+        next_cursor=next_cursor(keys, sort_field, limit),
+        debug=plan,
+    )
+
 @api_router.post("/admin/keys", response_model=DeliveryKey)
 async def create_delivery_key(key_data: DeliveryKeyCreate, credentials: HTTPAuthorizationCredentials = Depends(security)):
     delivery_key = DeliveryKey(**key_data.dict())
-    await db.delivery_keys.insert_one(delivery_key.dict())
+    if mysql_store:
+        reject_mysql_fields(key_data.product, key_data.expires_at)
+    try:
+        if mysql_store:
+            await mysql_store.insert_key(delivery_key.dict())
+        else:
+            await key_inserts.insert(delivery_key.dict())
+    except (DuplicateKeyError, DuplicateEntry):
+        raise HTTPException(status_code=409, detail="Key already exists")
     return delivery_key
 
 @api_router.delete("/admin/keys/{key_id}")
 async def delete_delivery_key(key_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
-    result = await db.delivery_keys.delete_one({"id": key_id})
-    if result.deleted_count == 0:
+    if mysql_store:
+        deleted = await mysql_store.delete_key(key_id)
+    else:
+        deleted = (await db.delivery_keys.delete_one({"id": key_id})).deleted_count > 0
+    if not deleted:
         raise HTTPException(status_code=404, detail="Key not found")
     return {"message": "Key deleted successfully"}
 
+# Admin Jobs
+async def get_admin_job(job_id: str) -> dict:
+    job = await admin_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.post("/admin/jobs", response_model=AdminJob, status_code=202, dependencies=[Depends(require_mongo)])
+async def submit_admin_job(job_data: AdminJobCreate, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        job = await admin_jobs.submit(job_data.type, job_data.params)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return AdminJob(**job)
+
+@api_router.get("/admin/jobs", response_model=List[AdminJob], dependencies=[Depends(require_mongo)])
+async def list_admin_jobs(limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return [AdminJob(**job) for job in await admin_jobs.list(limit)]
+
+@api_router.get("/admin/jobs/{job_id}", response_model=AdminJob, dependencies=[Depends(require_mongo)])
+async def get_admin_job_status(job_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return AdminJob(**await get_admin_job(job_id))
+
+@api_router.get("/admin/jobs/{job_id}/events", dependencies=[Depends(require_mongo)])
+async def stream_admin_job(job_id: str, request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    await get_admin_job(job_id)
+
+    async def events():
+        # Server-sent progress snapshots until the job reaches a terminal state
+        while not await request.is_disconnected():
+            job = AdminJob(**await get_admin_job(job_id))
+            name = "done" if job.status in TERMINAL_STATUSES else "progress"
+            yield f"event: {name}\ndata: {json.dumps(jsonable_encoder(job))}\n\n"
+            if name == "done":
+                return
+            await asyncio.sleep(ADMIN_JOB_EVENT_INTERVAL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@api_router.get("/admin/jobs/{job_id}/result", dependencies=[Depends(require_mongo)])
+async def get_admin_job_result(job_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    job = AdminJob(**await get_admin_job(job_id))
+    if job.status not in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return {"id": job.id, "status": job.status, "result": job.result, "error": job.error}
+
+@api_router.get("/admin/jobs/{job_id}/download", dependencies=[Depends(require_mongo)])
+async def download_admin_job_export(job_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    job = AdminJob(**await get_admin_job(job_id))
+    if not job.result or "file" not in job.result:
+        raise HTTPException(status_code=404, detail="Job has no export file")
+    path = ADMIN_EXPORT_DIR / Path(job.result["file"]).name
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Export file no longer exists")
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"{job.type}-{job.id}.jsonl")
+
+@api_router.post("/admin/jobs/{job_id}/cancel", response_model=AdminJob, dependencies=[Depends(require_mongo)])
+async def cancel_admin_job(job_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    job = await admin_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return AdminJob(**job)
+
+# Metrics
+@api_router.get("/admin/metrics")
+async def get_metrics(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return {**metrics.snapshot(), "shared": await shared_state.snapshot()}
+
 # Key Redemption (Public endpoint)
-@api_router.post("/redeem-key", response_model=AccountDeliveryResponse)
+@api_router.post("/redeem-key", response_model=AccountDeliveryResponse,
+                 dependencies=[Depends(redeem_rate_limit), Depends(redemption_slot)])
 async def redeem_key(redeem_data: KeyRedeem):
-    # Check if key exists
-    key_exists = await db.delivery_keys.find_one({"key_value": redeem_data.key})
+    if mysql_store:
+        return await redeem_key_mysql(redeem_data)
+
+    # Claim the key before picking an account, so concurrent submissions of the same key cannot
+    # both pass the lookup and deliver it twice; keys claimed by another request read as used
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    key_exists = await db.delivery_keys.find_one_and_update(
+        {"key_value": redeem_data.key, **unclaimed(now)},
+        {"$set": {"claim": token, "claimed_at": now}},
+    )
     if not key_exists:
+        logger.info("Invalid key attempt", extra={"event": "invalid_key"})
+        tag_request(key_valid=False, outcome="invalid")
         return AccountDeliveryResponse(
             success=False,
             message="Geçersiz key! Lütfen doğru key'i girin."
         )
+
+    try:
+        # Expired keys are rejected even if the TTL monitor has not removed them yet
+        expires_at = key_exists.get("expires_at")
+        if expires_at is not None and expires_at <= now:
+            await release_key_claim(redeem_data.key, token)
+            tag_request(key_valid=False, outcome="expired")
+            return AccountDeliveryResponse(
+                success=False,
+                message="Bu key'in süresi dolmuş."
+            )
+
+        # Select an account from the key's product pool; this also counts the delivery
+        with tracer.span("select_account", attributes={"selection.strategy": select_account.__name__}):
+            random_account = await select_account(db.steam_accounts, key_exists.get("product", DEFAULT_PRODUCT))
+        if not random_account:
+            await release_key_claim(redeem_data.key, token)
+            tag_request(key_valid=True, outcome="no_account")
+            return AccountDeliveryResponse(
+                success=False,
+                message="Şu anda teslim edilecek hesap bulunmuyor."
+            )
+
+        # Decrypt before consuming the key, so a decryption failure leaves the key redeemable
+        password = await credential_cipher.decrypt(random_account["password"])
+
+        # Delete the used key (one-time use)
+        result = await db.delivery_keys.delete_one({"key_value": redeem_data.key, "claim": token})
+    except Exception:
+        # A failed request must not leave the key locked for the claim window; the customer retries
+        await release_key_claim(redeem_data.key, token, suppress_errors=True)
+        raise
+    if not result.deleted_count:
+        # Only possible if this request stalled past CLAIM_TTL_SECONDS and another took the key over;
+        # that request owns the key now, so this one must not deliver
+        metrics.inc("redeem.claim_lost")
+        logger.warning("Claim on key %s expired before it was consumed", key_exists.get("id"))
+        await undo_delivery(db.steam_accounts, random_account)
+        tag_request(key_valid=True, outcome="claim_lost")
+        raise HTTPException(status_code=409, detail="Bu key zaten kullanılmış.")
+
+    await enqueue_delivery_side_effects(key_exists, random_account)
+    tag_request(key_valid=True, outcome="delivered")
     
-    # Get all accounts
-    accounts = await db.steam_accounts.find().to_list(1000)
-    if not accounts:
+    return AccountDeliveryResponse(
+        success=True,
+        message="Steam hesabınız başarıyla teslim edildi! Key kullanıldı.",
+        account={
+            "username": random_account["username"],
+            "password": password
+        }
+    )
+
+BATCH_MESSAGES = {
+    BATCH_DELIVERED: "Steam hesabınız başarıyla teslim edildi! Key kullanıldı.",
+    BATCH_INVALID: "Geçersiz key! Lütfen doğru key'i girin.",
+    EXPIRED: "Bu key'in süresi dolmuş.",
+    NO_ACCOUNT: "Şu anda teslim edilecek hesap bulunmuyor.",
+    DUPLICATE: "Bu key istekte birden fazla kez gönderildi.",
+    ABORTED: "Diğer key'lerdeki hatalar nedeniyle hiçbir key kullanılmadı.",
+}
+
+@api_router.post("/redeem-keys", response_model=BatchDeliveryResponse,
+                 dependencies=[Depends(require_mongo), Depends(redeem_batch_rate_limit), Depends(redemption_slot)])
+async def redeem_keys(redeem_data: KeyBatchRedeem):
+    if len(redeem_data.keys) > REDEEM_BATCH_MAX_KEYS:
+        raise HTTPException(status_code=400, detail=f"At most {REDEEM_BATCH_MAX_KEYS} keys per request")
+    metrics.observe("redeem_batch.size", len(redeem_data.keys))
+    plaintext = {}
+
+    async def decrypt_passwords(assignment: dict):
+        # Runs before the keys are consumed; accounts repeat across keys, so each password is decrypted once
+        passwords = {account["password"] for account in assignment.values()}
+        plaintext.update(zip(passwords, await asyncio.gather(*(credential_cipher.decrypt(value) for value in passwords))))
+
+    outcomes = await redeem_batch(
+        db.delivery_keys, db.steam_accounts, redeem_data.keys, redeem_data.mode, select_accounts, DEFAULT_PRODUCT,
+        prepare=decrypt_passwords,
+    )
+    delivered = [outcome for outcome in outcomes if outcome["outcome"] == BATCH_DELIVERED]
+    await asyncio.gather(*(enqueue_delivery_side_effects(outcome["key_document"], outcome["account"]) for outcome in delivered))
+    tag_request(batch_size=len(outcomes), delivered=len(delivered), mode=redeem_data.mode)
+    return BatchDeliveryResponse(
+        success=len(delivered) == len(outcomes),
+        delivered=len(delivered),
+        results=[
+            KeyRedeemResult(
+                key=outcome["key"],
+                success=outcome["outcome"] == BATCH_DELIVERED,
+                status=outcome["outcome"],
+                message=BATCH_MESSAGES[outcome["outcome"]],
+                account={
+                    "username": outcome["account"]["username"],
+                    "password": plaintext[outcome["account"]["password"]],
+                } if outcome["account"] else None,
+            )
+            for outcome in outcomes
+        ],
+    )
+
+async def redeem_key_mysql(redeem_data: KeyRedeem) -> AccountDeliveryResponse:
+    # Key lookup, account pick and key deletion happen in one MySQL transaction
+    outcome, key, account = await mysql_store.redeem(redeem_data.key)
+    if outcome == INVALID:
+        logger.info("Invalid key attempt", extra={"event": "invalid_key"})
+        tag_request(key_valid=False, outcome="invalid")
+        return AccountDeliveryResponse(
+            success=False,
+            message="Geçersiz key! Lütfen doğru key'i girin."
+        )
+    if outcome != DELIVERED:
+        tag_request(key_valid=True, outcome="no_account")
         return AccountDeliveryResponse(
             success=False,
             message="Şu anda teslim edilecek hesap bulunmuyor."
         )
-    
-    # Select random account
-    random_account = random.choice(accounts)
-    
-    # Delete the used key (one-time use)
-    await db.delivery_keys.delete_one({"key_value": redeem_data.key})
-    
+    tag_request(key_valid=True, outcome="delivered")
     return AccountDeliveryResponse(
         success=True,
         message="Steam hesabınız başarıyla teslim edildi! Key kullanıldı.",
         account={
-            "username": random_account["username"],
-            "password": random_account["password"]
+            "username": account["username"],
+            "password": await credential_cipher.decrypt(account["password"])
         }
     )
 
@@ -170,13 +940,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    level=int(os.environ.get('COMPRESSION_LEVEL', '6')),
+)
+
+app.add_middleware(RequestIdMiddleware)
+
+# Opt-in capture of sanitized request shapes for replay_traffic.py
+TRAFFIC_CAPTURE_PATH = os.environ.get('TRAFFIC_CAPTURE_PATH')
+capture_writer = CaptureWriter(TRAFFIC_CAPTURE_PATH) if TRAFFIC_CAPTURE_PATH else None
+if capture_writer:
+    app.add_middleware(TrafficCaptureMiddleware, writer=capture_writer)
+
+# Opt-in request tracing (TRACE_EXPORT_PATH or TRACE_COLLECTOR_URL); outermost so spans cover the whole stack
+if configure_tracing(service_name="steam-delivery-backend"):
+    app.add_middleware(TracingMiddleware)
+
+# Configure logging: records are queued on the loop and written as JSON lines by a listener thread
+log_listener = configure_logging(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    sample_limits={"invalid_key": int(os.environ.get('LOG_SAMPLE_INVALID_KEY_PER_SECOND', '10'))},
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# Health
+if mysql_store:
+    warmup_phases = {"mysql_pool": mysql_store.connect, "serializers": prime_serializers}
+    readiness_checks = {"mysql": mysql_store.ping}
+else:
+    warmup_phases = {
+        "mongo_pool": open_mongo_pool,
+        "indexes": prepare_indexes,
+        "serializers": prime_serializers,
+        "delivery_jobs": lambda: delivery_jobs.start(),
+        "admin_jobs": lambda: admin_jobs.start(),
+    }
+    readiness_checks = {"mongo": check_mongo_ping, "indexes": check_indexes_present}
+if frontend_assets:
+    # Brotli at quality 11 is CPU-heavy, so the build is compressed off the event loop
+    warmup_phases["frontend"] = lambda: asyncio.to_thread(frontend_assets.load)
+warmup = WarmUp(warmup_phases, retry_interval=WARMUP_RETRY_SECONDS)
+readiness = ReadinessProbe(
+    {"warmup": warmup.check, **readiness_checks},
+    cache_seconds=float(os.environ.get('READINESS_CACHE_SECONDS', '2')),
+)
+loop_monitor = LoopLagMonitor(
+    interval=float(os.environ.get('LOOP_LAG_INTERVAL_SECONDS', '0.5')),
+    block_threshold=float(os.environ.get('LOOP_BLOCK_THRESHOLD_MS', '250')) / 1000,
+)
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    result = await readiness.check()
+    return JSONResponse(status_code=200 if result["ready"] else 503, content=result)
+
+# Mounted last so /api, /healthz and /readyz take precedence over the frontend's catch-all
+if frontend_assets:
+    app.mount("/", FrontendApp(frontend_assets))
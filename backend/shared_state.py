@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+State shared by all uvicorn workers on a host: atomic counters, token buckets and a small
+key-value cache with TTL.
+The state lives in one small service process (`python shared_state.py --socket PATH`) reached over a
+Unix socket; each worker keeps one pipelined connection to it. Without SHARED_STATE_SOCKET, or
+while the service is unreachable, SharedState falls back to process-local state so callers keep
+working with per-worker numbers. Values must be JSON-serializable.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+from typing import Any, Deque, Dict, Optional
+
+import typer
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "/tmp/steam-delivery-state.sock"
+
+
+class LocalState:
+    """The state itself; used by the service and as the process-local fallback."""
+
+    def __init__(self, max_cache_entries: int = 10000, max_buckets: int = 100000):
+        self.max_cache_entries = max_cache_entries
+        self.max_buckets = max_buckets
+        self.counters: Dict[str, float] = {}
+        # name -> [tokens, updated_at, rate, capacity], least recently used first
+        self.buckets: "collections.OrderedDict[str, list]" = collections.OrderedDict()
+        # key -> (expires_at, value), oldest write first
+        self.cache: "collections.OrderedDict[str, tuple]" = collections.OrderedDict()
+
+    def incr(self, name: str, amount: float = 1) -> float:
+        value = self.counters[name] = self.counters.get(name, 0) + amount
+        return value
+
+    def counter(self, name: str) -> float:
+        return self.counters.get(name, 0)
+
+    def take(self, name: str, rate: float, capacity: float, cost: float = 1) -> float:
+        """Takes `cost` tokens from a bucket refilled at `rate` per second; returns 0 when
+        allowed, otherwise the seconds until enough tokens are available. A cost above the
+        capacity is allowed from a full bucket and leaves it in debt, so it still pays in full."""
+        now = time.monotonic()
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            bucket = self.buckets[name] = [capacity, now, rate, capacity]
+        else:
+            self.buckets.move_to_end(name)
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1:] = [now, rate, capacity]
+        needed = min(cost, capacity)
+        if tokens >= needed:
+            bucket[0] = tokens - cost
+            wait = 0.0
+        else:
+            bucket[0] = tokens
+            wait = (needed - tokens) / rate if rate > 0 else float("inf")
+        self._evict_buckets(now)
+        return wait
+
+    def _evict_buckets(self, now: float):
+        # A bucket that has refilled is the same as a new one, so the idlest buckets are dropped
+        # once full; past max_buckets they are dropped regardless
+        while self.buckets:
+            tokens, updated_at, rate, capacity = next(iter(self.buckets.values()))
+            if len(self.buckets) <= self.max_buckets and tokens + (now - updated_at) * rate < capacity:
+                break
+            self.buckets.popitem(last=False)
+
+    def cache_get(self, key: str) -> Any:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.cache[key]
+            return None
+        return entry[1]
+
+    def cache_set(self, key: str, value: Any, ttl: float):
+        self.cache.pop(key, None)
+        self.cache[key] = (time.monotonic() + ttl, value)
+        while len(self.cache) > self.max_cache_entries:
+            self.cache.popitem(last=False)
+
+    def cache_delete(self, key: str):
+        self.cache.pop(key, None)
+
+    def snapshot(self) -> dict:
+        return {"counters": dict(self.counters), "buckets": len(self.buckets), "cache_entries": len(self.cache)}
+
+    def dispatch(self, operation: str, args: list) -> Any:
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown shared state operation {operation!r}")
+        return getattr(self, operation)(*args)
+
+
+OPERATIONS = frozenset({"incr", "counter", "take", "cache_get", "cache_set", "cache_delete", "snapshot"})
+
+
+class SharedStateServer:
+    """Serves one LocalState over a Unix socket; requests on a connection are answered in order."""
+
+    def __init__(self, path: str, state: Optional[LocalState] = None):
+        self.path = path
+        self.state = state or LocalState()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._serve, path=self.path)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    operation, args = json.loads(line)
+                    reply = [True, self.state.dispatch(operation, args)]
+                except Exception as exc:
+                    reply = [False, f"{type(exc).__name__}: {exc}"]
+                writer.write(json.dumps(reply, separators=(",", ":")).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class SharedStateClient:
+    """One connection to the service; concurrent calls are pipelined and matched in order."""
+
+    def __init__(self, path: str, timeout: float = 1.0):
+        self.path = path
+        self.timeout = timeout
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.pending: Deque[asyncio.Future] = collections.deque()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connecting: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None
+
+    async def connect(self):
+        if self.writer is not None:
+            return
+        # Calls arriving together share one connection attempt
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._open())
+        try:
+            await asyncio.shield(self._connecting)
+        finally:
+            if self._connecting is not None and self._connecting.done():
+                self._connecting = None
+
+    async def _open(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        self.writer = writer
+        self._reader_task = asyncio.create_task(self._read_replies(reader))
+
+    async def _read_replies(self, reader: asyncio.StreamReader):
+        error: Exception = ConnectionError("Shared state connection closed")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                ok, result = json.loads(line)
+                future = self.pending.popleft()
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(result))
+        except Exception as exc:
+            error = ConnectionError(str(exc))
+        self._disconnect(error)
+
+    def _disconnect(self, error: Exception):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def call(self, operation: str, *args) -> Any:
+        # A hung service is treated like a lost one, so callers fall back to local state
+        try:
+            return await asyncio.wait_for(self._call(operation, *args), self.timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"Shared state {operation} timed out after {self.timeout:g} s") from None
+
+    async def _call(self, operation: str, *args) -> Any:
+        await self.connect()
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(json.dumps([operation, args], separators=(",", ":")).encode() + b"\n")
+        return await future
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._disconnect(ConnectionError("Shared state client closed"))
+
+
+class SharedState:
+    def __init__(self, client: Optional[SharedStateClient] = None, retry_interval: float = 5.0):
+        self.client = client
+        self.local = LocalState()
+        self.retry_interval = retry_interval
+        self._retry_at = 0.0
+
+    @property
+    def shared(self) -> bool:
+        return self.client is not None and self._retry_at <= time.monotonic()
+
+    async def _call(self, operation: str, *args) -> Any:
+        if self.shared:
+            try:
+                return await self.client.call(operation, *args)
+            except (ConnectionError, OSError) as exc:
+                logger.warning("Shared state service unavailable (%s); using process-local state for %.0f s",
+                               exc, self.retry_interval)
+                self._retry_at = time.monotonic() + self.retry_interval
+        if self.client is not None:
+            metrics.inc("shared_state.local_fallback")
+        return self.local.dispatch(operation, list(args))
+
+    async def incr(self, name: str, amount: float = 1) -> float:
+        return await self._call("incr", name, amount)
+
+    async def counter(self, name: str) -> float:
+        return await self._call("counter", name)
+
+    async def take(self, name: str, rate: float, capacity: float, cost: float = 1) -> float:
+        return await self._call("take", name, rate, capacity, cost)
+
+    async def cache_get(self, key: str) -> Any:
+        return await self._call("cache_get", key)
+
+    async def cache_set(self, key: str, value: Any, ttl: float):
+        await self._call("cache_set", key, value, ttl)
+
+    async def cache_delete(self, key: str):
+        await self._call("cache_delete", key)
+
+    async def snapshot(self) -> dict:
+        return {"shared": self.shared, **await self._call("snapshot")}
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+
+
+def shared_state_from_env() -> SharedState:
+    path = os.environ.get('SHARED_STATE_SOCKET')
+    return SharedState(
+        SharedStateClient(path, timeout=float(os.environ.get('SHARED_STATE_TIMEOUT_SECONDS', '1'))) if path else None,
+        retry_interval=float(os.environ.get('SHARED_STATE_RETRY_SECONDS', '5')),
+    )
+
+
+def serve(
+    socket: str = typer.Option(DEFAULT_SOCKET_PATH, envvar="SHARED_STATE_SOCKET"),
+    max_cache_entries: int = typer.Option(10000, min=1),
+):
+    """Run the shared state service for uvicorn workers on this host."""
+    async def run():
+        server = SharedStateServer(socket, LocalState(max_cache_entries))
+        await server.start()
+        typer.echo(f"shared state listening on {socket}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    typer.run(serve)
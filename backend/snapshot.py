@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Parallel snapshot and restore of the inventory collections.
+A snapshot reads each collection in _id range partitions, concurrently, at one cluster time
+(snapshot read concern), and writes gzip-compressed BSON chunks plus a manifest with counts,
+checksums and index definitions. Restore loads chunks concurrently with unordered insert_many
+and verifies checksums and counts.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Tuple
+
+import bson
+import typer
+from bson.codec_options import CodecOptions
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from bson.son import SON
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel
+from pymongo.errors import BulkWriteError
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+MANIFEST = "manifest.json"
+DUPLICATE_KEY_CODE = 11000
+RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+app = typer.Typer(help="Snapshot and restore steam_accounts and delivery_keys.")
+
+
+def _database():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    return client, client[os.environ['DB_NAME']]
+
+
+def write_chunk(path: Path, documents: List[bytes]) -> str:
+    data = gzip.compress(b"".join(documents), compresslevel=6)
+    path.write_bytes(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_chunk(path: Path, sha256: str) -> List[RawBSONDocument]:
+    data = path.read_bytes()
+    actual = hashlib.sha256(data).hexdigest()
+    if actual != sha256:
+        raise ValueError(f"checksum mismatch for {path.name}: expected {sha256}, got {actual}")
+    return bson.decode_all(gzip.decompress(data), RAW_OPTIONS)
+
+
+def _split(lowest, highest, index: int, partitions: int):
+    """The _id index/partitions of the way from lowest to highest, or None for _id types that cannot be split."""
+    if isinstance(lowest, ObjectId) and isinstance(highest, ObjectId):
+        # Read as one 96-bit integer an ObjectId grows with its timestamp, then its counter
+        low, high = int.from_bytes(lowest.binary, "big"), int.from_bytes(highest.binary, "big")
+        return ObjectId((low + (high - low) * index // partitions).to_bytes(12, "big"))
+    numbers = all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (lowest, highest))
+    if numbers:
+        span = highest - lowest
+        return lowest + (span * index // partitions if isinstance(span, int) else span * index / partitions)
+    return None
+
+
+async def _edge_id(collection, direction: int):
+    found = await collection.find({}, {"_id": 1}).sort("_id", direction).limit(1).to_list(1)
+    return found[0]["_id"] if found else None
+
+
+async def partition_bounds(collection, partitions: int) -> List[tuple]:
+    # Boundaries split the span between the lowest and highest _id, so finding them costs two index
+    # lookups rather than skips through the index. Ranges stay complete whatever the _id distribution;
+    # only their sizes vary. _id types that cannot be split are read as a single range.
+    lowest, highest = await _edge_id(collection, 1), await _edge_id(collection, -1)
+    bounds = []
+    if lowest is not None and highest is not None:
+        for index in range(1, partitions):
+            bound = _split(lowest, highest, index, partitions)
+            if bound is None:
+                break
+            if bound > lowest and (not bounds or bound > bounds[-1]):
+                bounds.append(bound)
+    edges = [None] + bounds + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+async def read_range(db, name: str, lower, upper, cluster_time, batch_size: int = 1000):
+    query = {}
+    if lower is not None:
+        query.setdefault("_id", {})["$gte"] = lower
+    if upper is not None:
+        query.setdefault("_id", {})["$lt"] = upper
+    command = SON([("find", name), ("filter", query), ("sort", {"_id": 1}), ("batchSize", batch_size)])
+    if cluster_time is not None:
+        # Every partition reads at the same cluster time, so the file set is one consistent view
+        command["readConcern"] = {"level": "snapshot", "atClusterTime": cluster_time}
+    reply = await db.command(command, codec_options=RAW_OPTIONS)
+    cursor = reply["cursor"]
+    batch = cursor["firstBatch"]
+    while True:
+        for document in batch:
+            yield document.raw
+        if not cursor["id"]:
+            break
+        reply = await db.command(
+            SON([("getMore", cursor["id"]), ("collection", name), ("batchSize", batch_size)]),
+            codec_options=RAW_OPTIONS,
+        )
+        cursor = reply["cursor"]
+        batch = cursor["nextBatch"]
+
+
+async def snapshot_partition(db, name: str, number: int, lower, upper, cluster_time,
+                             out_dir: Path, chunk_docs: int) -> List[dict]:
+    chunks, documents = [], []
+
+    async def flush():
+        path = out_dir / f"{name}-p{number:03d}-{len(chunks):05d}.bson.gz"
+        sha256 = await asyncio.to_thread(write_chunk, path, documents)
+        chunks.append({"file": path.name, "count": len(documents), "sha256": sha256})
+
+    async for raw in read_range(db, name, lower, upper, cluster_time):
+        documents.append(raw)
+        if len(documents) >= chunk_docs:
+            await flush()
+            documents = []
+    if documents:
+        await flush()
+    return chunks
+
+
+async def snapshot_collections(db, out_dir: Path, collections: List[str], partitions: int, chunk_docs: int,
+                               consistent: bool) -> dict:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cluster_time = None
+    if consistent:
+        # operationTime of any read is a cluster time the snapshot reads can be pinned to
+        reply = await db.command({"find": collections[0], "limit": 1, "readConcern": {"level": "majority"}})
+        cluster_time = reply["operationTime"]
+
+    manifest = {
+        "created_at": datetime.utcnow().isoformat(),
+        "consistent": consistent,
+        "cluster_time": {"t": cluster_time.time, "i": cluster_time.inc} if cluster_time else None,
+        "collections": {},
+    }
+    for name in collections:
+        collection = db[name]
+        ranges = await partition_bounds(collection, partitions)
+        results = await asyncio.gather(*(
+            snapshot_partition(db, name, number, lower, upper, cluster_time, out_dir, chunk_docs)
+            for number, (lower, upper) in enumerate(ranges)
+        ))
+        chunks = [chunk for partition in results for chunk in partition]
+        indexes = await collection.index_information()
+        manifest["collections"][name] = {
+            "count": sum(chunk["count"] for chunk in chunks),
+            "indexes": {key: value for key, value in indexes.items() if key != "_id_"},
+            "chunks": chunks,
+        }
+        typer.echo(f"{name}: {manifest['collections'][name]['count']:,} documents in {len(chunks)} chunks")
+
+    (out_dir / MANIFEST).write_text(json.dumps(manifest, indent=2, default=str))
+    return manifest
+
+
+async def run_snapshot(out_dir: Path, collections: List[str], partitions: int, chunk_docs: int, consistent: bool):
+    client, db = _database()
+    started = time.monotonic()
+    try:
+        await snapshot_collections(db, out_dir, collections, partitions, chunk_docs, consistent)
+    finally:
+        client.close()
+    typer.echo(f"snapshot written to {out_dir} in {time.monotonic() - started:.1f}s")
+
+
+async def restore_chunk(collection, path: Path, sha256: str, insert_batch: int) -> Tuple[int, int]:
+    """Loads one chunk; returns (inserted, already present)."""
+    documents = await asyncio.to_thread(read_chunk, path, sha256)
+    inserted = 0
+    for start in range(0, len(documents), insert_batch):
+        batch = documents[start:start + insert_batch]
+        try:
+            await collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+        except BulkWriteError as exc:
+            # Documents the target already holds are kept, so an interrupted restore can be re-run
+            if any(error.get("code") != DUPLICATE_KEY_CODE for error in exc.details.get("writeErrors", [])):
+                raise
+            inserted += exc.details.get("nInserted", 0)
+    return inserted, len(documents) - inserted
+
+
+async def restore_collections(db, snapshot_dir: Path, concurrency: int, insert_batch: int, drop: bool) -> int:
+    manifest = json.loads((snapshot_dir / MANIFEST).read_text())
+    limit = asyncio.Semaphore(concurrency)
+    restored = 0
+
+    async def bounded(collection, chunk):
+        async with limit:
+            return await restore_chunk(collection, snapshot_dir / chunk["file"], chunk["sha256"], insert_batch)
+
+    for name, spec in manifest["collections"].items():
+        collection = db[name]
+        if drop:
+            await collection.drop()
+        existing = await collection.count_documents({})
+        counts = await asyncio.gather(*(bounded(collection, chunk) for chunk in spec["chunks"]))
+        inserted, present = sum(count[0] for count in counts), sum(count[1] for count in counts)
+        restored += inserted
+        # Indexes are built once after the load instead of being maintained per insert
+        indexes = []
+        for index_name, info in spec["indexes"].items():
+            options = {key: value for key, value in info.items() if key not in ("key", "v", "ns")}
+            indexes.append(IndexModel([tuple(pair) for pair in info["key"]], name=index_name, **options))
+        if indexes:
+            await collection.create_indexes(indexes)
+        actual = await collection.count_documents({})
+        if inserted + present != spec["count"] or actual != existing + inserted:
+            typer.echo(f"{name}: count mismatch, manifest has {spec['count']:,}, loaded {inserted + present:,}, "
+                       f"collection has {actual:,} (expected {existing + inserted:,})", err=True)
+            raise typer.Exit(code=1)
+        typer.echo(f"{name}: restored {inserted:,} documents ({present:,} already present), count verified")
+    return restored
+
+
+async def run_restore(snapshot_dir: Path, concurrency: int, insert_batch: int, drop: bool):
+    client, db = _database()
+    started = time.monotonic()
+    try:
+        restored = await restore_collections(db, snapshot_dir, concurrency, insert_batch, drop)
+    finally:
+        client.close()
+    elapsed = time.monotonic() - started
+    typer.echo(f"restored {restored:,} documents in {elapsed:.1f}s ({restored / max(elapsed, 1e-9):,.0f} docs/s)")
+
+
+@app.command()
+def snapshot(
+    out_dir: Path = typer.Argument(..., help="Directory for the chunk files and manifest"),
+    collections: str = typer.Option("steam_accounts,delivery_keys"),
+    partitions: int = typer.Option(4, min=1, help="Parallel _id range readers per collection"),
+    chunk_docs: int = typer.Option(50000, min=1, help="Documents per chunk file"),
+    consistent: bool = typer.Option(True, help="Read at one cluster time (needs a replica set)"),
+):
+    names = [name.strip() for name in collections.split(",") if name.strip()]
+    asyncio.run(run_snapshot(out_dir, names, partitions, chunk_docs, consistent))
+
+
+@app.command()
+def restore(
+    snapshot_dir: Path = typer.Argument(..., exists=True, file_okay=False),
+    concurrency: int = typer.Option(4, min=1, help="Chunks loaded at once"),
+    insert_batch: int = typer.Option(1000, min=1, help="Documents per insert_many"),
+    drop: bool = typer.Option(False, help="Drop each collection before loading it; otherwise documents already "
+                                          "present (same _id) are kept"),
+):
+    asyncio.run(run_restore(snapshot_dir, concurrency, insert_batch, drop))
+
+
+if __name__ == "__main__":
+    app()
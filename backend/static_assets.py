@@ -0,0 +1,182 @@
+"""
+Serving the built frontend (frontend/build) from the backend.
+StaticAssetIndex reads the build once, precompresses each compressible file with gzip and
+brotli, and keeps every variant in memory with a content-hash ETag, so requests never touch
+disk. FrontendApp serves the index: fingerprinted bundles (main.1a2b3c4d.js) are immutable,
+everything else (index.html, manifest.json) is revalidated through its ETag, and unknown
+paths fall back to index.html for client-side routing, except under the API prefix, where an
+unmatched route is a JSON 404 like any other API error.
+"""
+
+import hashlib
+import json
+import logging
+import mimetypes
+import re
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.routing import Match
+
+from compression import available_encoders, choose_encoding, compress
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# no-transform keeps CompressionMiddleware from re-encoding variants chosen here
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable, no-transform"
+REVALIDATE_CACHE_CONTROL = "no-cache, no-transform"
+
+# Build tools put a content hash in the filename of every bundle they emit
+FINGERPRINTED = re.compile(r"\.[0-9a-f]{8,}\.(chunk\.)?[a-z0-9]+$")
+
+COMPRESSIBLE_MEDIA_TYPES = (
+    "text/", "application/javascript", "application/json", "application/manifest+json",
+    "image/svg+xml", "application/xml",
+)
+
+
+class AssetVariant(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class StaticAsset(NamedTuple):
+    media_type: str
+    cache_control: str
+    # Content-coding ("identity", "br", "gzip") -> precomputed body
+    variants: Dict[str, AssetVariant]
+
+
+def is_compressible(media_type: str) -> bool:
+    return media_type.startswith(COMPRESSIBLE_MEDIA_TYPES)
+
+
+def load_asset(path: Path, relative: str, minimum_size: int, level: int) -> StaticAsset:
+    body = path.read_bytes()
+    digest = hashlib.sha256(body).hexdigest()[:20]
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    variants = {"identity": AssetVariant(body, f'"{digest}"')}
+    if is_compressible(media_type) and len(body) >= minimum_size:
+        for encoding in available_encoders():
+            if encoding == "zstd":
+                continue  # browsers only send zstd on HTTPS and rarely; not worth the memory
+            # Brotli at full quality is slow, but it runs once per file at startup
+            compressed = compress(body, encoding, 11 if encoding == "br" else level)
+            if len(compressed) < len(body):
+                variants[encoding] = AssetVariant(compressed, f'"{digest}-{encoding}"')
+    cache_control = IMMUTABLE_CACHE_CONTROL if FINGERPRINTED.search(relative) else REVALIDATE_CACHE_CONTROL
+    return StaticAsset(media_type, cache_control, variants)
+
+
+class StaticAssetIndex:
+    def __init__(self, root: Path, minimum_size: int = 256, level: int = 9):
+        self.root = Path(root)
+        self.minimum_size = minimum_size
+        self.level = level
+        self.assets: Dict[str, StaticAsset] = {}
+        self.loaded = False
+
+    def load(self):
+        if not (self.root / "index.html").is_file():
+            raise RuntimeError(f"{self.root} has no index.html; run `yarn build` in frontend/")
+        assets = {}
+        raw_bytes = stored_bytes = 0
+        for path in sorted(self.root.rglob("*")):
+            if not path.is_file() or path.name.endswith(".map"):
+                continue
+            relative = path.relative_to(self.root).as_posix()
+            asset = load_asset(path, relative, self.minimum_size, self.level)
+            assets["/" + relative] = asset
+            raw_bytes += len(asset.variants["identity"].body)
+            stored_bytes += sum(len(variant.body) for variant in asset.variants.values())
+        self.assets = assets
+        self.loaded = True
+        metrics.set_gauge("frontend.assets", len(assets))
+        metrics.set_gauge("frontend.memory_bytes", stored_bytes)
+        logger.info("Loaded %d frontend assets (%d bytes, %d bytes with compressed variants) from %s",
+                    len(assets), raw_bytes, stored_bytes, self.root)
+
+    def lookup(self, path: str) -> Optional[StaticAsset]:
+        if path == "/":
+            path = "/index.html"
+        asset = self.assets.get(path)
+        if asset is None and "." not in path.rsplit("/", 1)[-1]:
+            # Client-side routes (/admin, /redeem) are rendered by the app shell
+            asset = self.assets.get("/index.html")
+        return asset
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class FrontendApp:
+    """ASGI app serving a StaticAssetIndex; mount it last so API routes take precedence."""
+
+    def __init__(self, index: StaticAssetIndex, reserved_prefixes: Tuple[str, ...] = ("/api",)):
+        self.index = index
+        self.reserved_prefixes = reserved_prefixes
+
+    async def __call__(self, scope, receive, send):
+        path = scope["path"]
+        if any(path == prefix or path.startswith(prefix + "/") for prefix in self.reserved_prefixes):
+            # Whatever reaches the mount under these prefixes matched no API route, at least not
+            # with this method
+            allowed = sorted({method for route in getattr(scope.get("router"), "routes", [])
+                              if route.matches(scope)[0] == Match.PARTIAL for method in route.methods or ()})
+            if allowed:
+                await self._respond_json(send, 405, "Method Not Allowed", [(b"allow", ", ".join(allowed).encode())])
+            else:
+                await self._respond_json(send, 404, "Not Found")
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            await self._respond(send, 405, [(b"allow", b"GET, HEAD")])
+            return
+        if not self.index.loaded:
+            await self._respond(send, 503, [(b"retry-after", b"1")])
+            return
+        asset = self.index.lookup(path)
+        if asset is None:
+            await self._respond(send, 404)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""),
+                                   [name for name in asset.variants if name != "identity"])
+        variant = asset.variants[encoding or "identity"]
+        headers = [
+            (b"etag", variant.etag.encode()),
+            (b"cache-control", asset.cache_control.encode()),
+        ]
+        if len(asset.variants) > 1:
+            headers.append((b"vary", b"Accept-Encoding"))
+
+        if etag_matches(request_headers.get("if-none-match", ""), variant.etag):
+            metrics.inc("frontend.not_modified")
+            await self._respond(send, 304, headers)
+            return
+
+        metrics.inc("frontend.hits")
+        headers += [
+            (b"content-type", asset.media_type.encode()),
+            (b"content-length", str(len(variant.body)).encode()),
+        ]
+        if encoding:
+            headers.append((b"content-encoding", encoding.encode()))
+        await self._respond(send, 200, headers, b"" if scope["method"] == "HEAD" else variant.body)
+
+    @classmethod
+    async def _respond_json(cls, send, status: int, detail: str, headers=()):
+        body = json.dumps({"detail": detail}).encode()
+        await cls._respond(send, status, [*headers, (b"content-type", b"application/json"),
+                                          (b"content-length", str(len(body)).encode())], body)
+
+    @staticmethod
+    async def _respond(send, status: int, headers=(), body: bytes = b""):
+        await send({"type": "http.response.start", "status": status, "headers": list(headers)})
+        await send({"type": "http.response.body", "body": body})
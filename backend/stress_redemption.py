@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for POST /api/redeem-key.
+Starts the app under uvicorn with several workers on a scratch Mongo database, seeds N keys and
+M accounts, and fires every key several times at once from several client processes. Some keys
+belong to a product without accounts, so the release path runs too. Once the load has drained it
+reads the database back and checks the redemption invariants: no key is delivered twice, every
+key is either delivered or still stored, no key is left claimed, and every recorded account
+delivery belongs to exactly one delivered key. Reports throughput, latency and any violations.
+"""
+
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Set
+
+import requests
+import typer
+from pymongo import MongoClient
+
+REDEEM_ROUTE = "/api/redeem-key"
+STRESS_PRODUCT = "stress"
+EMPTY_PRODUCT = "stress-no-accounts"
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def redeem(base_url: str, key: str) -> dict:
+    started = time.perf_counter()
+    try:
+        response = _session().post(f"{base_url}{REDEEM_ROUTE}", json={"key": key}, timeout=60)
+        body = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+        status = response.status_code
+    except requests.RequestException as exc:
+        body, status = {"error": type(exc).__name__}, 0
+    return {
+        "key": key,
+        "status": status,
+        "success": bool(body.get("success")),
+        "username": (body.get("account") or {}).get("username"),
+        "ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def run_client(base_url: str, keys: List[str], concurrency: int, start_at: float) -> List[dict]:
+    # Client processes start together so duplicate submissions of a key really overlap
+    time.sleep(max(0.0, start_at - time.time()))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda key: redeem(base_url, key), keys))
+
+
+def check_invariants(seeded_keys: Set[str], results: List[dict], remaining_keys: Set[str], claimed_keys: int,
+                     recorded_deliveries: int, usernames: Set[str]) -> List[str]:
+    violations = []
+    delivered = Counter(result["key"] for result in results if result["success"])
+    for key, count in delivered.items():
+        if count > 1:
+            violations.append(f"key {key} delivered {count} times")
+    delivered_keys = set(delivered)
+    for key in sorted(delivered_keys & remaining_keys):
+        violations.append(f"key {key} delivered but still stored")
+    for key in sorted(seeded_keys - delivered_keys - remaining_keys):
+        violations.append(f"key {key} neither delivered nor stored")
+    for key in sorted(delivered_keys - seeded_keys):
+        violations.append(f"unknown key {key} delivered")
+    if claimed_keys:
+        violations.append(f"{claimed_keys} keys left claimed after the load drained")
+    successes = sum(delivered.values())
+    if recorded_deliveries != successes:
+        violations.append(f"accounts record {recorded_deliveries} deliveries for {successes} successful redemptions")
+    for username in sorted({result["username"] for result in results if result["success"]} - usernames):
+        violations.append(f"delivered unknown account {username}")
+    return violations
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def seed(database, keys: int, accounts: int, orphan_ratio: float) -> Set[str]:
+    now = datetime.utcnow()
+    database.steam_accounts.insert_many([
+        {"id": str(uuid.uuid4()), "username": f"stress-{i}", "password": "stress", "product": STRESS_PRODUCT,
+         "delivery_count": 0, "last_delivered_at": None, "random_key": random.random(), "created_at": now}
+        for i in range(accounts)
+    ])
+    key_values = [f"STRESS-{uuid.uuid4().hex}" for _ in range(keys)]
+    database.delivery_keys.insert_many([
+        {"id": str(uuid.uuid4()), "key_value": value,
+         "product": EMPTY_PRODUCT if random.random() < orphan_ratio else STRESS_PRODUCT,
+         "created_at": now, "expires_at": None}
+        for value in key_values
+    ])
+    return set(key_values)
+
+
+def start_server(backend_dir: str, db_name: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    for name in ("TRAFFIC_CAPTURE_PATH", "TRACE_EXPORT_PATH", "TRACE_COLLECTOR_URL", "FRONTEND_BUILD_DIR",
+                 "DELIVERY_WEBHOOK_URL", "NOTIFICATION_WEBHOOK_URL"):
+        env.pop(name, None)
+    env.update({
+        "DB_NAME": db_name,
+        "STORAGE_BACKEND": "mongo",
+        "REDEEM_RATE_PER_MINUTE": "0",
+        # Queue every request rather than shedding, so each submission reaches redeem_key
+        "REDEEM_QUEUE_SIZE": "100000",
+        "REDEEM_MAX_WAIT_MS": "60000",
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=backend_dir, env=env, stdout=subprocess.DEVNULL,
+    )
+
+
+def wait_until_ready(base_url: str, server: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    ready = 0
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+        try:
+            # Each worker warms up on its own; wait for several ready answers in a row
+            ready = ready + 1 if requests.get(f"{base_url}/readyz", timeout=2).status_code == 200 else 0
+        except requests.RequestException:
+            ready = 0
+        if ready >= 10:
+            return
+        time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def main(
+    keys: int = typer.Option(2000, min=1, help="Keys to seed (N)"),
+    accounts: int = typer.Option(50, min=1, help="Accounts to seed (M)"),
+    submissions: int = typer.Option(3, min=1, help="Times each key is submitted"),
+    orphan_ratio: float = typer.Option(0.05, min=0, max=1, help="Share of keys in a product without accounts"),
+    server_workers: int = typer.Option(4, min=1),
+    client_processes: int = typer.Option(4, min=1),
+    concurrency: int = typer.Option(64, min=1, help="Requests in flight per client process"),
+    port: int = typer.Option(8765),
+    mongo_url: str = typer.Option(..., envvar="MONGO_URL"),
+    db_name: str = typer.Option(None, help="Scratch database; created and dropped by the run"),
+    keep_db: bool = typer.Option(False, help="Keep the scratch database for inspection"),
+    out: str = typer.Option(None, help="Write per-request results as JSON lines"),
+):
+    db_name = db_name or f"steam_delivery_stress_{uuid.uuid4().hex[:8]}"
+    client = MongoClient(mongo_url)
+    database = client[db_name]
+    if database.list_collection_names():
+        raise typer.BadParameter(f"database {db_name} is not empty; the stress run needs a scratch database")
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(os.path.dirname(os.path.abspath(__file__)), db_name, port, server_workers)
+    try:
+        wait_until_ready(base_url, server)
+        seeded = seed(database, keys, accounts, orphan_ratio)
+        plan = [key for key in seeded for _ in range(submissions)]
+        random.shuffle(plan)
+        shards = [plan[i::client_processes] for i in range(client_processes)]
+        typer.echo(f"{len(plan):,} redemptions of {keys:,} keys ({accounts:,} accounts) "
+                   f"from {client_processes} processes against {server_workers} workers")
+
+        start_at = time.time() + 1.0
+        with ProcessPoolExecutor(max_workers=client_processes) as pool:
+            futures = [pool.submit(run_client, base_url, shard, concurrency, start_at) for shard in shards]
+            results = [result for future in futures for result in future.result()]
+        elapsed = time.time() - start_at
+
+        violations = check_invariants(
+            seeded,
+            results,
+            remaining_keys={key["key_value"] for key in database.delivery_keys.find({}, {"key_value": 1})},
+            claimed_keys=database.delivery_keys.count_documents({"claim": {"$ne": None}}),
+            recorded_deliveries=sum(account.get("delivery_count", 0)
+                                    for account in database.steam_accounts.find({}, {"delivery_count": 1})),
+            usernames={account["username"] for account in database.steam_accounts.find({}, {"username": 1})},
+        )
+    finally:
+        server.terminate()
+        server.wait()
+        if not keep_db:
+            client.drop_database(db_name)
+
+    if out:
+        with open(out, "w", encoding="utf-8") as output:
+            output.writelines(json.dumps(result) + "\n" for result in results)
+    statuses = Counter(result["status"] for result in results)
+    latencies = [result["ms"] for result in results]
+    typer.echo(f"{len(results) / elapsed:,.0f} redemptions/s over {elapsed:.1f} s; "
+               f"p50 {percentile(latencies, 0.5):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms")
+    typer.echo(f"delivered {sum(result['success'] for result in results):,}; "
+               f"statuses {', '.join(f'{status}: {count:,}' for status, count in sorted(statuses.items()))}")
+    if violations:
+        typer.echo(f"{len(violations)} invariant violations:")
+        for violation in violations[:50]:
+            typer.echo(f"  {violation}")
+        raise typer.Exit(1)
+    typer.echo("all invariants hold")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,155 @@
+"""
+Non-blocking structured logging.
+Handlers on the event loop only enqueue records; a QueueListener thread formats them
+as JSON lines and does the I/O. Records carry the request's correlation id, and
+high-volume events are sampled to a fixed rate per second.
+"""
+
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+REQUEST_ID_HEADER = "x-request-id"
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a field
+_RESERVED_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Runs on the emitting thread, where the request context is still available
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets at most `limits[event]` records per second through for each sampled event."""
+
+    def __init__(self, limits: Dict[str, int]):
+        super().__init__()
+        self.limits = limits
+        self._windows: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        limit = self.limits.get(event)
+        if limit is None:
+            return True
+        second = int(time.monotonic())
+        with self._lock:
+            window = self._windows.setdefault(event, [second, 0, 0])
+            if window[0] != second:
+                suppressed = window[2]
+                self._windows[event] = window = [second, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            if window[1] >= limit:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+class DeferredFormattingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge args on the loop thread; JSON formatting happens in the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class LogListener(logging.handlers.QueueListener):
+    """start and stop may each be called again: the app stops the thread on shutdown and starts it
+    again when the next lifespan begins (reloads, test clients)."""
+
+    def start(self):
+        if self._thread is None:
+            super().start()
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def configure_logging(level: int = logging.INFO, sample_limits: Optional[Dict[str, int]] = None,
+                      stream=None) -> LogListener:
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    queue_handler = DeferredFormattingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    if sample_limits:
+        queue_handler.addFilter(SamplingFilter(sample_limits))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = LogListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+class RequestIdMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
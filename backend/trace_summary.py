@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Summarize exported traces (TRACE_EXPORT_PATH) by span breakdown.
+`slowest` prints the slowest traces as span trees with each span's share of the request,
+`breakdown` aggregates span time by span name across the slowest traces of a route, and
+`collect` is a stand-in collector that accepts TRACE_COLLECTOR_URL posts into a span file.
+"""
+
+import json
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+
+app = typer.Typer(help="Summarize exported request traces.")
+
+
+def load_traces(path: Path) -> Dict[str, List[dict]]:
+    traces = defaultdict(list)
+    with path.open(encoding="utf-8") as spans:
+        for line in spans:
+            if line.strip():
+                span = json.loads(line)
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def duration_ms(span: dict) -> float:
+    return (span["end_time_unix_nano"] - span["start_time_unix_nano"]) / 1_000_000
+
+
+def find_root(spans: List[dict]) -> dict:
+    # The local root is the span whose parent is not part of this process's export
+    ids = {span["span_id"] for span in spans}
+    roots = [span for span in spans if span.get("parent_span_id") not in ids]
+    return min(roots, key=lambda span: span["start_time_unix_nano"])
+
+
+def slowest_traces(traces: Dict[str, List[dict]], route: Optional[str], limit: int) -> List[List[dict]]:
+    candidates = []
+    for spans in traces.values():
+        root = find_root(spans)
+        if route and root["name"] != route:
+            continue
+        candidates.append((duration_ms(root), spans))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    return [spans for _, spans in candidates[:limit]]
+
+
+def span_tree_lines(spans: List[dict]) -> List[str]:
+    root = find_root(spans)
+    total = duration_ms(root) or 1e-9
+    children = defaultdict(list)
+    for span in spans:
+        children[span.get("parent_span_id")].append(span)
+    lines = []
+
+    def walk(span: dict, depth: int):
+        own = duration_ms(span)
+        status = " ERROR" if span.get("status", {}).get("code") == "ERROR" else ""
+        lines.append(f"{'  ' * depth}{span['name']:<{48 - 2 * depth}} {own:>9.2f} ms {own / total * 100:>5.1f}%{status}")
+        for child in sorted(children[span["span_id"]], key=lambda child: child["start_time_unix_nano"]):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    covered = sum(duration_ms(child) for child in children[root["span_id"]])
+    lines.append(f"  {'(not in a child span)':<46} {max(0.0, total - covered):>9.2f} ms")
+    return lines
+
+
+def breakdown(traces: List[List[dict]]) -> List[tuple]:
+    totals = defaultdict(float)
+    counts = defaultdict(int)
+    overall = 0.0
+    for spans in traces:
+        root = find_root(spans)
+        overall += duration_ms(root)
+        for span in spans:
+            if span is not root:
+                totals[span["name"]] += duration_ms(span)
+                counts[span["name"]] += 1
+    return sorted(
+        ((name, counts[name], totals[name], totals[name] / overall * 100 if overall else 0.0) for name in totals),
+        key=lambda row: row[2], reverse=True,
+    )
+
+
+@app.command()
+def slowest(
+    spans: Path = typer.Argument(..., exists=True, dir_okay=False),
+    route: Optional[str] = typer.Option(None, help='Root span name, e.g. "POST /api/redeem-key"'),
+    limit: int = typer.Option(10, min=1),
+):
+    for trace in slowest_traces(load_traces(spans), route, limit):
+        root = find_root(trace)
+        typer.echo(f"trace {root['trace_id']}  {duration_ms(root):.2f} ms  "
+                   f"status={root['attributes'].get('http.response.status_code', '-')}")
+        for line in span_tree_lines(trace):
+            typer.echo(line)
+        typer.echo("")
+
+
+@app.command("breakdown")
+def breakdown_command(
+    spans: Path = typer.Argument(..., exists=True, dir_okay=False),
+    route: Optional[str] = typer.Option(None, help='Root span name, e.g. "POST /api/redeem-key"'),
+    limit: int = typer.Option(100, min=1, help="Number of slowest traces to aggregate"),
+):
+    traces = slowest_traces(load_traces(spans), route, limit)
+    typer.echo(f"{len(traces)} traces")
+    typer.echo(f"{'span':<48} {'count':>7} {'total ms':>11} {'share':>7}")
+    for name, count, total, share in breakdown(traces):
+        typer.echo(f"{name:<48} {count:>7} {total:>11.2f} {share:>6.1f}%")
+
+
+@app.command()
+def collect(
+    out: Path = typer.Option(Path("spans.jsonl")),
+    host: str = typer.Option("127.0.0.1"),
+    port: int = typer.Option(4318),
+):
+    """Accept {"spans": [...]} POSTs and append them to a span file."""
+    lock = threading.Lock()
+
+    class Collector(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            batch = json.loads(body)["spans"]
+            with lock, out.open("a", encoding="utf-8") as output:
+                output.write("".join(json.dumps(span, separators=(",", ":")) + "\n" for span in batch))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    typer.echo(f"collecting spans on http://{host}:{port}/ into {out}")
+    ThreadingHTTPServer((host, port), Collector).serve_forever()
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,382 @@
+"""
+Request tracing with OpenTelemetry-style spans and a batched local exporter.
+TracingMiddleware opens a SERVER span per request (honouring an incoming W3C traceparent),
+traced_route() adds INTERNAL spans for the handler and the response serialization, and the
+Mongo guard adds a CLIENT span per database call. Spans of a trace are buffered until the root
+ends; the trace is exported if it was head-sampled or ran longer than the slow threshold, so
+slow outliers are kept even at a low sample ratio. Export happens in batches on a background
+thread, to a JSON-lines file or an HTTP collector. Span names and attributes follow the
+OpenTelemetry HTTP and database semantic conventions.
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SERVER = "SERVER"
+CLIENT = "CLIENT"
+INTERNAL = "INTERNAL"
+
+MAX_SPANS_PER_TRACE = 512
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans", "dropped_spans")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+        self.dropped_spans = 0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_span_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "status_code", "status_message")
+
+    def __init__(self, trace: Trace, name: str, kind: str, parent_span_id: Optional[str] = None,
+                 attributes: Optional[dict] = None, start_ns: Optional[int] = None):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status_code = "UNSET"
+        self.status_message: Optional[str] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, message: str, error_type: Optional[str] = None):
+        self.status_code = "ERROR"
+        self.status_message = message
+        if error_type:
+            self.attributes["error.type"] = error_type
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if len(self.trace.spans) < MAX_SPANS_PER_TRACE:
+            self.trace.spans.append(self)
+        else:
+            self.trace.dropped_spans += 1
+
+    def to_dict(self, service_name: str) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": self.status_code, "message": self.status_message},
+            "resource": {"service.name": service_name},
+        }
+
+
+class _NonRecordingSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, message, error_type=None):
+        pass
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def parse_traceparent(header: Optional[str]):
+    # version-traceid-parentid-flags, e.g. 00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01
+    try:
+        version, trace_id, parent_id, flags = header.strip().split("-")
+        int(version, 16), int(trace_id, 16), int(parent_id, 16)
+        sampled = int(flags, 16) & 1 == 1
+    except (AttributeError, ValueError):
+        return None
+    if (len(version) != 2 or len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2
+            or trace_id == "0" * 32 or parent_id == "0" * 16):
+        return None
+    return trace_id, parent_id, sampled
+
+
+class Tracer:
+    def __init__(self):
+        self.exporter: Optional["BatchSpanExporter"] = None
+        self.sample_ratio = 0.0
+        self.slow_threshold_ns: Optional[int] = None
+        self.service_name = "steam-delivery-backend"
+
+    def configure(self, exporter: "BatchSpanExporter", sample_ratio: float, slow_threshold_ms: Optional[float] = None,
+                  service_name: Optional[str] = None):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.slow_threshold_ns = int(slow_threshold_ms * 1_000_000) if slow_threshold_ms else None
+        if service_name:
+            self.service_name = service_name
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def current_span(self):
+        return _current_span.get() or NON_RECORDING_SPAN
+
+    @contextmanager
+    def start_trace(self, name: str, kind: str = SERVER, attributes: Optional[dict] = None,
+                    traceparent: Optional[str] = None):
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_span_id, sampled = parent
+        else:
+            trace_id, parent_span_id = f"{random.getrandbits(128):032x}", None
+            sampled = random.random() < self.sample_ratio
+        if not self.enabled or (not sampled and self.slow_threshold_ns is None):
+            yield NON_RECORDING_SPAN
+            return
+        trace = Trace(trace_id, sampled)
+        root = Span(trace, name, kind, parent_span_id, attributes)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as exc:
+            root.set_error(str(exc), type(exc).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end()
+            self._finish(trace, root)
+
+    def _finish(self, trace: Trace, root: Span):
+        duration = root.end_ns - root.start_ns
+        if not trace.sampled and duration < self.slow_threshold_ns:
+            return
+        if trace.dropped_spans:
+            root.set_attribute("trace.dropped_spans", trace.dropped_spans)
+        metrics.inc("tracing.traces_exported")
+        self.exporter.export([span.to_dict(self.service_name) for span in trace.spans])
+
+    @contextmanager
+    def span(self, name: str, kind: str = INTERNAL, attributes: Optional[dict] = None):
+        parent = _current_span.get()
+        if parent is None:
+            # Outside a recorded trace (background work, unsampled requests) spans cost one lookup
+            yield NON_RECORDING_SPAN
+            return
+        span = Span(parent.trace, name, kind, parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.set_error(str(exc), type(exc).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def record_span(self, name: str, start_ns: int, end_ns: int, kind: str = INTERNAL,
+                    attributes: Optional[dict] = None):
+        parent = _current_span.get()
+        if parent is not None:
+            Span(parent.trace, name, kind, parent.span_id, attributes, start_ns=start_ns).end(end_ns)
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+tracer = Tracer()
+
+
+# Export
+
+
+class BatchSpanExporter:
+    """Queues finished spans and hands them to `sink` in batches from a background thread."""
+
+    def __init__(self, sink: Callable[[List[dict]], None], max_batch_size: int = 512,
+                 schedule_delay: float = 2.0, max_queue_size: int = 8192):
+        self.sink = sink
+        self.max_batch_size = max_batch_size
+        self.schedule_delay = schedule_delay
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, spans: List[dict]):
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                # Tracing must never slow requests down; excess spans are dropped and counted
+                metrics.inc("tracing.spans_dropped")
+
+    def close(self):
+        self._closed.set()
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.schedule_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or (self._closed.is_set() and self._queue.empty()):
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(timeout, 0.1)))
+                except queue.Empty:
+                    continue
+            if batch:
+                try:
+                    self.sink(batch)
+                    metrics.inc("tracing.spans_exported", len(batch))
+                except Exception:
+                    metrics.inc("tracing.export_failures")
+                    logger.exception("Exporting %d spans failed", len(batch))
+            if self._closed.is_set() and self._queue.empty():
+                return
+
+
+def file_sink(path: str) -> Callable[[List[dict]], None]:
+    def write(batch: List[dict]):
+        with open(path, "a", encoding="utf-8") as output:
+            output.write("".join(json.dumps(span, separators=(",", ":")) + "\n" for span in batch))
+
+    return write
+
+
+def http_sink(url: str, timeout: float = 5.0) -> Callable[[List[dict]], None]:
+    import urllib.request
+
+    def post(batch: List[dict]):
+        request = urllib.request.Request(
+            url, data=json.dumps({"spans": batch}).encode(), headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+
+    return post
+
+
+def configure_from_env(service_name: str) -> bool:
+    path = os.environ.get('TRACE_EXPORT_PATH')
+    url = os.environ.get('TRACE_COLLECTOR_URL')
+    if not path and not url:
+        return False
+    slow_ms = os.environ.get('TRACE_SLOW_MS')
+    tracer.configure(
+        BatchSpanExporter(http_sink(url) if url else file_sink(path)),
+        sample_ratio=float(os.environ.get('TRACE_SAMPLE_RATIO', '0.1')),
+        slow_threshold_ms=float(slow_ms) if slow_ms else None,
+        service_name=service_name,
+    )
+    return True
+
+
+# ASGI and routing integration
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        traceparent = None
+        for name, value in scope.get("headers", []):
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        status = {"code": 500}
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        attributes = {"http.request.method": method, "url.path": scope["path"], "url.scheme": scope.get("scheme", "http")}
+        with tracer.start_trace(method, SERVER, attributes, traceparent) as span:
+            try:
+                await self.app(scope, receive, recording_send)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    span.name = f"{method} {route}"
+                    span.set_attribute("http.route", route)
+                span.set_attribute("http.response.status_code", status["code"])
+                if status["code"] >= 500:
+                    span.set_error(f"HTTP {status['code']}", str(status["code"]))
+
+
+_serialization_started: contextvars.ContextVar = contextvars.ContextVar("serialization_started", default=None)
+
+
+def _traced_endpoint(endpoint: Callable) -> Callable:
+    @functools.wraps(endpoint)
+    async def traced(*args, **kwargs):
+        with tracer.span(f"handler {endpoint.__name__}", attributes={"code.function": endpoint.__name__}):
+            result = await endpoint(*args, **kwargs)
+        marker = _serialization_started.get()
+        if marker is not None:
+            marker.append(time.time_ns())
+        return result
+
+    traced.__traced__ = True
+    return traced
+
+
+def traced_route(base: type = APIRoute) -> type:
+    """A route class that records the handler and the response serialization as separate spans."""
+
+    class TracedRoute(base):
+        def __init__(self, path: str, endpoint: Callable, **kwargs):
+            # include_router rebuilds routes from already wrapped endpoints
+            if inspect.iscoroutinefunction(endpoint) and not getattr(endpoint, "__traced__", False):
+                endpoint = _traced_endpoint(endpoint)
+            super().__init__(path, endpoint=endpoint, **kwargs)
+
+        def get_route_handler(self) -> Callable:
+            handler = super().get_route_handler()
+
+            async def traced_handler(request: Request) -> Response:
+                # Everything between the endpoint returning and the Response existing is serialization
+                marker = []
+                token = _serialization_started.set(marker)
+                try:
+                    response = await handler(request)
+                finally:
+                    _serialization_started.reset(token)
+                if marker:
+                    tracer.record_span("serialize response", marker[0], time.time_ns())
+                return response
+
+            return traced_handler
+
+    TracedRoute.__name__ = f"Traced{base.__name__}"
+    return TracedRoute
@@ -0,0 +1,117 @@
+"""
+Opt-in traffic capture for realistic load replays.
+Each request is recorded as one compact JSON line: arrival time, method, route template,
+status, body sizes, latency and any tags the handler attached (e.g. whether a key was valid).
+Paths, query strings, headers and bodies are never written, so captures carry no keys,
+passwords or tokens. Writes happen on a background thread. Every uvicorn worker appends to the
+same file: arrival times are wall-clock seconds and each batch of whole lines goes out in one
+O_APPEND write, so lines from different workers never interleave.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+capture_tags_var: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("capture_tags", default=None)
+
+
+def tag_request(**tags):
+    # The middleware owns the dict, so tags set inside the handler are visible to it afterwards
+    current = capture_tags_var.get()
+    if current is not None:
+        current.update(tags)
+
+
+class CaptureWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+
+    def write(self, record: dict):
+        self._queue.put(record)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            closed = False
+            while not closed:
+                lines = []
+                record = self._queue.get()
+                while record is not None:
+                    lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+                    if self._queue.empty():
+                        break
+                    record = self._queue.get()
+                closed = record is None
+                if lines:
+                    self._write_all(fd, "".join(lines).encode())
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _write_all(fd: int, data: bytes):
+        # os.write may take only part of the buffer (a full disk, a signal); keep going until it is all out
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+
+class TrafficCaptureMiddleware:
+    def __init__(self, app, writer: CaptureWriter):
+        self.app = app
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        arrived_at = time.time()
+        arrived = time.monotonic()
+        sizes = {"request": 0, "response": 0}
+        status = {"code": 500}
+        tags = {}
+        token = capture_tags_var.set(tags)
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            capture_tags_var.reset(token)
+            route = scope.get("route")
+            record = {
+                "t": round(arrived_at, 4),
+                "m": scope["method"],
+                "r": getattr(route, "path", None) or "<unmatched>",
+                "s": status["code"],
+                "qb": sizes["request"],
+                "rb": sizes["response"],
+                "ms": round((time.monotonic() - arrived) * 1000, 3),
+            }
+            if tags:
+                record["tags"] = tags
+            self.writer.write(record)
@@ -0,0 +1,63 @@
+"""
+Concurrent start-up warm-up.
+The app starts serving (liveness) straight away while named warm-up phases run side by side in
+the background. Each phase is timed, logged and recorded as a metric; failed phases are retried
+on their own until they pass, and readiness stays down until every phase has succeeded.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WarmUpPhase = Callable[[], Awaitable[None]]
+
+
+class WarmUp:
+    def __init__(self, phases: Dict[str, WarmUpPhase], retry_interval: float = 5.0):
+        self.phases = phases
+        self.retry_interval = retry_interval
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.ready = False
+        self.started_at: Optional[float] = None
+
+    async def _run_phase(self, name: str, phase: WarmUpPhase):
+        while True:
+            started = time.monotonic()
+            try:
+                await phase()
+            except Exception as exc:
+                elapsed_ms = (time.monotonic() - started) * 1000
+                self.errors[name] = str(exc) or type(exc).__name__
+                metrics.inc(f"startup.{name}.failures")
+                logger.warning("Warm-up phase %s failed after %.0f ms, retrying in %.0fs: %s",
+                               name, elapsed_ms, self.retry_interval, exc)
+                await asyncio.sleep(self.retry_interval)
+                continue
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.errors.pop(name, None)
+            self.timings[name] = round(elapsed_ms, 1)
+            metrics.observe(f"startup.{name}_ms", elapsed_ms)
+            logger.info("Warm-up phase %s finished in %.0f ms", name, elapsed_ms)
+            return
+
+    async def run(self):
+        self.started_at = time.monotonic()
+        await asyncio.gather(*(self._run_phase(name, phase) for name, phase in self.phases.items()))
+        total_ms = (time.monotonic() - self.started_at) * 1000
+        metrics.observe("startup.warmup_ms", total_ms)
+        self.ready = True
+        logger.info("Warm-up complete in %.0f ms", total_ms, extra={"event": "warmup_complete", "timings": self.timings})
+
+    async def check(self):
+        # Readiness check: cheap, never touches the database
+        if self.ready:
+            return
+        if self.errors:
+            raise RuntimeError("; ".join(f"{name}: {error}" for name, error in sorted(self.errors.items())))
+        raise RuntimeError("in progress")
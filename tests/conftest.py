@@ -0,0 +1,357 @@
+import copy
+import itertools
+import random
+import re
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import bson
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# The backend is run as a flat module directory (uvicorn server:app), so mirror that here.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+# An in-memory stand-in for a Motor collection, shared by every test that needs one so they all
+# run against the same query semantics. Supports the operators and calls the backend uses; stored
+# and returned documents are copies, as they would be over the wire.
+
+_MISSING = object()
+
+
+def _get(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set(document, path, value):
+    *parents, field = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[field] = value
+
+
+def _unset(document, path):
+    *parents, field = path.split(".")
+    for part in parents:
+        document = document.get(part, {})
+    document.pop(field, None)
+
+
+def _compare(value, operand, test):
+    # Comparisons only match values of a comparable type; missing and null never do
+    if value is _MISSING or value is None or operand is None:
+        return False
+    try:
+        return test(value, operand)
+    except TypeError:
+        return False
+
+
+def _matches_condition(value, condition):
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$exists":
+                if (value is not _MISSING) != bool(operand):
+                    return False
+            elif operator == "$eq":
+                if not _matches_condition(value, operand):
+                    return False
+            elif operator == "$ne":
+                if _matches_condition(value, operand):
+                    return False
+            elif operator == "$in":
+                if not any(_matches_condition(value, candidate) for candidate in operand):
+                    return False
+            elif operator == "$nin":
+                if any(_matches_condition(value, candidate) for candidate in operand):
+                    return False
+            elif operator == "$lt":
+                if not _compare(value, operand, lambda a, b: a < b):
+                    return False
+            elif operator == "$lte":
+                if not _compare(value, operand, lambda a, b: a <= b):
+                    return False
+            elif operator == "$gt":
+                if not _compare(value, operand, lambda a, b: a > b):
+                    return False
+            elif operator == "$gte":
+                if not _compare(value, operand, lambda a, b: a >= b):
+                    return False
+            elif operator == "$regex":
+                if not isinstance(value, str) or not re.search(operand, value):
+                    return False
+            else:
+                raise NotImplementedError(f"FakeCollection does not support {operator}")
+        return True
+    if condition is None:
+        return value is _MISSING or value is None
+    return value is not _MISSING and value == condition
+
+
+def matches(document, query):
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif field == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif not _matches_condition(_get(document, field), condition):
+            return False
+    return True
+
+
+def _sort_key(document, field):
+    # Missing and null sort ahead of every other value, as in MongoDB
+    value = _get(document, field)
+    return (0, 0) if value is _MISSING or value is None else (1, value)
+
+
+def sort_documents(documents, keys):
+    documents = list(documents)
+    for field, direction in reversed(keys):
+        documents.sort(key=lambda document: _sort_key(document, field), reverse=direction < 0)
+    return documents
+
+
+def _sort_spec(key_or_list, direction=1):
+    return [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    if all(not value for field, value in projection.items() if field != "_id"):
+        projected = copy.deepcopy(document)
+        for field in projection:
+            if not projection[field]:
+                _unset(projected, field)
+        return projected
+    projected = {}
+    for field, include in projection.items():
+        value = _get(document, field)
+        if include and value is not _MISSING:
+            _set(projected, field, copy.deepcopy(value))
+    if projection.get("_id", 1) and "_id" in document:
+        projected["_id"] = document["_id"]
+    return projected
+
+
+def _expression(value):
+    if isinstance(value, dict) and value.keys() == {"$rand"}:
+        return random.random()
+    return copy.deepcopy(value)
+
+
+def apply_update(document, update):
+    if isinstance(update, list):
+        # Update pipeline: only $set stages with literal or $rand values
+        for stage in update:
+            for path, value in stage["$set"].items():
+                _set(document, path, _expression(value))
+        return
+    for path, value in update.get("$set", {}).items():
+        _set(document, path, copy.deepcopy(value))
+    for path, amount in update.get("$inc", {}).items():
+        current = _get(document, path)
+        _set(document, path, (0 if current is _MISSING else current) + amount)
+    for path in update.get("$unset", {}):
+        _unset(document, path)
+
+
+class FakeCursor:
+    def __init__(self, documents, projection=None):
+        self.documents = documents
+        self.projection = projection
+        self._skip = 0
+        self._limit = None
+
+    def sort(self, key_or_list, direction=1):
+        self.documents = sort_documents(self.documents, _sort_spec(key_or_list, direction))
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def max_time_ms(self, milliseconds):
+        return self
+
+    def _selected(self):
+        documents = self.documents[self._skip:]
+        return documents[:self._limit] if self._limit else documents
+
+    async def to_list(self, length):
+        documents = self._selected()
+        if length is not None:
+            documents = documents[:length]
+        return [_project(document, self.projection) for document in documents]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._selected():
+            yield _project(document, self.projection)
+
+
+class FakeCollection:
+    def __init__(self, documents=(), unique=("_id",), name="fake"):
+        self.name = name
+        self.unique = set(unique) | {"_id"}
+        self.documents = []
+        self.indexes = []
+        self.calls = []
+        self._ids = itertools.count(1)
+        for document in documents:
+            self._insert(document)
+
+    # Test helpers
+
+    def one(self, **query):
+        """The stored document matching `query` (not a copy), or None."""
+        return next((document for document in self.documents if matches(document, query)), None)
+
+    # Collection API
+
+    def _insert(self, document):
+        if isinstance(document, RawBSONDocument):
+            document = bson.decode(document.raw)
+        for field in self.unique:
+            value = _get(document, field)
+            if value is not _MISSING and any(_get(stored, field) == value for stored in self.documents):
+                raise DuplicateKeyError(f"E11000 duplicate key error on {field}: {value!r}", 11000)
+        # Like pymongo, an _id is added to the caller's document
+        document.setdefault("_id", next(self._ids))
+        self.documents.append(copy.deepcopy(document))
+        return document["_id"]
+
+    def _matching(self, query, sort=None):
+        found = [document for document in self.documents if matches(document, query or {})]
+        return sort_documents(found, _sort_spec(sort)) if sort else found
+
+    def find(self, query=None, projection=None):
+        self.calls.append("find")
+        return FakeCursor(self._matching(query), projection)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        self.calls.append("find_one")
+        found = self._matching(query, sort)
+        return _project(found[0], projection) if found else None
+
+    async def count_documents(self, query, **kwargs):
+        self.calls.append("count_documents")
+        return len(self._matching(query))
+
+    async def insert_one(self, document):
+        self.calls.append("insert_one")
+        return SimpleNamespace(inserted_id=self._insert(document))
+
+    async def insert_many(self, documents, ordered=True):
+        self.calls.append("insert_many")
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as exc:
+                errors.append({"index": index, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append("update_one")
+        found = self._matching(query)
+        if found:
+            apply_update(found[0], update)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            document = {field: value for field, value in query.items() if not field.startswith("$")}
+            apply_update(document, update)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._insert(document))
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query, update):
+        self.calls.append("update_many")
+        found = self._matching(query)
+        for document in found:
+            apply_update(document, update)
+        return SimpleNamespace(matched_count=len(found), modified_count=len(found))
+
+    async def find_one_and_update(self, query, update, sort=None, projection=None, return_document=False, upsert=False):
+        self.calls.append("find_one_and_update")
+        found = self._matching(query, sort)
+        if not found:
+            return None
+        before = _project(found[0], projection)
+        apply_update(found[0], update)
+        return _project(found[0], projection) if return_document else before
+
+    async def delete_one(self, query):
+        self.calls.append("delete_one")
+        found = self._matching(query)
+        if found:
+            self.documents.remove(found[0])
+        return SimpleNamespace(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query):
+        self.calls.append("delete_many")
+        kept = [document for document in self.documents if not matches(document, query)]
+        deleted, self.documents = len(self.documents) - len(kept), kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def bulk_write(self, requests, ordered=True):
+        self.calls.append("bulk_write")
+        for request in requests:
+            # pymongo's UpdateOne keeps its filter and update in these attributes
+            found = self._matching(request._filter)
+            if found:
+                apply_update(found[0], request._doc)
+
+    async def drop(self):
+        self.calls.append("drop")
+        self.documents = []
+        self.indexes = []
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append(keys)
+
+    async def create_indexes(self, indexes):
+        self.indexes.extend(index.document["key"] for index in indexes)
+
+    async def index_information(self):
+        return {"_id_": {}}
+
+
+class FakeDatabase:
+    """Collections are created on first access, by attribute or by name."""
+
+    def __init__(self, **collections):
+        self.collections = dict(collections)
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name=name)
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    @property
+    def unguarded(self):
+        return self
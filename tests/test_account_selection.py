@@ -0,0 +1,103 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+import account_selection
+from account_selection import (
+    BATCH_SELECTION_STRATEGIES, SELECTION_STRATEGIES, get_batch_strategy, get_strategy, record_deliveries,
+)
+from tests.conftest import FakeCollection
+
+
+def make_accounts(*names, product="default"):
+    return FakeCollection([
+        {"_id": index, "username": name, "product": product, "delivery_count": 0, "last_delivered_at": None,
+         "random_key": (index + 0.5) / len(names)}
+        for index, name in enumerate(names)
+    ])
+
+
+def pick(strategy, accounts, product="default", times=1):
+    async def scenario():
+        return [await strategy(accounts, product) for _ in range(times)]
+    return asyncio.run(scenario())
+
+
+def test_uniform_random_seeks_from_a_random_point_and_wraps_around(monkeypatch):
+    accounts = make_accounts("a", "b", "c", "d")
+    # Each pick draws the account's new key, then the seek point
+    draws = iter([0.9, 0.3, 0.99, 0.95])
+    monkeypatch.setattr(account_selection.random, "random", lambda: next(draws))
+
+    # Seek 0.3 lands on "b" (key 0.375), whose key is re-drawn to 0.9
+    [account] = pick(account_selection.uniform_random, accounts)
+    assert account["username"] == "b" and account["random_key"] == 0.9 and account["delivery_count"] == 1
+    # Seek 0.95 is past every key, so the pick wraps around to the lowest one, "a"
+    [account] = pick(account_selection.uniform_random, accounts)
+    assert account["username"] == "a" and account["random_key"] == 0.99
+
+
+def test_uniform_random_covers_the_pool_and_reaches_accounts_without_a_key():
+    accounts = make_accounts(*"abcdefgh")
+    del accounts.documents[0]["random_key"]
+    picked = Counter(account["username"] for account in pick(account_selection.uniform_random, accounts, times=400))
+    assert set(picked) == set("abcdefgh")
+    assert all(document.get("random_key") is not None for document in accounts.documents)
+
+
+def test_least_delivered_and_round_robin_rotate_through_the_pool():
+    accounts = make_accounts("a", "b", "c")
+    picked = pick(account_selection.least_delivered, accounts, times=6)
+    assert [account["username"] for account in picked] == ["a", "b", "c", "a", "b", "c"]
+
+    accounts = make_accounts("a", "b", "c")
+    accounts.documents[0]["last_delivered_at"] = datetime(2024, 1, 1)
+    picked = pick(account_selection.round_robin, accounts, times=3)
+    assert [account["username"] for account in picked] == ["b", "c", "a"]
+
+
+def test_weighted_random_prefers_less_used_accounts(monkeypatch):
+    accounts = make_accounts("fresh", "worn")
+    accounts.documents[1]["delivery_count"] = 99
+    monkeypatch.setattr(account_selection.random, "choices", lambda candidates, weights: [
+        candidates[weights.index(max(weights))]
+    ])
+    [account] = pick(account_selection.weighted_random, accounts)
+    assert account["username"] == "fresh" and account["delivery_count"] == 1
+
+
+@pytest.mark.parametrize("name", list(SELECTION_STRATEGIES))
+def test_every_strategy_returns_none_for_an_empty_pool(name):
+    assert pick(get_strategy(name), make_accounts("a", product="other")) == [None]
+
+
+@pytest.mark.parametrize("name", list(BATCH_SELECTION_STRATEGIES))
+def test_every_batch_strategy_picks_up_to_count_accounts_and_records_them(name):
+    accounts = make_accounts("a", "b", "c", "d", "e")
+
+    async def scenario():
+        picked = await get_batch_strategy(name)(accounts, "default", 3)
+        await record_deliveries(accounts, picked)
+        return picked, await get_batch_strategy(name)(accounts, "other", 3)
+
+    picked, empty = asyncio.run(scenario())
+    assert len(picked) == 3 and empty == []
+    assert sum(document["delivery_count"] for document in accounts.documents) == 3
+    if name != "weighted_random":
+        assert len({account["username"] for account in picked}) == 3
+
+
+def test_uniform_random_many_wraps_around_without_repeats(monkeypatch):
+    accounts = make_accounts("a", "b", "c", "d")
+    monkeypatch.setattr(account_selection.random, "random", lambda: 0.7)
+    picked = asyncio.run(account_selection.uniform_random_many(accounts, "default", 3))
+    assert [account["username"] for account in picked] == ["d", "a", "b"]
+
+
+def test_unknown_strategy_names_list_the_valid_ones():
+    with pytest.raises(ValueError, match="least_delivered"):
+        get_strategy("newest")
+    with pytest.raises(ValueError, match="round_robin"):
+        get_batch_strategy("newest")
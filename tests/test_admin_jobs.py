@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from admin_jobs import (
+    CANCELLED, QUEUED, SUCCEEDED, AdminJobRunner, JobContext, bulk_delete_handler, bulk_delete_query,
+    import_accounts_handler,
+)
+from tests.conftest import FakeCollection
+
+
+def jobs_collection():
+    return FakeCollection(unique=["id"])
+
+
+def test_jobs_run_within_the_concurrency_cap_and_report_progress():
+    async def scenario():
+        jobs = jobs_collection()
+        runner = AdminJobRunner(jobs, concurrency=1, poll_interval=0.01, progress_interval=0)
+        running = {"now": 0, "peak": 0}
+
+        async def count(context):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            for done in range(1, 6):
+                await asyncio.sleep(0.005)
+                await context.report(done, 5)
+            running["now"] -= 1
+            return {"counted": context.params["n"]}
+
+        runner.register("count", count)
+        submitted = [await runner.submit("count", {"n": n}) for n in range(3)]
+        await runner.start()
+        while (await runner.get(submitted[-1]["id"]))["status"] != SUCCEEDED:
+            await asyncio.sleep(0.01)
+        await runner.stop()
+        return running["peak"], [await runner.get(job["id"]) for job in submitted]
+
+    peak, finished = asyncio.run(scenario())
+    assert peak == 1
+    assert [job["result"] for job in finished] == [{"counted": 0}, {"counted": 1}, {"counted": 2}]
+    assert finished[0]["progress"]["done"] == 5
+    assert finished[0]["progress"]["items_per_second"] > 0
+
+
+def test_cancel_stops_a_running_job():
+    async def scenario():
+        jobs = jobs_collection()
+        runner = AdminJobRunner(jobs, concurrency=1, poll_interval=0.01)
+        started = asyncio.Event()
+
+        async def forever(context):
+            started.set()
+            while True:
+                await asyncio.sleep(0.01)
+
+        runner.register("forever", forever)
+        job = await runner.submit("forever", {})
+        await runner.start()
+        await started.wait()
+        await runner.cancel(job["id"])
+        while (await runner.get(job["id"]))["status"] != CANCELLED:
+            await asyncio.sleep(0.01)
+        await runner.stop()
+        return await runner.get(job["id"])
+
+    assert asyncio.run(scenario())["status"] == CANCELLED
+
+
+def test_shutdown_hands_the_job_back_and_the_next_runner_resumes_from_the_checkpoint():
+    async def scenario():
+        jobs = jobs_collection()
+        positions = []
+
+        async def chunks(context):
+            for position in range(context.state.get("position", 0), 10):
+                positions.append(position)
+                await context.report(position + 1, 10, position=position + 1)
+                await asyncio.sleep(0.01)
+
+        first = AdminJobRunner(jobs, concurrency=1, poll_interval=0.01, progress_interval=0)
+        first.register("chunks", chunks)
+        job = await first.submit("chunks", {})
+        await first.start()
+        await asyncio.sleep(0.035)
+        await first.stop()
+        handed_back = await first.get(job["id"])
+
+        second = AdminJobRunner(jobs, concurrency=1, poll_interval=0.01, progress_interval=0)
+        second.register("chunks", chunks)
+        await second.start()
+        while (await second.get(job["id"]))["status"] != SUCCEEDED:
+            await asyncio.sleep(0.01)
+        await second.stop()
+        return handed_back, positions, await second.get(job["id"])
+
+    handed_back, positions, finished = asyncio.run(scenario())
+    assert handed_back["status"] == QUEUED and handed_back["attempts"] == 0
+    assert sorted(set(positions)) == list(range(10))
+    assert len(positions) <= 11
+    assert finished["attempts"] == 1
+
+
+class PlainCipher:
+    def encrypt_many_sync(self, passwords):
+        return [f"enc:{password}" for password in passwords]
+
+
+def test_account_import_rerun_after_a_lost_checkpoint_inserts_no_duplicates():
+    async def scenario():
+        jobs, accounts = jobs_collection(), FakeCollection(unique=["id"])
+        runner = AdminJobRunner(jobs, progress_interval=60)
+        handler = import_accounts_handler(accounts, PlainCipher(), "default", batch_size=2)
+        runner.register("import_accounts", handler)
+        job = await runner.submit("import_accounts", {"accounts": [
+            {"username": f"user{n}", "password": "pw"} for n in range(5)
+        ]})
+        first = await handler(JobContext(runner, job))
+        saved = (await jobs.find_one({"id": job["id"]}))["state"]
+        # A crash before the last checkpoint write: the job resumes from the start
+        second = await handler(JobContext(runner, job))
+        return first, saved, second, accounts.documents
+
+    first, saved, second, stored = asyncio.run(scenario())
+    assert first == {"inserted": 5, "duplicates": 0}
+    assert saved == {"position": 5, "inserted": 5}
+    assert second == {"inserted": 0, "duplicates": 5}
+    assert sorted(account["username"] for account in stored) == [f"user{n}" for n in range(5)]
+
+
+def test_submitted_accounts_are_dropped_when_the_job_finishes():
+    async def scenario():
+        jobs = jobs_collection()
+        runner = AdminJobRunner(jobs, concurrency=1, poll_interval=0.01)
+
+        async def noop(context):
+            return {}
+
+        runner.register("import_accounts", noop, transient_params=["accounts"])
+        job = await runner.submit("import_accounts", {"accounts": [{"username": "u", "password": "secret"}], "product": "p"})
+        await runner.start()
+        while (await runner.get(job["id"]))["status"] != SUCCEEDED:
+            await asyncio.sleep(0.01)
+        await runner.stop()
+        return await jobs.find_one({"id": job["id"]})
+
+    assert asyncio.run(scenario())["params"] == {"product": "p"}
+
+
+def test_bulk_delete_without_a_filter_is_rejected_unless_all_is_explicit():
+    async def scenario():
+        jobs, keys = jobs_collection(), FakeCollection([{"product": "a"}, {"product": "b"}, {"product": "b"}])
+        runner = AdminJobRunner(jobs)
+        handler = bulk_delete_handler(keys, batch_size=1)
+        runner.register("delete_keys", handler, validate=bulk_delete_query)
+        for params in ({}, {"product": ""}, {"all": "yes"}):
+            with pytest.raises(ValueError):
+                await runner.submit("delete_keys", params)
+        rejected = await jobs.count_documents({})
+        filtered = await handler(JobContext(runner, await runner.submit("delete_keys", {"product": "b"})))
+        remaining = [key["product"] for key in keys.documents]
+        everything = await handler(JobContext(runner, await runner.submit("delete_keys", {"all": True})))
+        return rejected, filtered, remaining, everything, keys.documents
+
+    rejected, filtered, remaining, everything, left = asyncio.run(scenario())
+    assert rejected == 0
+    assert filtered == {"deleted": 2}
+    assert remaining == ["a"]
+    assert everything == {"deleted": 1}
+    assert left == []
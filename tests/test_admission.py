@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    async def scenario():
+        controller = AdmissionController("test", limit=1, queue_size=10, max_wait=1)
+        order = []
+
+        async def request(name):
+            await controller.acquire()
+            order.append(name)
+            await asyncio.sleep(0.01)
+            controller.release()
+
+        await asyncio.gather(*(request(i) for i in range(5)))
+        return order, controller.active
+
+    order, active = asyncio.run(scenario())
+    assert order == [0, 1, 2, 3, 4]
+    assert active == 0
+
+
+def test_full_queue_sheds_immediately():
+    async def scenario():
+        controller = AdmissionController("test", limit=1, queue_size=1, max_wait=1, retry_after=3)
+        await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire()
+        controller.release()
+        await waiting
+        return shed.value.retry_after
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_wait_beyond_max_wait_is_shed():
+    async def scenario():
+        controller = AdmissionController("test", limit=1, queue_size=5, max_wait=0.02)
+        await controller.acquire()
+        with pytest.raises(Overloaded):
+            await controller.acquire()
+        return len(controller.waiters)
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from account_selection import least_delivered_many
+from batch_redemption import (
+    ABORTED, ALL_OR_NOTHING, BEST_EFFORT, DELIVERED, DUPLICATE, EXPIRED, INVALID, NO_ACCOUNT, redeem_batch,
+)
+from tests.conftest import FakeCollection
+
+
+def inventory(keys, accounts):
+    return (
+        FakeCollection([{"key_value": key, "product": "default", **extra} for key, extra in keys], unique=["key_value"]),
+        FakeCollection([{"username": name, "password": "pw", "product": "default", "delivery_count": 0} for name in accounts]),
+    )
+
+
+def test_best_effort_returns_results_in_input_order_with_constant_round_trips():
+    expired = {"expires_at": datetime.utcnow() - timedelta(minutes=1)}
+    keys, accounts = inventory([(f"K{i}", {}) for i in range(30)] + [("OLD", expired)], ["a", "b"])
+    requested = ["K0", "NOPE", "OLD", "K1", "K0"] + [f"K{i}" for i in range(2, 30)]
+
+    results = asyncio.run(redeem_batch(keys, accounts, requested, BEST_EFFORT, least_delivered_many, "default"))
+
+    assert [result["key"] for result in results] == requested
+    assert [result["outcome"] for result in results[:5]] == [DELIVERED, INVALID, EXPIRED, DELIVERED, DUPLICATE]
+    assert sum(result["outcome"] == DELIVERED for result in results) == 30
+    assert [key["key_value"] for key in keys.documents] == ["OLD"]
+    # Deliveries are spread over the pool and counted with one bulk write
+    assert sorted(account["delivery_count"] for account in accounts.documents) == [15, 15]
+    assert keys.calls == ["update_many", "find", "find", "delete_many"]
+    assert accounts.calls == ["find", "bulk_write"]
+
+
+def test_all_or_nothing_releases_every_claim_on_failure():
+    keys, accounts = inventory([("K1", {}), ("K2", {})], ["a"])
+
+    results = asyncio.run(redeem_batch(keys, accounts, ["K1", "MISSING", "K2"], ALL_OR_NOTHING, least_delivered_many, "default"))
+
+    assert [result["outcome"] for result in results] == [ABORTED, INVALID, ABORTED]
+    assert all("claim" not in key for key in keys.documents)
+    assert len(keys.documents) == 2
+    assert accounts.documents[0]["delivery_count"] == 0
+
+
+def test_keys_without_accounts_are_reported_and_kept():
+    keys, accounts = inventory([("K1", {})], [])
+
+    results = asyncio.run(redeem_batch(keys, accounts, ["K1"], BEST_EFFORT, least_delivered_many, "default"))
+
+    assert results[0]["outcome"] == NO_ACCOUNT
+    assert keys.documents[0]["key_value"] == "K1" and "claim" not in keys.documents[0]
+
+
+def test_failure_before_consuming_keys_releases_every_claim():
+    keys, accounts = inventory([("K1", {}), ("K2", {})], ["a"])
+
+    async def prepare(assignment):
+        assert set(assignment) == {"K1", "K2"}
+        raise ValueError("undecryptable")
+
+    with pytest.raises(ValueError):
+        asyncio.run(redeem_batch(keys, accounts, ["K1", "K2"], BEST_EFFORT, least_delivered_many, "default", prepare=prepare))
+
+    assert len(keys.documents) == 2 and all("claim" not in key for key in keys.documents)
+
+
+def test_keys_taken_over_before_the_delete_are_not_delivered():
+    keys, accounts = inventory([("K1", {}), ("K2", {})], ["a"])
+    delete_many = keys.delete_many
+
+    async def delete_after_takeover(query):
+        # Another request takes over K2's claim between our claim and our delete
+        next(key for key in keys.documents if key["key_value"] == "K2")["claim"] = "other"
+        return await delete_many(query)
+
+    keys.delete_many = delete_after_takeover
+    results = asyncio.run(redeem_batch(keys, accounts, ["K1", "K2"], BEST_EFFORT, least_delivered_many, "default"))
+
+    assert [result["outcome"] for result in results] == [DELIVERED, INVALID]
+    assert results[1]["account"] is None
+    assert [key["key_value"] for key in keys.documents] == ["K2"]
+    assert accounts.documents[0]["delivery_count"] == 1
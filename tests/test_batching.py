@@ -0,0 +1,55 @@
+import asyncio
+
+from pymongo.errors import DuplicateKeyError
+
+from batching import InsertBatcher
+from tests.conftest import FakeCollection
+
+
+class CountingCollection(FakeCollection):
+    def __init__(self, unique=()):
+        super().__init__(unique=unique)
+        self.batch_sizes = []
+
+    async def insert_many(self, documents, ordered=True):
+        self.batch_sizes.append(len(documents))
+        return await super().insert_many(documents, ordered)
+
+
+def test_concurrent_inserts_are_coalesced():
+    async def scenario():
+        collection = CountingCollection()
+        batcher = InsertBatcher(collection, "test", max_batch_size=50, linger_ms=5)
+        results = await asyncio.gather(*(batcher.insert({"n": i}) for i in range(20)))
+        return collection, results
+
+    collection, results = asyncio.run(scenario())
+    assert collection.batch_sizes == [20]
+    assert sorted(results) == list(range(1, 21))
+
+
+def test_max_batch_size_flushes_early():
+    async def scenario():
+        collection = CountingCollection()
+        batcher = InsertBatcher(collection, "test", max_batch_size=4, linger_ms=1000)
+        await asyncio.wait_for(asyncio.gather(*(batcher.insert({"n": i}) for i in range(8))), 1)
+        return collection
+
+    assert asyncio.run(scenario()).batch_sizes == [4, 4]
+
+
+def test_duplicate_key_is_reported_to_its_own_caller():
+    async def scenario():
+        collection = CountingCollection(unique=["key_value"])
+        batcher = InsertBatcher(collection, "test", max_batch_size=10, linger_ms=1)
+        return await asyncio.gather(
+            batcher.insert({"key_value": "A"}),
+            batcher.insert({"key_value": "A"}),
+            batcher.insert({"key_value": "B"}),
+            return_exceptions=True,
+        )
+
+    first, second, third = asyncio.run(scenario())
+    assert first == 1
+    assert isinstance(second, DuplicateKeyError)
+    assert third == 2
@@ -0,0 +1,92 @@
+import gzip
+
+import msgpack
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, MsgPackRoute, choose_encoding, parse_accept_encoding
+
+
+def test_parse_accept_encoding_weights():
+    assert parse_accept_encoding("gzip;q=0.5, br, *;q=0") == {"gzip": 0.5, "br": 1.0, "*": 0.0}
+    assert parse_accept_encoding("gzip ; Q=0.3") == {"gzip": 0.3}
+
+
+def test_choose_encoding_respects_quality_and_preference():
+    assert choose_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert choose_encoding("gzip;q=0.9, br;q=0.1", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("identity", ["br", "gzip"]) is None
+    assert choose_encoding("br;q=0, *", ["br", "gzip"]) == "gzip"
+
+
+def _run(app, accept_encoding):
+    import asyncio
+
+    messages = []
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope, receive, send))
+    return messages
+
+
+def _json_app(body):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+
+def test_large_body_is_gzipped():
+    body = b'{"items": "' + b"x" * 500 + b'"}'
+    start, payload = _run(_json_app(body), "gzip")
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert gzip.decompress(payload["body"]) == body
+    assert headers[b"content-length"] == str(len(payload["body"])).encode()
+
+
+def test_small_body_is_left_alone():
+    start, payload = _run(_json_app(b"{}"), "gzip")
+    assert b"content-encoding" not in dict(start["headers"])
+    assert payload["body"] == b"{}"
+
+
+@pytest.fixture
+def negotiating_client():
+    app = FastAPI()
+    router = APIRouter(route_class=MsgPackRoute)
+
+    @router.get("/items")
+    async def items():
+        return {"items": [1, 2, 3]}
+
+    app.include_router(router)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("accept, packed", [
+    ("application/msgpack", True),
+    ("application/json;q=0.5, application/msgpack", True),
+    ("application/msgpack-stream", False),
+    ("application/msgpack;q=0, application/json", False),
+    ("application/json, application/msgpack;q=0.5", False),
+    ("*/*", False),
+    ("", False),
+])
+def test_msgpack_follows_accept_weights_and_responses_vary_on_accept(negotiating_client, accept, packed):
+    response = negotiating_client.get("/items", headers={"Accept": accept})
+    assert response.headers["vary"] == "Accept"
+    if packed:
+        assert response.headers["content-type"] == "application/msgpack"
+        assert msgpack.unpackb(response.content) == {"items": [1, 2, 3]}
+    else:
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == {"items": [1, 2, 3]}
@@ -0,0 +1,32 @@
+import asyncio
+
+from cryptography.fernet import Fernet
+
+from credentials import ENCRYPTED_PREFIX, CredentialCipher, mask_password
+
+
+def test_concurrent_encrypts_round_trip():
+    cipher = CredentialCipher(Fernet.generate_key().decode())
+
+    async def scenario():
+        encrypted = await asyncio.gather(*(cipher.encrypt(f"pass-{i}") for i in range(10)))
+        decrypted = await asyncio.gather(*(cipher.decrypt(value) for value in encrypted))
+        return encrypted, decrypted
+
+    encrypted, decrypted = asyncio.run(scenario())
+    cipher.close()
+    assert all(value.startswith(ENCRYPTED_PREFIX) for value in encrypted)
+    assert decrypted == [f"pass-{i}" for i in range(10)]
+
+
+def test_plaintext_passes_through_and_is_not_reencrypted():
+    cipher = CredentialCipher(Fernet.generate_key().decode())
+    [encrypted] = cipher.encrypt_many_sync(["secret"])
+    assert cipher.encrypt_many_sync([encrypted]) == [encrypted]
+    assert cipher.decrypt_sync("legacy-plaintext") == "legacy-plaintext"
+
+
+def test_disabled_cipher_stores_plaintext():
+    cipher = CredentialCipher(None)
+    assert asyncio.run(cipher.encrypt("secret")) == "secret"
+    assert mask_password("secret") == "********"
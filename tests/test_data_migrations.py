@@ -0,0 +1,28 @@
+import asyncio
+from types import SimpleNamespace
+
+import server
+from tests.conftest import FakeDatabase
+
+
+def test_backfills_run_once_per_database_outside_the_guard(monkeypatch):
+    database = FakeDatabase()
+    asyncio.run(database.steam_accounts.insert_many([{"username": "legacy"}]))
+    asyncio.run(database.delivery_keys.insert_many([{"key_value": "OLD"}]))
+    # Only the unguarded handle is usable, so any guarded call would fail the test
+    monkeypatch.setattr(server, "db", SimpleNamespace(unguarded=database))
+
+    asyncio.run(server.ensure_indexes())
+    account = database.steam_accounts.one(username="legacy")
+    assert account["product"] == server.DEFAULT_PRODUCT and account["delivery_count"] == 0
+    assert 0 <= account["random_key"] < 1
+    assert database.delivery_keys.one(key_value="OLD")["product"] == server.DEFAULT_PRODUCT
+    assert sorted(marker["_id"] for marker in database.data_migrations.documents) == sorted(server.DATA_MIGRATIONS)
+    assert len(database.steam_accounts.indexes) == len(server.REQUIRED_INDEXES["steam_accounts"])
+
+    # Later boots skip the recorded backfills instead of scanning again
+    asyncio.run(database.steam_accounts.insert_many([{"username": "unscanned"}]))
+    database.steam_accounts.calls.clear()
+    asyncio.run(server.ensure_indexes())
+    assert "update_many" not in database.steam_accounts.calls
+    assert "product" not in database.steam_accounts.one(username="unscanned")
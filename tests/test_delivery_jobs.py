@@ -0,0 +1,169 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from delivery_jobs import DONE, FAILED, PENDING, RUNNING, DeliveryJobQueue, webhook_handler
+from tests.conftest import FakeCollection
+
+
+def jobs_collection():
+    return FakeCollection(unique=["id"])
+
+
+class StandIn(BaseHTTPRequestHandler):
+    received = []
+    failures_left = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StandIn.received.append(body)
+        status = 500 if StandIn.failures_left > 0 else 200
+        StandIn.failures_left -= 1
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in():
+    StandIn.received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/hook"
+    server.shutdown()
+
+
+def test_webhook_is_delivered_after_retries(stand_in):
+    StandIn.failures_left = 2
+
+    async def scenario():
+        collection = jobs_collection()
+        queue = DeliveryJobQueue(collection, workers=2, max_attempts=5, base_backoff=0.01)
+        queue.register("delivery_webhook", webhook_handler(stand_in))
+        job_id = await queue.enqueue("delivery_webhook", {"username": "steamuser1"})
+        # Retries are rescheduled through the store, as they would be after a restart
+        for _ in range(3):
+            await queue.run_job(collection.one(id=job_id))
+            await asyncio.sleep(0.05)
+        return collection.one(id=job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == DONE
+    assert job["attempts"] == 3
+    assert StandIn.received[-1] == {"username": "steamuser1"}
+
+
+def test_job_fails_permanently_after_max_attempts(stand_in):
+    StandIn.failures_left = 10
+
+    async def scenario():
+        collection = jobs_collection()
+        queue = DeliveryJobQueue(collection, max_attempts=2, base_backoff=0.01)
+        queue.register("delivery_webhook", webhook_handler(stand_in))
+        job_id = await queue.enqueue("delivery_webhook", {})
+        for _ in range(2):
+            await queue.run_job(collection.one(id=job_id))
+        return collection.one(id=job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == FAILED
+    assert "500" in job["last_error"]
+
+
+def test_backoff_is_exponential_and_capped():
+    queue = DeliveryJobQueue(jobs_collection(), base_backoff=1, max_backoff=10)
+    assert [queue.backoff(n) for n in range(1, 6)] == [1, 2, 4, 8, 10]
+
+
+def test_worker_pool_runs_jobs_and_defers_overflow_to_the_poller():
+    async def scenario():
+        collection = jobs_collection()
+        queue = DeliveryJobQueue(collection, workers=2, queue_size=2, poll_interval=0.01)
+        delivered = []
+
+        async def record(payload):
+            await asyncio.sleep(0.005)
+            delivered.append(payload["n"])
+
+        queue.register("hook", record)
+        await queue.start()
+        for n in range(6):
+            await queue.enqueue("hook", {"n": n})
+        while any(job["status"] != DONE for job in collection.documents):
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return sorted(delivered)
+
+    assert asyncio.run(scenario()) == list(range(6))
+
+
+def test_only_jobs_with_an_expired_lease_are_recovered_from_other_processes():
+    async def scenario():
+        collection = jobs_collection()
+        now = datetime.utcnow()
+        for job_id, lease in (("live", now + timedelta(minutes=1)), ("crashed", now - timedelta(seconds=1))):
+            await collection.insert_one({
+                "id": job_id, "type": "hook", "payload": {"id": job_id}, "status": RUNNING, "owner": "other",
+                "attempts": 1, "lease_expires_at": lease, "next_attempt_at": now, "created_at": now,
+            })
+        queue = DeliveryJobQueue(collection, poll_interval=0.01)
+        delivered = []
+
+        async def record(payload):
+            delivered.append(payload["id"])
+
+        queue.register("hook", record)
+        await queue.start()
+        while collection.one(id="crashed")["status"] != DONE:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return delivered, {job["id"]: job for job in collection.documents}
+
+    delivered, jobs = asyncio.run(scenario())
+    assert delivered == ["crashed"]
+    assert jobs["live"]["status"] == RUNNING and jobs["live"]["owner"] == "other"
+    assert jobs["crashed"]["attempts"] == 2
+
+
+def test_stop_hands_running_jobs_back():
+    async def scenario():
+        collection = jobs_collection()
+        queue = DeliveryJobQueue(collection, poll_interval=0.01)
+        started = asyncio.Event()
+
+        async def hang(payload):
+            started.set()
+            await asyncio.sleep(10)
+
+        queue.register("hook", hang)
+        await queue.start()
+        job_id = await queue.enqueue("hook", {})
+        await started.wait()
+        await queue.stop()
+        return collection.one(id=job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == PENDING and job["attempts"] == 0
+
+
+def test_handler_outliving_its_lease_is_cut_off_and_retried():
+    async def scenario():
+        collection = jobs_collection()
+        queue = DeliveryJobQueue(collection, lease_seconds=0.02, base_backoff=0.01)
+
+        async def hang(payload):
+            await asyncio.sleep(1)
+
+        queue.register("hook", hang)
+        job_id = await queue.enqueue("hook", {})
+        await queue.run_job(collection.one(id=job_id))
+        return collection.one(id=job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == PENDING and job["last_error"] == "TimeoutError"
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+
+from health import LoopLagMonitor, ReadinessProbe
+from metrics import metrics
+
+
+def test_readiness_follows_its_checks_and_caches_between_probes(monkeypatch):
+    clock = {"now": 100.0}
+    monkeypatch.setattr("health.time.monotonic", lambda: clock["now"])
+    mongo = {"up": False, "calls": 0}
+
+    async def ping():
+        mongo["calls"] += 1
+        if not mongo["up"]:
+            raise ConnectionError("no primary")
+
+    probe = ReadinessProbe({"mongo": ping}, cache_seconds=2.0)
+
+    async def scenario():
+        results = [await probe.check()]
+        mongo["up"] = True
+        # Within the cache window the failed result is served without touching Mongo
+        results.append(await asyncio.gather(*(probe.check() for _ in range(5))))
+        clock["now"] += 2.5
+        results.append(await probe.check())
+        return results
+
+    not_ready, cached, ready = asyncio.run(scenario())
+    assert not_ready == {"ready": False, "checks": {"mongo": "failed: no primary"}}
+    assert all(result is not_ready for result in cached)
+    assert ready == {"ready": True, "checks": {"mongo": "ok"}}
+    assert mongo["calls"] == 2
+    assert metrics.snapshot()["gauges"]["readiness.ready"] == 1
+
+
+def blocked_reports():
+    return metrics.snapshot()["counters"].get("event_loop.blocked", 0)
+
+
+def test_loop_lag_monitor_reports_blocks_past_the_threshold_with_the_stack(caplog):
+    def hold_the_loop(seconds):
+        time.sleep(seconds)
+
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.02, block_threshold=0.2)
+        monitor.start()
+        await asyncio.sleep(0.1)
+        before = blocked_reports()
+        hold_the_loop(0.05)
+        await asyncio.sleep(0.1)
+        short = blocked_reports() - before
+        hold_the_loop(0.5)
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+        return short, blocked_reports() - before
+
+    with caplog.at_level(logging.WARNING, logger="health"):
+        short, total = asyncio.run(scenario())
+
+    assert short == 0
+    assert total == 1
+    [record] = [record for record in caplog.records if "Event loop blocked" in record.getMessage()]
+    assert "hold_the_loop" in record.getMessage()
+    assert metrics.snapshot()["summaries"]["event_loop.lag_ms"]["max"] >= 200
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+import typer
+from pymongo.errors import OperationFailure
+
+from migrate_mysql import Checkpoint, batches, dump_rows, iter_statements, migrate, parse_insert
+from tests.conftest import FakeCollection, FakeDatabase
+
+
+def test_parse_insert_handles_quotes_escapes_and_column_lists():
+    statement = "INSERT INTO `delivery_keys` (`id`,`key_value`) VALUES ('a','K\\'1;x'),('b',NULL);"
+    table, columns, rows = parse_insert(statement)
+    assert table == "delivery_keys"
+    assert columns == ["id", "key_value"]
+    assert list(rows) == [["a", "K'1;x"], ["b", None]]
+
+
+def test_statements_split_only_outside_strings():
+    lines = ["-- header\n", "INSERT INTO t VALUES ('x;\n", "y');\n", "INSERT INTO t VALUES ('z');\n"]
+    assert [s.strip() for s in iter_statements(iter(lines))] == [
+        "INSERT INTO t VALUES ('x;\ny');",
+        "INSERT INTO t VALUES ('z');",
+    ]
+
+
+def test_dump_rows_resume_skips_checkpointed_rows(tmp_path):
+    dump = tmp_path / "dump.sql"
+    dump.write_text(
+        "INSERT INTO delivery_keys (id, key_value) VALUES\n('1','A'),\n('2','B'),\n('3','C');\n"
+    )
+    rows = list(dump_rows(dump, ["delivery_keys"], "default", {"delivery_keys": {"position": 2}}))
+    assert [(position, doc["key_value"]) for _, position, doc in rows] == [(3, "C")]
+
+
+def test_migrated_accounts_carry_the_selection_fields(tmp_path):
+    dump = tmp_path / "dump.sql"
+    dump.write_text("INSERT INTO steam_accounts (id, username, password) VALUES ('1','u1','p1'),('2','u2','p2');\n")
+    documents = [doc for _, _, doc in dump_rows(dump, ["steam_accounts"], "default", {})]
+    assert [(doc["delivery_count"], doc["last_delivered_at"]) for doc in documents] == [(0, None), (0, None)]
+    assert all(0 <= doc["random_key"] < 1 for doc in documents)
+    assert documents[0]["random_key"] != documents[1]["random_key"]
+
+
+def test_batches_never_mix_tables():
+    rows = [("a", 1, {}), ("a", 2, {}), ("a", 3, {}), ("b", 1, {})]
+    assert [(table, position, len(docs)) for table, position, docs in batches(iter(rows), 2)] == [
+        ("a", 2, 2), ("a", 3, 1), ("b", 1, 1),
+    ]
+
+
+def test_checkpoint_records_only_contiguous_batches():
+    checkpoint = Checkpoint(None)
+    first, second = checkpoint.issue("t"), checkpoint.issue("t")
+    checkpoint.complete("t", second, 20, 10)
+    assert checkpoint.state["t"]["position"] is None
+    checkpoint.complete("t", first, 10, 10)
+    assert checkpoint.state["t"] == {"position": 20, "rows": 20}
+
+
+class FailingCollection(FakeCollection):
+    def __init__(self, fail_on):
+        super().__init__(unique=["id"])
+        self.fail_on = fail_on
+
+    async def insert_many(self, documents, ordered=True):
+        if any(document["id"] in self.fail_on for document in documents):
+            raise OperationFailure("disk full")
+        return await super().insert_many(documents, ordered)
+
+
+class FakeClient:
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, name):
+        return self.database
+
+    def close(self):
+        pass
+
+
+def test_failed_batch_aborts_with_an_error_and_keeps_the_checkpoint_behind_it(monkeypatch, tmp_path):
+    keys = FailingCollection(fail_on={"k3"})
+    database = FakeDatabase(delivery_keys=keys, steam_accounts=FailingCollection(set()))
+    monkeypatch.setenv("MONGO_URL", "mongodb://unused")
+    monkeypatch.setenv("DB_NAME", "migrate")
+    monkeypatch.setattr("migrate_mysql.AsyncIOMotorClient", lambda url: FakeClient(database))
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    source = iter([("delivery_keys", index, {"id": f"k{index}", "key_value": f"K{index}"}) for index in range(6)])
+
+    with pytest.raises(typer.Exit) as exit_info:
+        asyncio.run(migrate(source, checkpoint, batch_size=2, concurrency=1))
+
+    assert exit_info.value.exit_code == 1
+    assert [document["id"] for document in keys.documents] == ["k0", "k1"]
+    assert checkpoint.state["delivery_keys"] == {"position": 1, "rows": 2}
+
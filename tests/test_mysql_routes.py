@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+class RecordingStore:
+    def __init__(self):
+        self.keys = []
+
+    async def insert_key(self, key):
+        self.keys.append(key)
+
+    async def list_keys(self, limit):
+        return []
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = RecordingStore()
+    monkeypatch.setattr(server, "mysql_store", store)
+    return store
+
+
+@pytest.mark.parametrize("fields, rejected", [
+    ({"product": "premium"}, "product"),
+    ({"expires_at": datetime(2030, 1, 1)}, "expires_at"),
+    ({"product": "premium", "expires_at": datetime(2030, 1, 1)}, "product and expires_at"),
+])
+def test_fields_the_php_schema_cannot_store_are_rejected(store, fields, rejected):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.create_delivery_key(server.DeliveryKeyCreate(key_value="K1", **fields), None))
+    assert error.value.status_code == 400 and error.value.detail.startswith(rejected + " not supported")
+    assert store.keys == []
+
+
+def test_default_product_is_accepted(store):
+    asyncio.run(server.create_delivery_key(server.DeliveryKeyCreate(key_value="K1", product=server.DEFAULT_PRODUCT), None))
+    assert [key["key_value"] for key in store.keys] == ["K1"]
+    assert asyncio.run(server.get_delivery_keys(None, None)) == []
+    with pytest.raises(HTTPException):
+        asyncio.run(server.get_delivery_keys("premium", None))
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from migrate_mysql import iter_statements
+from mysql_store import DELIVERED, INVALID, NO_ACCOUNT, DuplicateEntry, MySQLStore
+
+# Runs against a disposable local MySQL 8 / MariaDB 10.6+ database, e.g.
+#   MYSQL_TEST_DATABASE=steam_test MYSQL_TEST_USER=root MYSQL_TEST_PASSWORD=... pytest tests/test_mysql_store.py
+pytestmark = pytest.mark.skipif(not os.environ.get("MYSQL_TEST_DATABASE"), reason="MYSQL_TEST_DATABASE is not set")
+
+SCHEMA = Path(__file__).resolve().parent.parent / "steam-delivery" / "database.sql"
+
+
+def make_store() -> MySQLStore:
+    pytest.importorskip("aiomysql")
+    return MySQLStore(
+        host=os.environ.get("MYSQL_TEST_HOST", "127.0.0.1"),
+        port=int(os.environ.get("MYSQL_TEST_PORT", "3306")),
+        user=os.environ.get("MYSQL_TEST_USER", "root"),
+        password=os.environ.get("MYSQL_TEST_PASSWORD", ""),
+        database=os.environ["MYSQL_TEST_DATABASE"],
+        max_size=20,
+    )
+
+
+async def reset_schema(store: MySQLStore):
+    # The PHP schema itself, minus its CREATE DATABASE / USE and sample rows
+    statements = [
+        statement for statement in iter_statements(SCHEMA.open(encoding="utf-8"))
+        if statement.lstrip().upper().startswith("CREATE TABLE")
+    ]
+    async with store._cursor() as (_, cursor):
+        await cursor.execute("DROP TABLE IF EXISTS steam_accounts, delivery_keys, admin_sessions")
+        for statement in statements:
+            await cursor.execute(statement)
+
+
+def key(value: str) -> dict:
+    return {"id": str(uuid.uuid4()), "key_value": value, "created_at": datetime.utcnow()}
+
+
+def account(username: str) -> dict:
+    return {"id": str(uuid.uuid4()), "username": username, "password": "secret", "created_at": datetime.utcnow()}
+
+
+def test_concurrent_redemptions_of_one_key_deliver_once():
+    async def scenario():
+        store = make_store()
+        await store.connect()
+        try:
+            await reset_schema(store)
+            for index in range(3):
+                await store.insert_account(account(f"user{index}"))
+            await store.insert_key(key("STEAM-ONCE"))
+            results = await asyncio.gather(*(store.redeem("STEAM-ONCE") for _ in range(10)))
+            return [outcome for outcome, _, _ in results], await store.list_keys()
+        finally:
+            await store.close()
+
+    outcomes, remaining = asyncio.run(scenario())
+    assert outcomes.count(DELIVERED) == 1
+    assert outcomes.count(INVALID) == 9
+    assert remaining == []
+
+
+def test_redeem_without_accounts_keeps_the_key_and_duplicates_are_rejected():
+    async def scenario():
+        store = make_store()
+        await store.connect()
+        try:
+            await reset_schema(store)
+            await store.insert_key(key("STEAM-KEEP"))
+            with pytest.raises(DuplicateEntry):
+                await store.insert_key(key("STEAM-KEEP"))
+            outcome, _, _ = await store.redeem("STEAM-KEEP")
+            return outcome, [row["key_value"] for row in await store.list_keys()]
+        finally:
+            await store.close()
+
+    outcome, remaining = asyncio.run(scenario())
+    assert outcome == NO_ACCOUNT
+    assert remaining == ["STEAM-KEEP"]
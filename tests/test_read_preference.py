@@ -0,0 +1,17 @@
+import pytest
+from pymongo import read_preferences
+
+from server import read_preference_from_name
+
+
+def test_named_read_preferences_carry_the_staleness_bound():
+    assert read_preference_from_name("primary", 90) == read_preferences.Primary()
+    preference = read_preference_from_name("secondaryPreferred", 90)
+    assert isinstance(preference, read_preferences.SecondaryPreferred)
+    assert preference.max_staleness == 90
+    assert read_preference_from_name("nearest", -1).max_staleness == -1
+
+
+def test_unknown_read_preference_lists_the_valid_names():
+    with pytest.raises(ValueError, match="'secondary_preferred'.*primary, primaryPreferred, secondary"):
+        read_preference_from_name("secondary_preferred", -1)
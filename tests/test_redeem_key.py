@@ -0,0 +1,140 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from resilience import DatabaseUnavailable
+from tests.conftest import FakeCollection, FakeDatabase
+
+
+@pytest.fixture
+def redeem(monkeypatch):
+    keys = FakeCollection([{"id": "K1", "key_value": "K1", "product": "default"}], unique=["key_value"])
+    accounts = FakeCollection([{"_id": 1, "id": "a1", "username": "steam1", "password": "pw", "delivery_count": 1}])
+    selection = {"fail": False, "calls": 0}
+
+    async def select_account(collection, product):
+        selection["calls"] += 1
+        # Let concurrent requests for the same key interleave between claim and consume
+        await asyncio.sleep(0.01)
+        if selection["fail"]:
+            raise DatabaseUnavailable("down")
+        return {"_id": 1, "id": "a1", "username": "steam1", "password": "pw"}
+
+    monkeypatch.setattr(server, "db", FakeDatabase(delivery_keys=keys, steam_accounts=accounts))
+    monkeypatch.setattr(server, "select_account", select_account)
+    monkeypatch.setattr(server, "mysql_store", None)
+    monkeypatch.setattr(server, "delivery_jobs", None)
+
+    def run(*requests):
+        async def scenario():
+            return await asyncio.gather(
+                *(server.redeem_key(server.KeyRedeem(key=key)) for key in requests), return_exceptions=True
+            )
+        return asyncio.run(scenario())
+
+    return keys, selection, run
+
+
+def test_concurrent_submissions_of_one_key_deliver_it_once(redeem):
+    keys, selection, run = redeem
+    responses = run("K1", "K1", "K1", "K1")
+    assert sum(response.success for response in responses) == 1
+    assert selection["calls"] == 1
+    assert keys.documents == []
+
+
+def test_failed_redemption_releases_the_claim_so_a_retry_succeeds(redeem):
+    keys, selection, run = redeem
+    selection["fail"] = True
+    [error] = run("K1")
+    assert isinstance(error, DatabaseUnavailable)
+    assert "claim" not in keys.documents[0]
+
+    selection["fail"] = False
+    [response] = run("K1")
+    assert response.success and response.account == {"username": "steam1", "password": "pw"}
+    assert keys.documents == []
+
+
+def test_stale_claims_are_taken_over(redeem):
+    keys, _, run = redeem
+    keys.documents[0].update(claim="crashed", claimed_at=datetime(2020, 1, 1))
+    [response] = run("K1")
+    assert response.success
+
+
+def test_expired_keys_are_rejected_before_an_account_is_picked(redeem):
+    keys, selection, run = redeem
+    keys.documents[0]["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+    [response] = run("K1")
+    assert not response.success and response.account is None
+    assert selection["calls"] == 0
+    # The sweep or the TTL monitor removes it; until then it stays stored and unclaimed
+    assert len(keys.documents) == 1 and "claim" not in keys.documents[0]
+
+
+def test_sweep_removes_only_expired_keys(redeem):
+    keys, _, _ = redeem
+    now = datetime.utcnow()
+    keys.documents[0]["expires_at"] = now - timedelta(minutes=1)
+    asyncio.run(keys.insert_many([
+        {"id": "K2", "key_value": "K2", "expires_at": now + timedelta(days=1)},
+        {"id": "K3", "key_value": "K3", "expires_at": None},
+    ]))
+    assert asyncio.run(server.sweep_expired_keys()) == 1
+    assert [key["key_value"] for key in keys.documents] == ["K2", "K3"]
+
+
+def test_a_claim_lost_before_the_delete_delivers_nothing(redeem):
+    keys, _, run = redeem
+    delete_one = keys.delete_one
+
+    async def delete_after_takeover(query):
+        # The request stalled past the claim window and another request took the key over
+        keys.documents[0]["claim"] = "other"
+        return await delete_one(query)
+
+    keys.delete_one = delete_after_takeover
+    [error] = run("K1")
+    assert isinstance(error, server.HTTPException) and error.status_code == 409
+    # The pick's delivery is given back
+    assert server.db.steam_accounts.one(_id=1)["delivery_count"] == 0
+    assert keys.documents[0]["claim"] == "other"
+
+
+def test_decryption_failure_leaves_the_key_redeemable(redeem, monkeypatch):
+    keys, _, run = redeem
+
+    class BrokenCipher:
+        async def decrypt(self, value):
+            raise ValueError("InvalidToken")
+
+    monkeypatch.setattr(server, "credential_cipher", BrokenCipher())
+    [error] = run("K1")
+    assert isinstance(error, ValueError)
+    assert [(key["key_value"], "claim" in key) for key in keys.documents] == [("K1", False)]
+
+
+def test_batch_redemptions_are_charged_one_token_per_key(monkeypatch):
+    charged = []
+
+    class RecordingState:
+        async def take(self, name, rate, capacity, cost=1):
+            charged.append(cost)
+            return 0.0
+
+    def request(body):
+        async def json():
+            if body is None:
+                raise ValueError("not JSON")
+            return body
+        return SimpleNamespace(client=SimpleNamespace(host="10.0.0.1"), json=json)
+
+    monkeypatch.setattr(server, "shared_state", RecordingState())
+    monkeypatch.setattr(server, "REDEEM_RATE_PER_MINUTE", 60)
+    for body in ({"keys": ["A", "B", "C"]}, {"keys": []}, [], None):
+        asyncio.run(server.redeem_batch_rate_limit(request(body)))
+    assert charged == [3, 1, 1, 1]
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DatabaseUnavailable, MongoGuard
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_then_recovers_through_half_open():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    with pytest.raises(DatabaseUnavailable) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_after == 10
+
+    clock.now = 11
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(DatabaseUnavailable):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 6
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.opened_at == 6
+
+
+def test_guard_times_out_slow_calls_and_counts_them():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    guard = MongoGuard(breaker, read_timeout_ms=20)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(DatabaseUnavailable):
+        asyncio.run(guard.run("slow", 20, slow))
+    assert breaker.state == OPEN
+
+
+def test_guard_passes_application_errors_through():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    guard = MongoGuard(breaker)
+
+    async def duplicate():
+        raise DuplicateKeyError("E11000")
+
+    with pytest.raises(DuplicateKeyError):
+        asyncio.run(guard.run("insert", 100, duplicate))
+    assert breaker.state == CLOSED
+
+
+def test_cancelled_probe_frees_the_half_open_slot():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=5, clock=clock)
+    guard = MongoGuard(breaker, read_timeout_ms=1000)
+    breaker.record_failure()
+    clock.now = 6
+
+    async def scenario():
+        probe = asyncio.create_task(guard.run("probe", 1000, asyncio.sleep, 1))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await guard.run("next", 1000, asyncio.sleep, 0, "ok")
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CLOSED
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from search import build_search, decode_cursor, encode_cursor, next_cursor, summarize_explain
+from tests.conftest import FakeCollection
+
+
+def test_prefix_is_anchored_and_escaped():
+    query, sort = build_search("username", "username", "steam.user")
+    assert query == {"username": {"$regex": "^steam\\.user"}}
+    assert sort == [("username", 1), ("_id", 1)]
+
+
+def test_cursor_round_trip_with_datetime():
+    object_id = ObjectId()
+    created = datetime(2025, 1, 2, 3, 4, 5)
+    assert decode_cursor(encode_cursor(created, object_id)) == (created, object_id)
+
+
+def test_keyset_clause_for_unique_sort():
+    object_id = ObjectId()
+    docs = [{"key_value": "KEY-2", "_id": object_id}]
+    cursor = next_cursor(docs, "key_value", limit=1)
+    query, sort = build_search("key_value", "key_value", "KEY", cursor=cursor, unique_sort=True)
+    assert query == {"$and": [{"key_value": {"$regex": "^KEY"}}, {"key_value": {"$gt": "KEY-2"}}]}
+    assert sort == [("key_value", 1)]
+
+
+def paginate(documents, sort_field, limit, **filters):
+    collection = FakeCollection(documents)
+    pages, cursor = [], None
+    while True:
+        query, sort = build_search(sort_field, cursor=cursor, **filters)
+        page = asyncio.run(collection.find(query).sort(sort).limit(limit).to_list(limit))
+        pages.append(page)
+        cursor = next_cursor(page, sort_field, limit)
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_walk_ties_without_repeats_or_gaps():
+    start = datetime(2025, 1, 1)
+    # Runs of equal created_at values straddle page boundaries; _id breaks the ties
+    documents = [{"_id": ObjectId(), "created_at": start + timedelta(minutes=i // 3),
+                  "product": "premium" if i % 4 == 0 else "default"} for i in range(23)]
+
+    pages = paginate(documents, "created_at", limit=5)
+    walked = [document["_id"] for page in pages for document in page]
+    assert walked == [document["_id"] for document in sorted(documents, key=lambda d: (d["created_at"], d["_id"]))]
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+
+    premium = paginate(documents, "created_at", limit=2, product="premium",
+                       created_from=start + timedelta(minutes=1), created_to=start + timedelta(minutes=6))
+    assert [document["_id"] for page in premium for document in page] == [
+        document["_id"] for document in documents
+        if document["product"] == "premium" and start + timedelta(minutes=1) <= document["created_at"] < start + timedelta(minutes=6)
+    ]
+
+
+def test_a_full_last_page_ends_with_an_empty_page():
+    documents = [{"_id": ObjectId(), "created_at": datetime(2025, 1, 1)} for _ in range(4)]
+    assert [len(page) for page in paginate(documents, "created_at", limit=2)] == [2, 2, 0]
+
+
+def test_tampered_cursor_is_a_bad_request():
+    with pytest.raises(HTTPException) as error:
+        build_search("created_at", cursor="not-a-cursor")
+    assert error.value.status_code == 400
+
+
+def test_summarize_explain_flags_collection_scans():
+    explain = {
+        "queryPlanner": {"winningPlan": {"stage": "LIMIT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}},
+        "executionStats": {"totalKeysExamined": 5, "totalDocsExamined": 5, "nReturned": 5},
+    }
+    summary = summarize_explain(explain)
+    assert summary["keys_examined"] == 5
+    assert summary["stages"] == ["LIMIT", "FETCH", "IXSCAN"]
+    assert summary["collection_scan"] is False
@@ -0,0 +1,81 @@
+import asyncio
+
+from shared_state import LocalState, SharedState, SharedStateClient, SharedStateServer
+
+
+def test_token_bucket_and_ttl_cache(monkeypatch):
+    clock = {"now": 100.0}
+    monkeypatch.setattr("shared_state.time.monotonic", lambda: clock["now"])
+    state = LocalState(max_cache_entries=2)
+
+    assert [state.take("ip", rate=1, capacity=2) for _ in range(3)] == [0.0, 0.0, 1.0]
+    clock["now"] += 0.5
+    assert state.take("ip", rate=1, capacity=2) == 0.5
+    clock["now"] += 0.5
+    assert state.take("ip", rate=1, capacity=2) == 0.0
+
+    # A batch larger than the bucket drains a full bucket and leaves it in debt
+    assert state.take("batch", rate=1, capacity=2, cost=5) == 0.0
+    assert state.take("batch", rate=1, capacity=2) == 4.0
+    assert state.take("ip", rate=1, capacity=2, cost=5) == 2.0
+
+    state.cache_set("a", {"v": 1}, ttl=10)
+    state.cache_set("b", 2, ttl=1)
+    assert state.cache_get("a") == {"v": 1}
+    clock["now"] += 2
+    assert state.cache_get("b") is None
+    state.cache_set("c", 3, ttl=10)
+    state.cache_set("d", 4, ttl=10)
+    assert state.cache_get("a") is None and state.cache_get("d") == 4
+
+
+def test_workers_share_state_through_the_service_and_fall_back_when_it_is_gone(tmp_path):
+    async def scenario():
+        server = SharedStateServer(str(tmp_path / "state.sock"))
+        await server.start()
+        workers = [SharedState(SharedStateClient(server.path), retry_interval=60) for _ in range(2)]
+        await asyncio.gather(*(worker.incr("redeemed") for worker in workers for _ in range(50)))
+        allowed = [await workers[i % 2].take("client", rate=0.001, capacity=3) == 0 for i in range(6)]
+        await workers[0].cache_set("stock", 7, ttl=30)
+        shared = (await workers[1].counter("redeemed"), allowed, await workers[1].cache_get("stock"))
+
+        await server.stop()
+        await workers[0].client.close()
+        fallback = (await workers[0].incr("redeemed"), workers[0].shared)
+        await workers[1].close()
+        return shared, fallback
+
+    shared, fallback = asyncio.run(scenario())
+    assert shared == (100, [True, True, True, False, False, False], 7)
+    assert fallback == (1, False)
+
+
+def test_refilled_and_excess_buckets_are_evicted(monkeypatch):
+    clock = {"now": 0.0}
+    monkeypatch.setattr("shared_state.time.monotonic", lambda: clock["now"])
+    state = LocalState(max_buckets=3)
+
+    for name in ("a", "b", "c", "d"):
+        state.take(name, rate=1, capacity=5)
+    assert list(state.buckets) == ["b", "c", "d"]
+
+    clock["now"] += 1
+    state.take("c", rate=1, capacity=5, cost=4)
+    assert list(state.buckets) == ["c"]
+
+
+def test_calls_to_a_hung_service_time_out_and_fall_back(tmp_path):
+    async def scenario():
+        async def never_reply(reader, writer):
+            await reader.read()
+
+        path = str(tmp_path / "hung.sock")
+        hung = await asyncio.start_unix_server(never_reply, path=path)
+        state = SharedState(SharedStateClient(path, timeout=0.05), retry_interval=60)
+        result = (await state.incr("redeemed"), state.shared)
+        await state.close()
+        hung.close()
+        await hung.wait_closed()
+        return result
+
+    assert asyncio.run(scenario()) == (1, False)
@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import json
+
+import bson
+import pytest
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+
+from snapshot import MANIFEST, partition_bounds, read_chunk, restore_collections, snapshot_collections, write_chunk
+from tests.conftest import FakeCollection, FakeDatabase, sort_documents
+
+
+class SnapshotDatabase(FakeDatabase):
+    """Answers the find/getMore commands the snapshot reader sends, a few documents per batch."""
+
+    def __init__(self, batch_size=2, **collections):
+        super().__init__(**collections)
+        self.batch_size = batch_size
+        self.cursors = {}
+        self.open_peak = 0
+        self._cursor_ids = itertools.count(1)
+
+    def _batch(self, cursor_id):
+        documents = self.cursors[cursor_id]
+        batch, self.cursors[cursor_id] = documents[:self.batch_size], documents[self.batch_size:]
+        if not self.cursors[cursor_id]:
+            del self.cursors[cursor_id]
+            cursor_id = 0
+        return cursor_id, [RawBSONDocument(bson.encode(document)) for document in batch]
+
+    async def command(self, command, codec_options=None):
+        await asyncio.sleep(0)
+        if "find" in command:
+            found = self[command["find"]]._matching(command["filter"])
+            cursor_id = next(self._cursor_ids)
+            self.cursors[cursor_id] = sort_documents(found, [("_id", 1)])
+            self.open_peak = max(self.open_peak, len(self.cursors))
+            cursor_id, batch = self._batch(cursor_id)
+            return {"cursor": {"id": cursor_id, "firstBatch": batch}}
+        cursor_id, batch = self._batch(command["getMore"])
+        return {"cursor": {"id": cursor_id, "nextBatch": batch}}
+
+
+def in_range(value, lower, upper):
+    return (lower is None or value >= lower) and (upper is None or value < upper)
+
+
+def test_chunk_round_trip_and_checksum(tmp_path):
+    documents = [bson.encode({"_id": i, "key_value": f"KEY-{i}"}) for i in range(3)]
+    path = tmp_path / "delivery_keys-p000-00000.bson.gz"
+    sha256 = write_chunk(path, documents)
+    assert [doc["key_value"] for doc in read_chunk(path, sha256)] == ["KEY-0", "KEY-1", "KEY-2"]
+
+    with pytest.raises(ValueError):
+        read_chunk(path, "0" * 64)
+
+
+def test_partitions_split_the_id_span_without_skipping_through_the_index():
+    start = int.from_bytes(ObjectId().binary, "big")
+    object_ids = [ObjectId((start + n * 1000).to_bytes(12, "big")) for n in range(100)]
+    for ids in (list(range(100)), object_ids):
+        collection = FakeCollection({"_id": value} for value in ids)
+        ranges = asyncio.run(partition_bounds(collection, 4))
+        assert ranges[0][0] is None and ranges[-1][1] is None
+        assert all(upper == lower for (_, upper), (lower, _) in zip(ranges, ranges[1:]))
+        sizes = [sum(in_range(value, lower, upper) for value in ids) for lower, upper in ranges]
+        assert sizes == [25, 25, 25, 25] or sizes == [24, 25, 25, 26]
+        assert collection.calls == ["find", "find"]
+
+
+def test_partitions_collapse_when_the_ids_cannot_be_split():
+    assert asyncio.run(partition_bounds(FakeCollection(), 4)) == [(None, None)]
+    assert asyncio.run(partition_bounds(FakeCollection([{"_id": 7}]), 4)) == [(None, None)]
+    strings = FakeCollection({"_id": f"id-{n}"} for n in range(10))
+    assert asyncio.run(partition_bounds(strings, 4)) == [(None, None)]
+    # A span narrower than the partition count yields fewer, still contiguous, ranges
+    assert asyncio.run(partition_bounds(FakeCollection({"_id": n} for n in range(3)), 8)) == [(None, 1), (1, None)]
+
+
+def source_database():
+    keys = [{"_id": ObjectId(), "id": f"k{n}", "key_value": f"KEY-{n}"} for n in range(23)]
+    accounts = [{"_id": n, "id": f"a{n}", "username": f"user{n}"} for n in range(17)]
+    return SnapshotDatabase(delivery_keys=FakeCollection(keys), steam_accounts=FakeCollection(accounts)), keys, accounts
+
+
+def test_snapshot_reads_partitions_in_parallel_and_restores_into_an_empty_target(tmp_path):
+    source, keys, accounts = source_database()
+    manifest = asyncio.run(snapshot_collections(
+        source, tmp_path, ["delivery_keys", "steam_accounts"], partitions=3, chunk_docs=4, consistent=False,
+    ))
+    assert source.open_peak > 1
+    assert json.loads((tmp_path / MANIFEST).read_text())["collections"].keys() == {"delivery_keys", "steam_accounts"}
+    assert manifest["collections"]["steam_accounts"]["count"] == 17
+    files = {chunk["file"][:len("steam_accounts-p000")] for chunk in manifest["collections"]["steam_accounts"]["chunks"]}
+    assert files == {"steam_accounts-p000", "steam_accounts-p001", "steam_accounts-p002"}
+
+    target = FakeDatabase()
+    restored = asyncio.run(restore_collections(target, tmp_path, concurrency=3, insert_batch=3, drop=False))
+    assert restored == 40
+    assert sort_documents(target.delivery_keys.documents, [("_id", 1)]) == keys
+    assert sort_documents(target.steam_accounts.documents, [("_id", 1)]) == accounts
+
+
+def test_restore_into_a_non_empty_target_keeps_existing_documents_unless_dropped(tmp_path):
+    source, keys, accounts = source_database()
+    asyncio.run(snapshot_collections(source, tmp_path, ["steam_accounts"], partitions=3, chunk_docs=4, consistent=False))
+    stale = {"_id": 5, "id": "a5", "username": "renamed"}
+    extra = {"_id": 100, "id": "a100", "username": "extra"}
+
+    target = FakeDatabase(steam_accounts=FakeCollection([dict(stale), dict(extra)]))
+    restored = asyncio.run(restore_collections(target, tmp_path, concurrency=3, insert_batch=3, drop=False))
+    assert restored == 16
+    assert len(target.steam_accounts.documents) == 18
+    assert target.steam_accounts.one(_id=5)["username"] == "renamed"
+    assert target.steam_accounts.one(_id=100) is not None
+
+    target = FakeDatabase(steam_accounts=FakeCollection([dict(stale), dict(extra)]))
+    restored = asyncio.run(restore_collections(target, tmp_path, concurrency=3, insert_batch=3, drop=True))
+    assert restored == 17
+    assert sort_documents(target.steam_accounts.documents, [("_id", 1)]) == accounts
@@ -0,0 +1,87 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, brotli
+from static_assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, FrontendApp, StaticAssetIndex
+
+BUNDLE = "console.log('steam delivery');\n" * 200
+
+
+@pytest.fixture
+def build(tmp_path):
+    (tmp_path / "static" / "js").mkdir(parents=True)
+    (tmp_path / "index.html").write_text("<!doctype html><div id=root></div>" + " " * 400)
+    (tmp_path / "static" / "js" / "main.1a2b3c4d.js").write_text(BUNDLE)
+    (tmp_path / "static" / "js" / "main.1a2b3c4d.js.map").write_text("{}")
+    (tmp_path / "favicon.ico").write_bytes(bytes(range(256)) * 8)
+    index = StaticAssetIndex(tmp_path)
+    index.load()
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(CompressionMiddleware, minimum_size=64)
+    app.mount("/", FrontendApp(index))
+    return index, TestClient(app)
+
+
+def test_bundles_are_served_precompressed_and_immutable(build):
+    index, client = build
+    assert "/static/js/main.1a2b3c4d.js.map" not in index.assets
+
+    response = client.get("/static/js/main.1a2b3c4d.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.text == BUNDLE
+    assert int(response.headers["content-length"]) == len(index.assets["/static/js/main.1a2b3c4d.js"].variants["gzip"].body)
+    assert gzip.decompress(index.assets["/static/js/main.1a2b3c4d.js"].variants["gzip"].body).decode() == BUNDLE
+
+    plain = client.get("/static/js/main.1a2b3c4d.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] != response.headers["etag"]
+
+    if brotli is not None:
+        assert client.get("/static/js/main.1a2b3c4d.js", headers={"Accept-Encoding": "gzip, br"}).headers["content-encoding"] == "br"
+
+    # Incompressible files are stored once and not re-encoded by the middleware
+    icon = client.get("/favicon.ico", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in icon.headers and "vary" not in icon.headers
+
+
+def test_etag_revalidation_spa_fallback_and_api_precedence(build):
+    _, client = build
+    shell = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert shell.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+
+    revalidated = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": shell.headers["etag"]})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+
+    assert client.get("/admin/keys").text == shell.text
+    assert client.get("/static/js/missing.js").status_code == 404
+    assert client.post("/").status_code == 405
+    assert client.get("/api/ping").json() == {"ok": True}
+
+
+@pytest.mark.parametrize("method, path", [
+    ("GET", "/api/nope"), ("GET", "/api"), ("GET", "/api/admin/accounts/abc"), ("POST", "/api/nope"),
+])
+def test_unmatched_api_paths_are_json_404s_not_the_shell(build, method, path):
+    _, client = build
+    response = client.request(method, path)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Not Found"}
+
+
+def test_wrong_method_on_an_api_route_is_not_the_shell(build):
+    _, client = build
+    response = client.post("/api/ping")
+    assert response.status_code == 405 and response.json() == {"detail": "Method Not Allowed"}
+    assert response.headers["allow"] == "GET"
+    assert client.get("/apiary").headers["content-type"].startswith("text/html")
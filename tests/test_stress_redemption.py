@@ -0,0 +1,25 @@
+from stress_redemption import check_invariants
+
+
+def result(key, success=True, username="stress-1"):
+    return {"key": key, "status": 200, "success": success, "username": username if success else None, "ms": 1.0}
+
+
+def test_clean_run_has_no_violations():
+    results = [result("A"), result("A", success=False), result("B", success=False)]
+    assert check_invariants({"A", "B"}, results, remaining_keys={"B"}, claimed_keys=0,
+                            recorded_deliveries=1, usernames={"stress-1"}) == []
+
+
+def test_double_delivery_lost_keys_and_leaked_accounts_are_reported():
+    results = [result("A"), result("A", username="stress-2"), result("B", username="ghost")]
+    violations = check_invariants({"A", "B", "C"}, results, remaining_keys={"B"}, claimed_keys=2,
+                                  recorded_deliveries=5, usernames={"stress-1", "stress-2"})
+    assert violations == [
+        "key A delivered 2 times",
+        "key B delivered but still stored",
+        "key C neither delivered nor stored",
+        "2 keys left claimed after the load drained",
+        "accounts record 5 deliveries for 3 successful redemptions",
+        "delivered unknown account ghost",
+    ]
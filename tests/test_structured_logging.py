@@ -0,0 +1,56 @@
+import io
+import json
+import logging
+
+from structured_logging import JsonFormatter, RequestIdFilter, SamplingFilter, configure_logging, request_id_var
+
+
+def _record(message="hello", **extra):
+    record = logging.LogRecord("server", logging.INFO, __file__, 1, message, None, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_json_formatter_includes_request_id_and_extras():
+    token = request_id_var.set("req-1")
+    try:
+        record = _record(event="invalid_key")
+        RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "hello"
+    assert entry["request_id"] == "req-1"
+    assert entry["event"] == "invalid_key"
+
+
+def test_sampling_filter_caps_events_per_second():
+    sampler = SamplingFilter({"invalid_key": 3})
+    passed = [sampler.filter(_record(event="invalid_key")) for _ in range(10)]
+    assert passed.count(True) == 3
+    assert all(sampler.filter(_record()) for _ in range(10))
+
+
+def test_listener_can_be_stopped_and_started_again():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    output = io.StringIO()
+    listener = configure_logging(stream=output)
+    try:
+        logging.getLogger("server").info("first")
+        listener.stop()
+        listener.stop()
+        logging.getLogger("server").info("second")
+        listener.start()
+        listener.start()
+        logging.getLogger("server").info("third")
+        listener.stop()
+    finally:
+        listener.stop()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+    assert [json.loads(line)["message"] for line in output.getvalue().splitlines()] == ["first", "second", "third"]
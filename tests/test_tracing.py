@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from resilience import CircuitBreaker, MongoGuard
+from trace_summary import breakdown, find_root, load_traces
+from tracing import (
+    CLIENT, SERVER, BatchSpanExporter, TracingMiddleware, file_sink, parse_traceparent, traced_route, tracer,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+@pytest.fixture
+def exported(tmp_path):
+    path = tmp_path / "spans.jsonl"
+
+    def configure(sample_ratio=1.0, slow_threshold_ms=None):
+        tracer.configure(BatchSpanExporter(file_sink(str(path)), schedule_delay=0.05), sample_ratio, slow_threshold_ms)
+
+    def read():
+        tracer.shutdown()
+        return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+    yield configure, read, path
+    tracer.shutdown()
+    tracer.exporter = None
+
+
+def make_app():
+    guard = MongoGuard(CircuitBreaker("test"), read_timeout_ms=1000, write_timeout_ms=1000)
+    router = APIRouter(route_class=traced_route())
+
+    async def lookup(item_id):
+        await asyncio.sleep(0.001)
+        return {"id": item_id}
+
+    @router.get("/items/{item_id}")
+    async def read_item(item_id: str, slow: float = 0):
+        await asyncio.sleep(slow)
+        return await guard.run("items.find_one", guard.read_timeout_ms, lookup, item_id)
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(TracingMiddleware)
+    return app
+
+
+def test_request_is_traced_as_route_handler_database_and_serialization_spans(exported):
+    configure, read, _ = exported
+    configure()
+    with TestClient(make_app()) as client:
+        response = client.get("/items/42", headers={"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"})
+    assert response.json() == {"id": "42"}
+
+    spans = {span["name"]: span for span in read()}
+    assert set(spans) == {"GET /items/{item_id}", "handler read_item", "find_one items", "serialize response"}
+    root = spans["GET /items/{item_id}"]
+    assert root["kind"] == SERVER and root["parent_span_id"] == "00f067aa0ba902b7"
+    assert root["attributes"]["http.route"] == "/items/{item_id}"
+    assert root["attributes"]["http.response.status_code"] == 200
+    assert all(span["trace_id"] == TRACE_ID for span in spans.values())
+    database = spans["find_one items"]
+    assert database["kind"] == CLIENT
+    assert database["attributes"]["db.system"] == "mongodb"
+    assert database["parent_span_id"] == spans["handler read_item"]["span_id"]
+    assert spans["serialize response"]["parent_span_id"] == root["span_id"]
+
+
+def test_unsampled_traces_are_kept_only_when_slow(exported):
+    configure, read, path = exported
+    configure(sample_ratio=0.0, slow_threshold_ms=50)
+    with TestClient(make_app()) as client:
+        client.get("/items/fast")
+        client.get("/items/slow", params={"slow": 0.08})
+    spans = read()
+    assert {span["attributes"].get("url.path") for span in spans if span["kind"] == SERVER} == {"/items/slow"}
+
+    traces = load_traces(path)
+    assert len(traces) == 1
+    rows = {name: share for name, _, _, share in breakdown(list(traces.values()))}
+    assert rows["handler read_item"] > 90
+    assert find_root(next(iter(traces.values())))["name"] == "GET /items/{item_id}"
+
+
+@pytest.mark.parametrize("header", [
+    f"00-{TRACE_ID}-00f067aa0ba902b7-zz",
+    f"00-{TRACE_ID}-00f067aa0ba902b7-001",
+    f"00-{TRACE_ID}-00f067aa0ba902b7",
+    f"00-{TRACE_ID}-0000000000000000-01",
+    f"00-{'0' * 32}-00f067aa0ba902b7-01",
+    f"zz-{TRACE_ID}-00f067aa0ba902b7-01",
+    "garbage",
+    None,
+])
+def test_malformed_traceparent_is_ignored(header):
+    assert parse_traceparent(header) is None
+
+
+def test_malformed_traceparent_starts_a_fresh_trace(exported):
+    configure, read, _ = exported
+    configure()
+    with TestClient(make_app()) as client:
+        response = client.get("/items/1", headers={"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-zz"})
+    assert response.status_code == 200
+    root = next(span for span in read() if span["kind"] == SERVER)
+    assert root["trace_id"] != TRACE_ID and root["parent_span_id"] is None
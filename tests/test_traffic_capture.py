@@ -0,0 +1,87 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from replay_traffic import build_request, summarize, valid_redemptions
+from traffic_capture import CaptureWriter, TrafficCaptureMiddleware, tag_request
+
+
+def test_capture_records_shape_without_payloads(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    writer = CaptureWriter(str(path))
+    app = FastAPI()
+    app.add_middleware(TrafficCaptureMiddleware, writer=writer)
+
+    @app.post("/api/redeem-key")
+    async def redeem(body: dict):
+        tag_request(key_valid=False, outcome="invalid")
+        return {"success": False}
+
+    TestClient(app).post("/api/redeem-key", json={"key": "SECRET-KEY-VALUE"})
+    writer.close()
+
+    content = path.read_text()
+    assert "SECRET-KEY-VALUE" not in content
+    record = json.loads(content)
+    assert record["r"] == "/api/redeem-key"
+    assert record["s"] == 200
+    assert record["qb"] > len("SECRET-KEY-VALUE")
+    assert record["tags"] == {"key_valid": False, "outcome": "invalid"}
+
+
+def test_valid_redemptions_replay_with_seeded_keys():
+    record = {"r": "/api/redeem-key", "m": "POST", "qb": 20, "tags": {"key_valid": True}}
+    request = build_request(record, "http://localhost:8001", {}, ["SEEDED"])
+    assert request["json"] == {"key": "SEEDED"}
+    invalid = build_request({**record, "tags": {"key_valid": False}}, "http://localhost:8001", {}, ["SEEDED"])
+    assert invalid["json"]["key"].startswith("REPLAY-INVALID-")
+
+
+def test_workers_appending_to_one_capture_never_interleave_lines(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    # One writer per uvicorn worker, all appending to the same file
+    writers = [CaptureWriter(str(path)) for _ in range(4)]
+    for i in range(2000):
+        writers[i % 4].write({"t": i, "m": "POST", "r": "/api/redeem-key", "tags": {"pad": "x" * (i % 300)}})
+    for writer in writers:
+        writer.close()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert sorted(record["t"] for record in records) == list(range(2000))
+
+
+def test_short_writes_are_continued_until_the_whole_batch_is_out(tmp_path, monkeypatch):
+    import traffic_capture
+
+    real_write = traffic_capture.os.write
+    monkeypatch.setattr(traffic_capture.os, "write", lambda fd, data: real_write(fd, bytes(data[:7])))
+    path = tmp_path / "capture.jsonl"
+    writer = CaptureWriter(str(path))
+    for i in range(50):
+        writer.write({"t": i, "r": "/api/redeem-key"})
+    writer.close()
+
+    assert [json.loads(line)["t"] for line in path.read_text().splitlines()] == list(range(50))
+
+
+def test_batch_redemptions_replay_with_their_size_mode_and_deliveries():
+    record = {"r": "/api/redeem-keys", "m": "POST", "qb": 200,
+              "tags": {"batch_size": 4, "delivered": 2, "mode": "all_or_nothing"}}
+    valid_keys = ["S1", "S2", "S3"]
+    request = build_request(record, "http://localhost:8001", {}, valid_keys)
+    assert request["url"] == "http://localhost:8001/api/redeem-keys"
+    assert request["json"]["mode"] == "all_or_nothing"
+    keys = request["json"]["keys"]
+    assert len(keys) == 4 and sum(key.startswith("REPLAY-INVALID-") for key in keys) == 2
+    assert valid_keys == ["S1"] and {"S2", "S3"} <= set(keys)
+    assert valid_redemptions(record) == 2
+
+
+def test_summarize_percentiles_and_errors():
+    results = [{"r": "/api/redeem-key", "m": "POST", "s": 200, "ms": float(ms)} for ms in range(1, 101)]
+    results.append({"r": "/api/redeem-key", "m": "POST", "s": 503, "ms": 1.0})
+    summary = summarize(results)["POST /api/redeem-key"]
+    assert summary["count"] == 101
+    assert summary["errors"] == 1
+    assert summary["p99"] == 99.0
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import pytest
+
+from warmup import WarmUp
+
+
+def test_phases_run_concurrently_and_gate_readiness():
+    async def scenario():
+        async def slow():
+            await asyncio.sleep(0.1)
+
+        warmup = WarmUp({"a": slow, "b": slow, "c": slow})
+        with pytest.raises(RuntimeError, match="in progress"):
+            await warmup.check()
+        started = time.monotonic()
+        await warmup.run()
+        await warmup.check()
+        return time.monotonic() - started, warmup.timings
+
+    elapsed, timings = asyncio.run(scenario())
+    assert elapsed < 0.25
+    assert set(timings) == {"a", "b", "c"}
+
+
+def test_failed_phase_is_retried_alone_and_reported():
+    async def scenario():
+        calls = {"flaky": 0, "steady": 0}
+
+        async def flaky():
+            calls["flaky"] += 1
+            if calls["flaky"] < 3:
+                raise ConnectionError("mongo down")
+
+        async def steady():
+            calls["steady"] += 1
+
+        warmup = WarmUp({"flaky": flaky, "steady": steady}, retry_interval=0.02)
+        task = asyncio.create_task(warmup.run())
+        await asyncio.sleep(0.01)
+        with pytest.raises(RuntimeError, match="flaky: mongo down"):
+            await warmup.check()
+        await task
+        await warmup.check()
+        return calls, warmup.errors
+
+    calls, errors = asyncio.run(scenario())
+    assert calls == {"flaky": 3, "steady": 1}
+    assert errors == {}